@@ -0,0 +1,384 @@
+"""爬虫工作节点（agent）
+
+在其他主机上运行，定时向爬虫管理系统发送心跳，领取分配给本节点的运行并在本机启动爬虫，
+日志和运行结果通过HTTP回传到管理系统，记录在原有的运行记录和日志文件中。
+只依赖标准库和同目录下的process_control.py、run_progress.py、log_capture.py，节点上的爬虫目录和sdk目录应与管理系统保持一致。
+
+用法: python agent.py --manager http://127.0.0.1:5000 --name node1 --capacity 4
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from process_control import PROCESS_GROUPS_SUPPORTED, prepare_limits, limits_preexec_fn, kill_process_group, terminate_process_group
+from run_progress import parse_progress_line
+from log_capture import HeadTailLimiter
+
+# 日志攒够多少行或多少秒后回传一次
+LOG_BATCH_LINES = 200
+LOG_FLUSH_SECONDS = 0.5
+# 管理系统拒绝回传时最多保留多少字节未确认的日志，超过后丢弃
+MAX_UNACKED_BYTES = 16 * 1024 * 1024
+# 回传失败后的重试间隔(秒)，逐次加倍
+RETRY_INITIAL = 1.0
+RETRY_MAX = 30.0
+# 超时或取消时从SIGTERM到强制结束的等待时间(秒)
+TERMINATE_GRACE_SECONDS = 10
+# 爬虫SDK所在目录，启动爬虫时加入其模块搜索路径
+SDK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sdk')
+
+
+def _call_later(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class ManagerClient:
+    """向管理系统发送请求"""
+
+    def __init__(self, base_url, token=None, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        """发送JSON请求并返回响应的JSON
+
+        Raises:
+            urllib.error.HTTPError: 管理系统返回错误状态码
+            OSError: 网络错误
+        """
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        if self.token:
+            request.add_header('X-Agent-Token', self.token)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+
+class AgentRun:
+    """节点上的一次运行：启动爬虫进程，回传日志和结果"""
+
+    def __init__(self, agent, assignment):
+        self.agent = agent
+        self.run_id = assignment['run_id']
+        self.crawler_id = assignment['crawler_id']
+        self.env = assignment.get('env') or {}
+        self.timeout = assignment.get('timeout')
+        self.limits = assignment.get('limits') or {}
+        self.log_max_bytes = assignment.get('log_max_bytes')  # 日志大小上限，超过时只回传开头和结尾
+        self.process = None
+        self.stop_reason = None  # 主动结束进程的原因：'timeout'或'cancelled'
+        self._kill_timer = None  # 结束进程时宽限期后的强制结束，进程退出时取消
+        self._exited = False  # 爬虫进程已退出，之后不再向其进程组发送信号
+        self.finished = threading.Event()
+        self._lines = queue.Queue()
+        self._stop_lock = threading.Lock()
+        # 已发送但管理系统尚未确认写入的日志行，以及已确认部分的字节偏移和行数
+        self._unacked = []
+        self._acked_offset = 0
+        self._acked_line_no = 0
+
+    def start(self):
+        crawler_path = os.path.join(self.agent.crawlers_dir, self.crawler_id)
+        env = os.environ.copy()
+        env.update(self.env)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [SDK_DIR, env.get('PYTHONPATH')]))
+        # 资源限制由爬虫进程在exec之前设置，之后创建的子进程都会继承
+        rlimits, failed = prepare_limits(self.limits)
+        if failed:
+            logging.warning(f"爬虫资源限制未生效: {self.crawler_id}, {', '.join(failed)}")
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.join(crawler_path, 'main.py')],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=crawler_path,
+                env=env,
+                start_new_session=PROCESS_GROUPS_SUPPORTED,
+                preexec_fn=limits_preexec_fn(rlimits)
+            )
+        except Exception as e:
+            self._lines.put(f"系统错误: 工作节点{self.agent.name}启动爬虫失败: {str(e)}\n")
+            self._lines.put(None)
+            threading.Thread(target=self._send, daemon=True).start()
+            return
+
+        if self.timeout:
+            _call_later(self.timeout, lambda: self.stop('timeout'))
+
+        readers = [
+            threading.Thread(target=self._read, args=(stream,), daemon=True)
+            for stream in (self.process.stdout, self.process.stderr)
+        ]
+        for reader in readers:
+            reader.start()
+        threading.Thread(target=self._wait, args=(readers,), daemon=True).start()
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def stop(self, reason):
+        """结束爬虫进程组"""
+        with self._stop_lock:
+            if self.stop_reason is not None or self.process is None or self._exited or self.finished.is_set():
+                return
+            self.stop_reason = reason
+            logging.info(f"结束运行: {self.run_id}, 原因: {reason}")
+            self._kill_timer = terminate_process_group(self.process, TERMINATE_GRACE_SECONDS, _call_later)
+
+    def _read(self, stream):
+        for line in iter(stream.readline, b''):
+            # 进度标记不写入日志，随下一批日志回传
+            counters = parse_progress_line(line)
+            self._lines.put(counters if counters is not None else line.decode('utf-8', errors='replace'))
+        stream.close()
+
+    def _wait(self, readers):
+        self.process.wait()
+        with self._stop_lock:
+            self._exited = True
+            # 爬虫进程已退出，取消宽限期后的强制结束（进程组全部退出后组号可能被复用），立即结束遗留的孙进程
+            if self._kill_timer is not None:
+                self._kill_timer.cancel()
+                self._kill_timer = None
+                kill_process_group(self.process)
+        # 孙进程可能仍持有管道，最多再等待一会儿
+        for reader in readers:
+            reader.join(timeout=1.0)
+        self._lines.put(None)
+
+    def _send(self):
+        """按批回传日志和进度计数，进程退出且日志读完后上报结果"""
+        done = False
+        limiter = HeadTailLimiter(self.log_max_bytes) if self.log_max_bytes else None
+        while not done:
+            batch = []
+            progress = None
+            deadline = time.monotonic() + LOG_FLUSH_SECONDS
+            while len(batch) < LOG_BATCH_LINES:
+                try:
+                    line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if line is None:
+                    done = True
+                    break
+                if isinstance(line, dict):
+                    # 计数为累计值，只需回传最后一次
+                    progress = line
+                    continue
+                batch.append(line)
+            if batch and limiter is not None:
+                batch = self._limit(limiter, batch)
+            if batch or progress:
+                self._post_log(batch, progress)
+
+        if limiter is not None:
+            # 日志超过上限时，最后回传省略说明和保留的结尾部分
+            tail = limiter.finish()
+            if tail:
+                self._post_log(tail.decode('utf-8').splitlines(keepends=True))
+
+        self.agent.retry(f'/agents/runs/{self.run_id}/exit', {
+            'agent_id': self.agent.agent_id,
+            'returncode': self.process.returncode if self.process is not None else 1,
+            'reason': self.stop_reason
+        })
+        self.finished.set()
+        self.agent.forget(self.run_id)
+
+    @staticmethod
+    def _limit(limiter, batch):
+        """按日志大小上限过滤一批日志行，返回应立即回传的行"""
+        data = ''.join(batch).encode('utf-8')
+        kept = limiter.accept(data)
+        if len(kept) == len(data):
+            return batch
+        return kept.decode('utf-8').splitlines(keepends=True)
+
+    def _post_log(self, batch, progress=None):
+        """回传一批日志
+
+        日志行在管理系统确认写入前一直保留，每次从已确认的偏移开始连同新的一批一起发送。
+        管理系统返回的偏移比发送的短时（之前的日志未写入），从其返回的偏移重发，日志文件中不会留下空洞。
+        """
+        self._unacked.extend(batch)
+        while True:
+            payload = {
+                'agent_id': self.agent.agent_id,
+                'offset': self._acked_offset,
+                'line_no': self._acked_line_no,
+                'lines': self._unacked
+            }
+            if progress:
+                payload['progress'] = progress
+            response = self.agent.retry(f'/agents/runs/{self.run_id}/log', payload)
+            if response is None:
+                # 被拒绝的日志随下一批重发，持续被拒绝时不再无限保留
+                size = sum(len(line.encode('utf-8')) for line in self._unacked)
+                if size > MAX_UNACKED_BYTES:
+                    logging.error(f"日志回传持续被拒绝，丢弃{len(self._unacked)}行: {self.run_id}")
+                    self._acked_offset += size
+                    self._acked_line_no += len(self._unacked)
+                    self._unacked = []
+                return
+            self._ack(response['offset'])
+            if not self._unacked:
+                return
+            # 进度计数已经送达，重发时只需要日志
+            progress = None
+
+    def _ack(self, offset):
+        """管理系统的日志文件已写到offset，去掉此前已确认的日志行"""
+        if offset < self._acked_offset:
+            # 管理系统上已确认的日志丢失（如日志文件被删除），之后的日志从其当前大小继续写
+            logging.warning(f"管理系统的日志比已确认的短，从偏移{offset}继续回传: {self.run_id}")
+            self._acked_offset = offset
+            return
+        confirmed = 0
+        for line in self._unacked:
+            size = len(line.encode('utf-8'))
+            if self._acked_offset + size > offset:
+                break
+            self._acked_offset += size
+            confirmed += 1
+        del self._unacked[:confirmed]
+        self._acked_line_no += confirmed
+        if not self._unacked:
+            self._acked_offset = max(self._acked_offset, offset)
+
+
+class Agent:
+    """工作节点主循环"""
+
+    def __init__(self, client, name, capacity, crawlers_dir):
+        self.client = client
+        self.name = name
+        self.capacity = capacity
+        self.crawlers_dir = crawlers_dir
+        self.agent_id = f"{name}:{uuid.uuid4().hex[:8]}"
+        self.interval = 1
+        self.runs = {}
+        self._runs_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def crawlers(self):
+        """本节点上可以运行的爬虫"""
+        if not os.path.isdir(self.crawlers_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.crawlers_dir)
+            if os.path.exists(os.path.join(self.crawlers_dir, name, 'main.py'))
+            and os.path.exists(os.path.join(self.crawlers_dir, name, 'config.json'))
+        )
+
+    def run(self):
+        logging.info(f"工作节点已启动: {self.agent_id}, 管理系统: {self.client.base_url}")
+        while not self._stopping.is_set():
+            try:
+                self.heartbeat()
+            except (OSError, ValueError) as e:
+                logging.error(f"心跳失败: {str(e)}")
+            self._stopping.wait(self.interval)
+
+    def heartbeat(self):
+        response = self.client.post('/agents/heartbeat', {
+            'agent_id': self.agent_id,
+            'name': self.name,
+            'host': socket.gethostname(),
+            'capacity': self.capacity,
+            'crawlers': self.crawlers(),
+            'load': os.getloadavg()[0] if hasattr(os, 'getloadavg') else None
+        })
+        self.interval = response.get('interval', self.interval)
+        for assignment in response.get('assignments', []):
+            run = AgentRun(self, assignment)
+            with self._runs_lock:
+                self.runs[run.run_id] = run
+            logging.info(f"开始运行: {run.run_id}, 爬虫: {run.crawler_id}")
+            run.start()
+        for run_id in response.get('cancel', []):
+            with self._runs_lock:
+                run = self.runs.get(run_id)
+            if run is not None:
+                run.stop('cancelled')
+
+    def retry(self, path, payload):
+        """发送请求直到成功，管理系统返回4xx时放弃
+
+        Returns:
+            dict: 响应，放弃时返回None
+        """
+        delay = RETRY_INITIAL
+        while True:
+            try:
+                return self.client.post(path, payload)
+            except urllib.error.HTTPError as e:
+                if 400 <= e.code < 500:
+                    logging.error(f"请求被拒绝: {path}, 状态码: {e.code}")
+                    return None
+                logging.error(f"请求失败: {path}, 状态码: {e.code}")
+            except (OSError, ValueError) as e:
+                logging.error(f"请求失败: {path}, 错误: {str(e)}")
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX)
+
+    def stop(self):
+        """停止主循环（可以在信号处理函数中调用）"""
+        self._stopping.set()
+
+    def forget(self, run_id):
+        with self._runs_lock:
+            self.runs.pop(run_id, None)
+
+    def shutdown(self, wait_seconds=TERMINATE_GRACE_SECONDS + 5):
+        """停止领取新运行，结束正在运行的爬虫并等待结果上报"""
+        self._stopping.set()
+        with self._runs_lock:
+            runs = list(self.runs.values())
+        for run in runs:
+            run.stop('cancelled')
+        deadline = time.monotonic() + wait_seconds
+        for run in runs:
+            run.finished.wait(max(0.0, deadline - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='爬虫工作节点')
+    parser.add_argument('--manager', required=True, help='管理系统地址，如 http://127.0.0.1:5000')
+    parser.add_argument('--name', default=socket.gethostname(), help='节点名称，默认为主机名')
+    parser.add_argument('--capacity', type=int, default=os.cpu_count() or 1, help='可同时运行的爬虫数，默认为CPU核数')
+    parser.add_argument('--crawlers-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawlers'),
+                        help='爬虫目录')
+    parser.add_argument('--token', default=os.environ.get('CRAWLER_AGENT_TOKEN'), help='管理系统配置的AGENT_TOKEN')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    agent = Agent(ManagerClient(args.manager, args.token), args.name, args.capacity, args.crawlers_dir)
+    signal.signal(signal.SIGTERM, lambda signum, frame: agent.stop())
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        pass
+    logging.info("正在停止工作节点...")
+    agent.shutdown()
+
+
+if __name__ == '__main__':
+    main()
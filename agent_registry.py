@@ -0,0 +1,81 @@
+import threading
+import time
+from database.models import get_live_agents
+
+
+class AgentRegistry:
+    """工作节点（agent）的容量和负载
+
+    节点通过心跳把容量和可运行的爬虫写入数据库，这里缓存仍在心跳的节点，
+    按"正在运行数/容量"选择负载最低的节点。缓存每隔refresh_interval秒从数据库刷新，
+    两次刷新之间本进程分配的运行直接计入缓存中的运行数。
+    """
+
+    def __init__(self, app, lease=15, refresh_interval=1.0):
+        """
+        Args:
+            app: Flask应用实例
+            lease: 超过该时间(秒)没有心跳的节点视为离线
+            refresh_interval: 从数据库刷新节点信息的间隔(秒)
+        """
+        self.app = app
+        self.lease = lease
+        self.refresh_interval = refresh_interval
+        self._agents = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def has_capacity(self, crawler_id):
+        """是否有可以运行该爬虫且未满载的节点"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._least_loaded(crawler_id) is not None
+
+    def reserve(self, crawler_id):
+        """选择负载最低的节点运行该爬虫，并计入其运行数
+
+        Returns:
+            str: 节点ID，没有可用的节点时返回None（在本机运行）
+        """
+        with self._lock:
+            self._ensure_fresh()
+            agent = self._least_loaded(crawler_id)
+            if agent is None:
+                return None
+            agent['running'] += 1
+            return agent['id']
+
+    def release(self, agent_id):
+        """运行结束后从缓存的运行数中减去"""
+        with self._lock:
+            agent = self._agents.get(agent_id)
+            if agent is not None and agent['running'] > 0:
+                agent['running'] -= 1
+
+    def all(self):
+        """返回所有在线节点"""
+        with self._lock:
+            self._ensure_fresh()
+            return [dict(agent) for agent in self._agents.values()]
+
+    def invalidate(self):
+        """下次访问时重新从数据库读取"""
+        with self._lock:
+            self._refreshed_at = 0.0
+
+    def _least_loaded(self, crawler_id):
+        candidates = [
+            agent for agent in self._agents.values()
+            if crawler_id in agent['crawlers'] and agent['running'] < agent['capacity']
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda agent: (agent['running'] / agent['capacity'], agent['load'] or 0))
+
+    def _ensure_fresh(self):
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        with self.app.app_context():
+            agents = get_live_agents(self.lease)
+        self._agents = {agent['id']: agent for agent in agents if agent['capacity'] > 0}
+        self._refreshed_at = time.monotonic()
@@ -1,17 +1,56 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
 import os
 import sqlite3
 import json
 import datetime
 import time
 import threading
-import logging
-import importlib.util
-from database.models import init_db, get_db, close_db, add_crawler_run, update_crawler_status, get_crawler_runs, get_active_crawlers, get_crawler_by_id
+from database.models import init_db, get_db, close_db, add_crawler_run, update_crawler_status, query_crawler_runs, get_active_crawlers, get_crawler_by_id, get_run_samples, search_log_lines, log_search_available, RESOURCE_COLUMNS
 from crawler_manager import CrawlerManager
+from crawler_web import CrawlerWebDispatcher
+from log_reader import read_log_chunk, read_log_tail, read_log_text, DEFAULT_CHUNK_SIZE
+from run_events import StatusSnapshot
+import metrics
+from run_parameters import parameter_specs
 
 app = Flask(__name__, template_folder='web/templates', static_folder='web/static')
 app.config['DATABASE'] = os.path.join(app.instance_path, 'crawler.sqlite')
+# 爬虫目录和运行日志目录
+app.config['CRAWLERS_DIR'] = os.path.join(app.root_path, 'crawlers')
+app.config['LOGS_DIR'] = os.path.join(app.root_path, 'logs')
+# 同时运行的爬虫进程数上限，超出的运行进入排队状态
+app.config['MAX_CONCURRENT_RUNS'] = (os.cpu_count() or 2) * 2
+# 定时任务上一次运行未结束时的处理策略：skip跳过，queue排队，coalesce合并为一次排队
+app.config['SCHEDULE_OVERLAP_POLICY'] = 'coalesce'
+# 运行结束多少分钟后压缩日志，以及检查的间隔(分钟)
+app.config['LOG_COMPRESS_AFTER_MINUTES'] = 10
+app.config['LOG_COMPRESS_INTERVAL_MINUTES'] = 10
+# 单次运行日志的大小上限(MB)，超过时只保留开头和结尾各一半，0表示不限制；可以在config.json的limits.log_max_mb中按爬虫设置
+app.config['LOG_MAX_MB'] = 100
+# 是否在采集日志时建立全文索引
+app.config['LOG_SEARCH_ENABLED'] = True
+# 运行资源占用的采样间隔(秒)
+app.config['RESOURCE_SAMPLE_INTERVAL'] = 5
+# 多进程部署时只有一个进程执行定时任务：心跳间隔和调度租约有效期(秒)
+app.config['SCHEDULER_HEARTBEAT_SECONDS'] = 5
+app.config['SCHEDULER_LEASE_SECONDS'] = 15
+# 定时任务错过执行时间后仍然补执行的宽限时间(秒)，以及错过多次时是否只补执行一次
+app.config['SCHEDULER_MISFIRE_GRACE_SECONDS'] = 300
+app.config['SCHEDULER_COALESCE'] = True
+# 定时任务默认的最大随机抖动(秒)，每次触发随机推迟，避免大量任务在同一时刻启动
+app.config['SCHEDULE_JITTER_SECONDS'] = 0
+# 爬虫运行的默认超时时间(秒)，可以在config.json的limits.timeout_seconds中按爬虫设置
+app.config['RUN_TIMEOUT_SECONDS'] = 3600
+# 超时或取消时先发送SIGTERM，等待多少秒后强制结束进程组
+app.config['RUN_TERMINATE_GRACE_SECONDS'] = 10
+# 工作节点：接口令牌（为空时不校验）、节点离线判定时间和建议的心跳间隔(秒)
+app.config['AGENT_TOKEN'] = None
+app.config['AGENT_LEASE_SECONDS'] = 15
+app.config['AGENT_POLL_SECONDS'] = 1
+# 活动运行列表的缓存时间(秒)：/crawlers/status和/events共用一份查询结果，有运行事件时立即失效
+app.config['STATUS_CACHE_SECONDS'] = 2
+# 允许通过FLASK_前缀的环境变量覆盖配置，如 FLASK_MAX_CONCURRENT_RUNS=4
+app.config.from_prefixed_env()
 
 # 确保实例文件夹存在
 try:
@@ -19,6 +58,9 @@ try:
 except OSError:
     pass
 
+# 应用上下文结束时归还数据库连接
+app.teardown_appcontext(close_db)
+
 # 初始化数据库
 with app.app_context():
     init_db()
@@ -26,6 +68,21 @@ with app.app_context():
 # 初始化爬虫管理器
 crawler_manager = CrawlerManager(app)
 
+def load_active_crawlers():
+    """查询活动中的爬虫（供状态快照在任意线程中调用）"""
+    with app.app_context():
+        return get_active_crawlers()
+
+# 活动爬虫列表的共享快照，查询次数与打开的页面数无关；用app.json序列化，时间格式与jsonify相同
+status_snapshot = StatusSnapshot(crawler_manager.events, load_active_crawlers,
+                                 max_age=app.config['STATUS_CACHE_SECONDS'], dumps=app.json.dumps)
+
+def format_time(value):
+    """将数据库中的时间格式化为字符串"""
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
 # 路由：首页
 @app.route('/')
 def index():
@@ -34,19 +91,19 @@ def index():
 # 路由：爬虫列表
 @app.route('/crawlers')
 def list_crawlers():
-    # 获取爬虫列表，并添加web_support信息
-    crawlers = []
-    for crawler in crawler_manager.get_all_crawlers():
-        crawler_info = crawler_manager.get_crawler_by_id(crawler['id'])
-        if crawler_info:
-            crawlers.append(crawler_info)
+    # 获取爬虫列表（包含web_support信息）
+    crawlers = crawler_manager.get_all_crawlers()
     
     active_crawlers = get_active_crawlers()
     active_ids = [c['id'] for c in active_crawlers]
     
+    # 运行表单中的参数输入项
+    specs = {crawler['id']: parameter_specs(crawler['parameters']) for crawler in crawlers}
+    
     return render_template('crawlers.html', 
                            crawlers=crawlers, 
-                           active_ids=active_ids)
+                           active_ids=active_ids,
+                           parameter_specs=specs)
 
 # 路由：启动爬虫
 @app.route('/crawlers/run/<crawler_id>', methods=['POST'])
@@ -55,16 +112,128 @@ def run_crawler(crawler_id):
     if not crawler:
         return jsonify({'status': 'error', 'message': '爬虫不存在'}), 404
     
+    # 运行参数和分片数可以通过JSON或表单提交，表单中的params为JSON字符串
+    data = request.get_json(silent=True) or request.form
+    params = data.get('params')
+    if isinstance(params, str):
+        try:
+            params = json.loads(params) if params.strip() else None
+        except ValueError:
+            return jsonify({'status': 'error', 'message': '运行参数不是有效的JSON'}), 400
+    if params is not None and not isinstance(params, dict):
+        return jsonify({'status': 'error', 'message': '运行参数应为JSON对象'}), 400
+    shards = data.get('shards') or None
+    
     # 启动爬虫（手动运行）
-    run_id = crawler_manager.run_crawler(crawler_id, run_type='manual')
+    try:
+        run_id = crawler_manager.run_crawler(crawler_id, run_type='manual', params=params, shards=shards)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     return jsonify({'status': 'success', 'run_id': run_id})
 
-# 路由：获取爬虫状态
+# 路由：取消运行（运行中或排队中）
+@app.route('/crawlers/cancel/<run_id>', methods=['POST'])
+def cancel_run(run_id):
+    if not crawler_manager.cancel_run(run_id):
+        return jsonify({'status': 'error', 'message': '运行不存在或已结束'}), 404
+    return jsonify({'status': 'success'})
+
+# 路由：获取爬虫状态，支持If-None-Match，未变化时返回304
 @app.route('/crawlers/status')
 def get_crawlers_status():
-    active_crawlers = get_active_crawlers()
-    return jsonify(active_crawlers)
+    etag, body = status_snapshot.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# 路由：运行状态事件（SSE），连接后先推送活动爬虫列表，之后推送运行的排队、开始和结束事件及列表的变化
+@app.route('/events')
+def run_events():
+    # 断线重连时浏览器会带上最后收到的事件序号
+    last_seq = request.headers.get('Last-Event-ID', type=int)
+    return Response(crawler_manager.events.subscribe(status_snapshot, last_seq, interval=app.config['STATUS_CACHE_SECONDS']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def check_agent_token():
+    """校验工作节点请求中的令牌，失败时返回错误响应"""
+    token = app.config.get('AGENT_TOKEN')
+    if token and request.headers.get('X-Agent-Token') != token:
+        return jsonify({'status': 'error', 'message': '节点令牌无效'}), 403
+    return None
+
+# 路由：工作节点列表
+@app.route('/agents')
+def list_agents():
+    error = check_agent_token()
+    if error:
+        return error
+    return jsonify(crawler_manager.agents.all())
+
+# 路由：工作节点心跳，返回分配给该节点的运行
+@app.route('/agents/heartbeat', methods=['POST'])
+def agent_heartbeat():
+    error = check_agent_token()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    if not data.get('agent_id') or not isinstance(data.get('crawlers'), list):
+        return jsonify({'status': 'error', 'message': '缺少节点ID或爬虫列表'}), 400
+    try:
+        capacity = int(data.get('capacity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': '节点容量无效'}), 400
+    
+    assignments, cancelled = crawler_manager.agent_heartbeat(
+        data['agent_id'], data.get('name') or data['agent_id'], data.get('host'),
+        capacity, data['crawlers'], data.get('load')
+    )
+    return jsonify({
+        'status': 'success',
+        'assignments': assignments,
+        'cancel': cancelled,
+        'interval': app.config.get('AGENT_POLL_SECONDS', 1)
+    })
+
+# 路由：工作节点回传运行日志
+@app.route('/agents/runs/<run_id>/log', methods=['POST'])
+def agent_run_log(run_id):
+    error = check_agent_token()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    lines = data.get('lines')
+    if not isinstance(lines, list) or not isinstance(data.get('offset'), int):
+        return jsonify({'status': 'error', 'message': '日志格式无效'}), 400
+    
+    progress = data.get('progress')
+    if progress is not None and not isinstance(progress, dict):
+        return jsonify({'status': 'error', 'message': '进度格式无效'}), 400
+    
+    offset = crawler_manager.append_agent_log(run_id, data.get('agent_id'), data['offset'], data.get('line_no', 0),
+                                              lines, progress)
+    if offset is None:
+        return jsonify({'status': 'error', 'message': '运行不存在或不属于该节点'}), 404
+    return jsonify({'status': 'success', 'offset': offset})
+
+# 路由：工作节点上报运行结果
+@app.route('/agents/runs/<run_id>/exit', methods=['POST'])
+def agent_run_exit(run_id):
+    error = check_agent_token()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    if not crawler_manager.finish_agent_run(run_id, data.get('agent_id'), data.get('returncode'), data.get('reason')):
+        return jsonify({'status': 'error', 'message': '运行不存在或不属于该节点'}), 404
+    return jsonify({'status': 'success'})
+
+# 路由：Prometheus格式的运行指标
+@app.route('/metrics')
+def export_metrics():
+    # 指标在运行过程中更新，导出时只读取内存中的数值
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # 路由：查看爬虫日志
 @app.route('/logs/<run_id>')
@@ -77,13 +246,15 @@ def view_log(run_id):
     if not os.path.exists(log_path):
         return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
     
-    with open(log_path, 'r', encoding='utf-8') as f:
-        log_content = f.read()
+    # 只渲染日志末尾部分，后续内容由前端按偏移增量加载
+    log_tail = read_log_tail(log_path)
     
     return render_template('log_viewer.html', 
                            crawler_name=crawler_run['crawler_name'],
                            start_time=crawler_run['start_time'],
-                           log_content=log_content)
+                           log_content=log_tail['content'],
+                           log_offset=log_tail['next_offset'],
+                           log_truncated=log_tail['truncated'])
 
 # 路由：获取日志内容（用于动态加载）
 @app.route('/logs/content/<run_id>')
@@ -96,22 +267,122 @@ def get_log_content(run_id):
     if not os.path.exists(log_path):
         return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
     
-    with open(log_path, 'r', encoding='utf-8') as f:
-        log_content = f.read()
+    log_content = read_log_text(log_path)
     
     return jsonify({'content': log_content})
 
+# 路由：按字节偏移增量读取日志
+@app.route('/logs/tail/<run_id>')
+def tail_log_content(run_id):
+    crawler_run = get_crawler_by_id(run_id)
+    if not crawler_run:
+        return jsonify({'status': 'error', 'message': '运行记录不存在'}), 404
+    
+    log_path = crawler_run['log_path']
+    if not os.path.exists(log_path):
+        return jsonify({'status': 'error', 'message': '日志文件不存在'}), 404
+    
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_CHUNK_SIZE, type=int)
+    
+    return jsonify(read_log_chunk(log_path, offset, limit))
+
+# 路由：通过SSE实时推送运行日志
+@app.route('/logs/stream/<run_id>')
+def stream_log(run_id):
+    crawler_run = get_crawler_by_id(run_id)
+    if not crawler_run:
+        return jsonify({'status': 'error', 'message': '运行记录不存在'}), 404
+    
+    # 断线重连时浏览器会带上最后收到的事件ID（即日志偏移）
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', 0, type=int)
+    
+    return Response(crawler_manager.log_broadcaster.subscribe(run_id, offset),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 路由：运行的资源占用采样
+@app.route('/logs/samples/<run_id>')
+def run_samples(run_id):
+    crawler_run = get_crawler_by_id(run_id)
+    if not crawler_run:
+        return jsonify({'status': 'error', 'message': '运行记录不存在'}), 404
+    
+    samples = get_run_samples(run_id)
+    summary = {column: crawler_run[column] for column in RESOURCE_COLUMNS}
+    # 运行中的记录还没有汇总，根据已有的采样计算
+    if summary['cpu_seconds'] is None and samples:
+        summary = {
+            'cpu_seconds': samples[-1]['cpu_seconds'],
+            'peak_rss': max(sample['rss'] for sample in samples),
+            'avg_rss': sum(sample['rss'] for sample in samples) // len(samples),
+            'io_read_bytes': samples[-1]['read_bytes'],
+            'io_write_bytes': samples[-1]['write_bytes'],
+            'peak_threads': max(sample['threads'] for sample in samples)
+        }
+    
+    return jsonify({'status': crawler_run['status'], 'summary': summary, 'samples': samples})
+
+# 路由：全文搜索日志
+@app.route('/logs/search')
+def search_logs():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'status': 'error', 'message': '请输入搜索内容'}), 400
+    # trigram分词至少需要3个字符才能匹配
+    if len(query) < 3:
+        return jsonify({'status': 'error', 'message': '搜索内容至少需要3个字符'}), 400
+    if not log_search_available():
+        return jsonify({'status': 'error', 'message': '日志搜索不可用'}), 501
+    
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    results = search_log_lines(
+        query,
+        crawler_id=request.args.get('crawler_id'),
+        start_from=request.args.get('start_from'),
+        start_to=request.args.get('start_to'),
+        limit=limit
+    )
+    for result in results:
+        result['start_time'] = format_time(result['start_time'])
+    
+    return jsonify({'results': results})
+
 # 路由：爬虫历史记录
 @app.route('/history')
 def crawler_history():
-    runs = get_crawler_runs()
-    # 增加运行类型和定时任务ID信息
+    # 运行记录由前端通过/history/data分页加载
+    crawlers = crawler_manager.get_all_crawlers()
+    return render_template('history.html', crawlers=crawlers)
+
+# 路由：分页查询运行历史
+@app.route('/history/data')
+def crawler_history_data():
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    try:
+        runs, next_cursor = query_crawler_runs(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            crawler_id=request.args.get('crawler_id'),
+            status=request.args.get('status'),
+            run_type=request.args.get('run_type'),
+            schedule_id=request.args.get('schedule_id'),
+            start_from=request.args.get('start_from'),
+            start_to=request.args.get('start_to'),
+            parent_run_id=request.args.get('parent_run_id')
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
     for run in runs:
-        if 'run_type' not in run:
-            run['run_type'] = 'manual'
-        if 'schedule_id' not in run:
-            run['schedule_id'] = None
-    return render_template('history.html', runs=runs)
+        run['start_time'] = format_time(run['start_time'])
+        run['end_time'] = format_time(run['end_time'])
+        # 日志路径只在服务端使用
+        del run['log_path']
+    
+    return jsonify({'runs': runs, 'next_cursor': next_cursor})
 
 # 路由：定时任务管理页面
 @app.route('/schedules')
@@ -128,17 +399,35 @@ def add_schedule():
     crawler_id = request.form.get('crawler_id')
     schedule_type = request.form.get('schedule_type')
     time_value = request.form.get('time_value')
+    jitter_seconds = request.form.get('jitter_seconds', type=int)
     
     if not all([crawler_id, schedule_type, time_value]):
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
+    if jitter_seconds is not None and jitter_seconds < 0:
+        return jsonify({'status': 'error', 'message': '随机抖动不能小于0'}), 400
     
-    # 添加定时任务（会同时保存到内存和数据库）
-    task_id = crawler_manager.add_scheduled_task(crawler_id, schedule_type, time_value)
+    # 添加定时任务（会同时保存到调度器和数据库）
+    try:
+        task_id = crawler_manager.add_scheduled_task(crawler_id, schedule_type, time_value, jitter_seconds)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'时间设置无效: {str(e)}'}), 400
     if not task_id:
         return jsonify({'status': 'error', 'message': '添加定时任务失败'}), 500
         
     return jsonify({'status': 'success', 'task_id': task_id})
 
+# 路由：将多个定时任务均匀错开到一个时间窗口内
+@app.route('/schedules/spread', methods=['POST'])
+def spread_schedules():
+    task_ids = request.form.getlist('task_ids')
+    window_minutes = request.form.get('window_minutes', type=float)
+    
+    if not task_ids or not window_minutes or window_minutes <= 0:
+        return jsonify({'status': 'error', 'message': '参数不完整'}), 400
+    
+    count = crawler_manager.spread_scheduled_tasks(task_ids, window_minutes * 60)
+    return jsonify({'status': 'success', 'count': count})
+
 # 路由：删除定时任务
 @app.route('/schedules/delete/<task_id>', methods=['POST'])
 def delete_schedule(task_id):
@@ -148,33 +437,6 @@ def delete_schedule(task_id):
     else:
         return jsonify({'status': 'error', 'message': '任务不存在'}), 404
 
-# 注册爬虫Web界面
-def register_crawler_web_interfaces():
-    """注册所有支持Web界面的爬虫"""
-    crawlers = crawler_manager.get_all_crawlers()
-    for crawler in crawlers:
-        crawler_id = crawler['id']
-        crawler_info = crawler_manager.get_crawler_by_id(crawler_id)
-        
-        if crawler_info and crawler_info.get('web_support', False):
-            crawler_path = os.path.join(crawler_manager.crawlers_dir, crawler_id)
-            web_module_path = os.path.join(crawler_path, 'web.py')
-            
-            if os.path.exists(web_module_path):
-                try:
-                    # 动态导入web.py模块
-                    spec = importlib.util.spec_from_file_location(f"crawler_{crawler_id}_web", web_module_path)
-                    web_module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(web_module)
-                    
-                    # 创建并注册蓝图
-                    if hasattr(web_module, 'create_blueprint'):
-                        blueprint = web_module.create_blueprint(crawler_id, crawler_path)
-                        app.register_blueprint(blueprint)
-                        logging.info(f"已注册爬虫Web界面: {crawler_id}")
-                except Exception as e:
-                    logging.error(f"注册爬虫Web界面失败: {crawler_id}, 错误: {str(e)}")
-
 # 路由：访问爬虫Web界面
 @app.route('/crawler_web/<crawler_id>')
 def crawler_web(crawler_id):
@@ -188,8 +450,8 @@ def crawler_web(crawler_id):
     # 重定向到爬虫的Web界面
     return redirect(f"/crawler/{crawler_id}/")
 
-# 注册爬虫Web界面
-register_crawler_web_interfaces()
+# 爬虫的Web界面在第一次访问/crawler/<爬虫ID>/时加载，web.py或config.json变化后自动重新加载
+app.wsgi_app = CrawlerWebDispatcher(app.wsgi_app, app, crawler_manager.crawlers_dir, crawler_manager.registry)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
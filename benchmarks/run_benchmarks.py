@@ -0,0 +1,377 @@
+"""爬虫管理系统关键路径的基准测试
+
+在临时目录中生成合成爬虫、数据库和日志目录（通过FLASK_CRAWLERS_DIR、FLASK_LOGS_DIR和FLASK_DATABASE
+指定给应用，不影响正式数据），依次测量：
+
+- launch: run_crawler的调用耗时（启动一次只输出一行的运行）
+- capture: 多个运行同时大量输出时的日志采集吞吐
+- writes: 运行记录写入crawler_runs的耗时
+- http: 运行历史增长到不同规模时/crawlers/status、/history、/history/data和/logs/content/<运行ID>的p50/p99延迟
+
+结果以JSON输出，包含代码版本和测试参数，可以在不同版本之间对比。
+
+用法: python benchmarks/run_benchmarks.py --history-sizes 10000,100000,1000000 --output results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = ('launch', 'capture', 'writes', 'http')
+
+# 合成爬虫：按参数向标准输出和标准错误输出指定行数和长度的日志，输出均匀分布在duration秒内
+BENCH_CRAWLER_MAIN = '''import os
+import sys
+import time
+
+lines = int(os.environ.get('CRAWLER_PARAM_LINES', '0'))
+stderr_lines = int(os.environ.get('CRAWLER_PARAM_STDERR_LINES', '0'))
+line_bytes = int(os.environ.get('CRAWLER_PARAM_LINE_BYTES', '100'))
+duration = float(os.environ.get('CRAWLER_PARAM_DURATION', '0'))
+
+print('bench crawler started', flush=True)
+total = lines + stderr_lines
+# 标准错误的行均匀穿插在标准输出之间
+stride = total // stderr_lines if stderr_lines else 0
+chunk = 100
+started = time.monotonic()
+for start in range(0, total, chunk):
+    for i in range(start, min(start + chunk, total)):
+        stream = sys.stderr if stride and i % stride == 0 and i // stride < stderr_lines else sys.stdout
+        prefix = f'{i:08d} '
+        stream.write(prefix + 'x' * max(line_bytes - len(prefix) - 1, 0) + '\\n')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if duration:
+        delay = started + duration * min(start + chunk, total) / total - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+'''
+
+
+def percentile(values, fraction):
+    """按最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """延迟列表(秒) -> 毫秒为单位的统计"""
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else None,
+    }
+
+
+def log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+
+
+def create_crawlers(crawlers_dir, count, args):
+    """生成count个合成爬虫，返回爬虫ID列表"""
+    crawler_ids = []
+    for i in range(count):
+        crawler_id = f'bench_crawler_{i}'
+        crawler_path = os.path.join(crawlers_dir, crawler_id)
+        os.makedirs(crawler_path, exist_ok=True)
+        with open(os.path.join(crawler_path, 'main.py'), 'w', encoding='utf-8') as f:
+            f.write(BENCH_CRAWLER_MAIN)
+        config = {
+            'name': f'基准测试爬虫{i}',
+            'description': '基准测试生成的合成爬虫',
+            'launch_mode': args.launch_mode,
+            'parameters': {
+                'lines': {'type': 'int', 'default': args.lines},
+                'stderr_lines': {'type': 'int', 'default': args.stderr_lines},
+                'line_bytes': {'type': 'int', 'default': args.line_bytes},
+                'duration': {'type': 'float', 'default': args.duration},
+            },
+        }
+        with open(os.path.join(crawler_path, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        crawler_ids.append(crawler_id)
+    return crawler_ids
+
+
+def wait_idle(manager, timeout):
+    """等待所有运行结束"""
+    deadline = time.monotonic() + timeout
+    while manager.active_crawlers or len(manager.run_queue):
+        if time.monotonic() > deadline:
+            raise TimeoutError('等待运行结束超时')
+        time.sleep(0.005)
+
+
+def bench_launch(app_module, crawler_id, runs, timeout):
+    """run_crawler的调用耗时，每次等上一次运行结束后再启动下一次"""
+    manager = app_module.crawler_manager
+    latencies = []
+    params = {'lines': 0, 'stderr_lines': 0, 'duration': 0}
+    for _ in range(runs):
+        started = time.perf_counter()
+        manager.run_crawler(crawler_id, params=params)
+        latencies.append(time.perf_counter() - started)
+        wait_idle(manager, timeout)
+    return summarize(latencies)
+
+
+def bench_capture(app_module, crawler_ids, args):
+    """同时启动args.concurrency个运行，测量从启动到全部日志写完的吞吐"""
+    from database.models import get_crawler_by_id
+    from database.writer import get_writer
+
+    manager = app_module.crawler_manager
+    params = {
+        'lines': args.lines,
+        'stderr_lines': args.stderr_lines,
+        'line_bytes': args.line_bytes,
+        'duration': args.duration,
+    }
+    started = time.perf_counter()
+    run_ids = [
+        manager.run_crawler(crawler_ids[i % len(crawler_ids)], params=params)
+        for i in range(args.concurrency)
+    ]
+    wait_idle(manager, args.timeout)
+    elapsed = time.perf_counter() - started
+    # 全文索引可能落后于日志采集，等写入线程处理完再读取运行状态
+    get_writer(app_module.app.config['DATABASE']).sync(timeout=args.timeout)
+
+    total_bytes = 0
+    total_lines = 0
+    statuses = {}
+    with app_module.app.app_context():
+        runs = [get_crawler_by_id(run_id) for run_id in run_ids]
+    for run in runs:
+        statuses[run['status']] = statuses.get(run['status'], 0) + 1
+        with open(run['log_path'], 'rb') as f:
+            data = f.read()
+        total_bytes += len(data)
+        total_lines += data.count(b'\n')
+
+    expected_lines = args.concurrency * (args.lines + args.stderr_lines + 1)
+    return {
+        'runs': args.concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'lines': total_lines,
+        'expected_lines': expected_lines,
+        'bytes': total_bytes,
+        'lines_per_second': round(total_lines / elapsed, 1),
+        'mb_per_second': round(total_bytes / elapsed / 1024 / 1024, 3),
+        'statuses': statuses,
+    }, runs[0]
+
+
+def bench_writes(app_module, count):
+    """运行记录的写入：每条记录一次插入和一次状态更新，测量调用耗时和全部落库的吞吐"""
+    from database.models import add_crawler_run, update_crawler_status
+    from database.writer import get_writer
+
+    app = app_module.app
+    latencies = []
+    with app.app_context():
+        started = time.perf_counter()
+        for _ in range(count):
+            run_id = str(uuid.uuid4())
+            call_started = time.perf_counter()
+            add_crawler_run(run_id, 'bench_writes', '写入测试', 'running', '', 'manual')
+            update_crawler_status(run_id, 'completed')
+            latencies.append(time.perf_counter() - call_started)
+        get_writer(app.config['DATABASE']).sync(timeout=600)
+        elapsed = time.perf_counter() - started
+    result = summarize(latencies)
+    result.update({
+        'runs': count,
+        'elapsed_seconds': round(elapsed, 3),
+        'runs_per_second': round(count / elapsed, 1),
+    })
+    return result
+
+
+def grow_history(db_path, crawler_ids, log_path, current, target):
+    """直接向crawler_runs批量插入已结束的运行记录，使历史记录达到target条"""
+    tz = datetime.timezone(datetime.timedelta(hours=8))
+    now = datetime.datetime.now(tz)
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        batch = []
+        for i in range(current, target):
+            start = now - datetime.timedelta(seconds=10 * (i + 1))
+            batch.append((
+                str(uuid.uuid4()), crawler_ids[i % len(crawler_ids)], '基准测试爬虫',
+                start.isoformat(' '), (start + datetime.timedelta(seconds=5)).isoformat(' '),
+                'completed' if i % 10 else 'error', log_path, 'scheduled' if i % 3 else 'manual'
+            ))
+            if len(batch) >= 50000:
+                _insert_history(conn, batch)
+                batch = []
+        if batch:
+            _insert_history(conn, batch)
+    finally:
+        conn.close()
+
+
+def _insert_history(conn, rows):
+    with conn:
+        conn.executemany(
+            "INSERT INTO crawler_runs (id, crawler_id, crawler_name, start_time, end_time, status, log_path, run_type) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def bench_http(app_module, crawler_ids, log_run, args):
+    """运行历史增长到各个规模时接口的延迟"""
+    app = app_module.app
+    client = app.test_client()
+    # 结果中的接口名称不包含运行ID等每次不同的值，便于在不同版本之间对比
+    endpoints = [
+        ('/crawlers/status', '/crawlers/status'),
+        ('/history', '/history'),
+        ('/history/data', '/history/data'),
+        ('/history/data?crawler_id=<爬虫ID>&status=error', f'/history/data?crawler_id={crawler_ids[0]}&status=error'),
+        ('/logs/content/<run_id>', f'/logs/content/{log_run["id"]}'),
+    ]
+    results = []
+    current = 0
+    for size in args.history_sizes:
+        log(f"运行历史增长到 {size} 条")
+        grow_history(app.config['DATABASE'], crawler_ids, log_run['log_path'], current, size)
+        current = max(current, size)
+
+        endpoint_results = {}
+        for name, url in endpoints:
+            # 预热一次，排除首次加载模板等开销
+            status_code = client.get(url).status_code
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                client.get(url).close()
+                latencies.append(time.perf_counter() - started)
+            result = summarize(latencies)
+            result['status_code'] = status_code
+            endpoint_results[name] = result
+        results.append({'history_rows': size, 'endpoints': endpoint_results})
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='爬虫管理系统基准测试')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help=f"执行的测试，逗号分隔，可选 {', '.join(BENCHMARKS)}")
+    parser.add_argument('--workdir', help='存放合成爬虫、数据库和日志的目录，默认使用临时目录并在结束后删除')
+    parser.add_argument('--crawlers', type=int, default=10, help='生成的合成爬虫数')
+    parser.add_argument('--launch-mode', default='subprocess', choices=('subprocess', 'zygote'), help='合成爬虫的启动方式')
+    parser.add_argument('--launch-runs', type=int, default=20, help='launch测试的运行次数')
+    parser.add_argument('--concurrency', type=int, default=4, help='capture测试同时启动的运行数')
+    parser.add_argument('--lines', type=int, default=50000, help='每个运行输出到标准输出的行数')
+    parser.add_argument('--stderr-lines', type=int, default=5000, help='每个运行输出到标准错误的行数')
+    parser.add_argument('--line-bytes', type=int, default=100, help='每行日志的字节数')
+    parser.add_argument('--duration', type=float, default=0, help='每个运行输出日志的持续时间(秒)，0表示尽快输出')
+    parser.add_argument('--write-runs', type=int, default=5000, help='writes测试写入的运行记录数')
+    parser.add_argument('--history-sizes', default='10000,100000,1000000',
+                        help='http测试的运行历史规模，逗号分隔，依次增长')
+    parser.add_argument('--requests', type=int, default=200, help='http测试每个接口的请求次数')
+    parser.add_argument('--timeout', type=float, default=600, help='等待运行结束的最长时间(秒)')
+    parser.add_argument('--output', help='结果JSON文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    args.only = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = [name for name in args.only if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试: {', '.join(unknown)}")
+    args.history_sizes = sorted(int(size) for size in args.history_sizes.split(',') if size.strip())
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='crawler-bench-')
+    crawlers_dir = os.path.join(workdir, 'crawlers')
+    os.makedirs(crawlers_dir, exist_ok=True)
+    crawler_ids = create_crawlers(crawlers_dir, max(args.crawlers, 1), args)
+
+    # 应用在导入时读取配置，需在导入前设置
+    os.environ['FLASK_CRAWLERS_DIR'] = crawlers_dir
+    os.environ['FLASK_LOGS_DIR'] = os.path.join(workdir, 'logs')
+    os.environ['FLASK_DATABASE'] = os.path.join(workdir, 'crawler.sqlite')
+    os.environ['FLASK_MAX_CONCURRENT_RUNS'] = str(max(args.concurrency, 1))
+    sys.path.insert(0, REPO_DIR)
+
+    started = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - started
+
+    results = {'app_import_seconds': round(import_seconds, 3)}
+    try:
+        if 'launch' in args.only:
+            log(f"launch: {args.launch_runs} 次")
+            results['launch'] = bench_launch(app_module, crawler_ids[0], args.launch_runs, args.timeout)
+
+        log_run = None
+        if 'capture' in args.only or 'http' in args.only:
+            log(f"capture: {args.concurrency} 个运行，每个 {args.lines + args.stderr_lines} 行")
+            capture, log_run = bench_capture(app_module, crawler_ids, args)
+            if 'capture' in args.only:
+                results['capture'] = capture
+
+        if 'writes' in args.only:
+            log(f"writes: {args.write_runs} 条运行记录")
+            results['writes'] = bench_writes(app_module, args.write_runs)
+
+        if 'http' in args.only:
+            results['http'] = bench_http(app_module, crawler_ids, log_run, args)
+    finally:
+        app_module.crawler_manager.scheduler.shutdown(wait=False)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'version': git_version(),
+        'timestamp': datetime.datetime.now().astimezone().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'parameters': {name: value for name, value in vars(args).items() if name not in ('output', 'workdir')},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        log(f"结果已写入 {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
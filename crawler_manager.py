@@ -1,5 +1,4 @@
 import os
-import json
 import time
 import datetime
 import subprocess
@@ -8,137 +7,482 @@ import logging
 import uuid
 import pytz
 from pathlib import Path
-from database.models import add_crawler_run, update_crawler_status, get_crawler_by_id, add_scheduled_task as db_add_scheduled_task, remove_scheduled_task as db_remove_scheduled_task, get_scheduled_tasks as db_get_scheduled_tasks, get_scheduled_task_by_id
+from database.models import add_crawler_run, update_crawler_status, update_parent_run_status, request_run_cancel, get_cancel_requests, get_shard_runs, get_run_statuses, add_agent_assignment, take_agent_assignments, expire_stale_agents, heartbeat_agent, mark_crawler_run_started, claim_orphaned_runs, get_uncompressed_runs, mark_run_log_compressed, add_run_samples, update_run_resources, update_run_progress, add_run_log_summary, index_log_lines, log_search_available, get_crawler_by_id, add_scheduled_task as db_add_scheduled_task, remove_scheduled_task as db_remove_scheduled_task, get_scheduled_tasks as db_get_scheduled_tasks, get_scheduled_task_by_id, set_scheduled_task_offsets
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.jobstores.memory import MemoryJobStore
+from database.jobstore import SQLiteJobStore
+from scheduler_leader import SchedulerLeader, new_worker_id
+from schedule_triggers import SCHEDULE_TYPES, build_trigger, next_fire_times
+from log_stream import LogBroadcaster
+from run_events import RunEventBus
+from output_multiplexer import OutputMultiplexer
+from run_queue import RunQueue
+from crawler_registry import CrawlerRegistry
+from agent_registry import AgentRegistry
+from resource_sampler import ResourceSampler
+from run_parameters import resolve_parameters, validate_shard_count, run_environment
+from run_progress import PROGRESS_PREFIX_BYTES, parse_progress_line
+from log_summary import LogSummary
+from log_capture import RunLogWriter
+from process_control import PROCESS_GROUPS_SUPPORTED, prepare_limits, limits_preexec_fn, kill_process_group, terminate_process_group
+from metrics import ACTIVE_RUNS, QUEUED_RUNS, RUNS_STARTED, RUNS_FINISHED, RUN_DURATION, LOG_BYTES, SCHEDULE_LAG, LAUNCH_DURATION, FIRST_OUTPUT_DELAY
+import zygote
+from log_compression import compress_log, is_compressed_log, COMPRESSED_SUFFIX
 import sys
 
+# 日志行攒够多少行或多少秒后写入全文索引
+SEARCH_BATCH_LINES = 200
+SEARCH_FLUSH_SECONDS = 1.0
+# 爬虫上报的进度计数最多每隔多少秒保存一次
+PROGRESS_FLUSH_SECONDS = 1.0
+# 运行中的日志摘要（行数、警告和错误数）每隔多少秒保存一次，运行结束时再保存剩余部分
+LOG_SUMMARY_FLUSH_SECONDS = 5.0
+# 日志写入缓冲区后最多等待多少秒写入日志文件
+LOG_FLUSH_SECONDS = 0.5
+
+# 爬虫SDK所在目录，启动爬虫时加入其模块搜索路径
+SDK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sdk')
+
+# 当前进程的爬虫管理器，供保存在数据库中的定时任务调用
+_current_manager = None
+
+
+def run_scheduled_crawler(crawler_id, task_id):
+    """定时任务的入口
+
+    定时任务保存在数据库中，只能引用模块级函数，由这里转发给当前进程的爬虫管理器。
+    """
+    if _current_manager is None:
+        logging.error(f"爬虫管理器未初始化，无法执行定时任务: {task_id}")
+        return None
+    return _current_manager.run_crawler(crawler_id, 'scheduled', task_id)
+
+
+class RunCapture:
+    """一次运行的日志采集状态"""
+    
+    def __init__(self, run_id, crawler_id, process, log_path, log_writer, timeout, launch_mode='subprocess', launched=None):
+        self.run_id = run_id
+        self.crawler_id = crawler_id
+        self.process = process
+        self.log_path = log_path
+        self.log_writer = log_writer  # 日志文件（RunLogWriter）
+        self.log_timer = None  # 日志缓冲区的定时写入
+        self.timeout = timeout
+        self.stop_reason = None  # 主动结束进程的原因：'timeout'、'cancelled'或'error'（处理输出失败）
+        self.kill_timer = None  # 结束进程时宽限期后的强制结束，进程退出时取消
+        self.exited = False  # 爬虫进程已退出，之后不再向其进程组发送信号
+        self.started = time.monotonic()
+        self.launch_mode = launch_mode  # 进程的启动方式
+        self.launched = launched  # 开始启动进程的时间，收到第一行输出后清空
+        self.error = None  # 处理输出时发生的异常
+        self.line_no = 0  # 日志文件中已保留的行数
+        self.search_rows = []  # 等待写入全文索引的日志行
+        self.search_timer = None  # 全文索引的定时写入
+        self.progress = None  # 等待保存的进度计数
+        self.progress_timer = None  # 进度计数的定时保存
+        self.summary = LogSummary()  # 尚未保存的日志摘要
+        self.summary_timer = None  # 日志摘要的定时保存
+
+
 class CrawlerManager:
     def __init__(self, app):
         if app is None:
             raise ValueError("Flask app instance is required")
             
-        self.crawlers_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawlers')
-        self.logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.crawlers_dir = app.config.get('CRAWLERS_DIR') or os.path.join(base_dir, 'crawlers')
+        self.logs_dir = app.config.get('LOGS_DIR') or os.path.join(base_dir, 'logs')
+        # 日志全文索引（需要SQLite支持FTS5）
+        with app.app_context():
+            self.log_search_enabled = app.config.get('LOG_SEARCH_ENABLED', True) and log_search_available()
+        # 爬虫配置缓存，配置文件变化时自动重新加载
+        self.registry = CrawlerRegistry(self.crawlers_dir)
         self.active_crawlers = {}
-        self.scheduled_tasks = {}
-        self.scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Shanghai'))
-        self.scheduler.start()
+        # 等待执行的运行，以及保护活动爬虫和队列的锁
+        self.run_queue = RunQueue()
+        self._dispatch_lock = threading.RLock()
+        # 运行结束后由调度线程启动排队中的运行：启动进程可能较慢，不能阻塞输出复用器线程
+        self._dispatch_wakeup = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='run-dispatcher', daemon=True)
+        # 运行日志的内存缓冲区，供SSE实时推送
+        self.log_broadcaster = LogBroadcaster()
+        # 运行状态事件，供/events推送，代替前端轮询/crawlers/status
+        self.events = RunEventBus()
+        # 所有运行共用一个I/O线程采集输出
+        self.output_multiplexer = OutputMultiplexer()
+        # 按预导入模块列表区分的zygote进程，launch_mode为zygote的爬虫由其fork启动
+        self.zygotes = {}
+        self._zygotes_lock = threading.Lock()
+        # 其他主机上的工作节点，有空闲节点时运行优先分配给负载最低的节点
+        self.agents = AgentRegistry(app, lease=app.config.get('AGENT_LEASE_SECONDS', 15))
+        self._agent_log_lock = threading.Lock()
+        # 工作节点上运行的日志摘要，跨多次回传保留（Traceback可能分在两次回传中），运行结束时移除
+        self._agent_summaries = {}
+        # 定时采样运行中进程树的资源占用
+        self.resource_sampler = ResourceSampler(
+            self._save_samples,
+            interval=app.config.get('RESOURCE_SAMPLE_INTERVAL', 5)
+        )
+        # 定时任务保存在数据库中，多个进程共用；进程内的维护任务保存在内存中
+        self.scheduler = BackgroundScheduler(
+            timezone=pytz.timezone('Asia/Shanghai'),
+            jobstores={
+                'default': SQLiteJobStore(app.config['DATABASE']),
+                'local': MemoryJobStore()
+            },
+            job_defaults={
+                'misfire_grace_time': app.config.get('SCHEDULER_MISFIRE_GRACE_SECONDS', 300),
+                'coalesce': app.config.get('SCHEDULER_COALESCE', True)
+            }
+        )
+        # 定时任务实际开始运行的时间，用于统计触发延迟；任务执行结束（成功或出错）时取出
+        self._schedule_started = {}
+        self.scheduler.add_listener(self._on_job_executed, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        # 调度器先以暂停状态启动，成为调度进程后才开始执行任务
+        self.scheduler.start(paused=True)
+        # 运行数指标在导出时直接读取内存中的状态
+        ACTIVE_RUNS.set_function(lambda: len(self.active_crawlers))
+        QUEUED_RUNS.set_function(lambda: len(self.run_queue))
         self.app = app
+        self.worker_id = new_worker_id()
+        self._dispatcher.start()
+        
+        global _current_manager
+        _current_manager = self
         
         # 确保日志目录存在
         os.makedirs(self.logs_dir, exist_ok=True)
         
-        # 从数据库加载定时任务
+        # 将数据库中尚未加入调度器的定时任务加入调度器
         self._load_scheduled_tasks_from_db()
+        
+        # 定时压缩已结束运行的日志
+        self.scheduler.add_job(
+            self.compress_finished_logs,
+            'interval',
+            minutes=app.config.get('LOG_COMPRESS_INTERVAL_MINUTES', 10),
+            id='compress_finished_logs',
+            jobstore='local',
+            replace_existing=True,
+            coalesce=True
+        )
+        
+        # 多个进程中只有一个调度进程执行定时任务、压缩日志、接管遗留的排队运行和清理离线节点上的运行
+        self.leader = SchedulerLeader(
+            app,
+            self.worker_id,
+            on_elected=self.scheduler.resume,
+            on_demoted=self.scheduler.pause,
+            on_heartbeat=self._on_leader_heartbeat,
+            on_beat=self._on_beat,
+            interval=app.config.get('SCHEDULER_HEARTBEAT_SECONDS', 5),
+            lease=app.config.get('SCHEDULER_LEASE_SECONDS', 15)
+        )
+        self.leader.start()
     
     def get_all_crawlers(self):
         """获取所有爬虫信息"""
-        crawlers = []
-        
-        for crawler_dir in os.listdir(self.crawlers_dir):
-            crawler_path = os.path.join(self.crawlers_dir, crawler_dir)
-            if os.path.isdir(crawler_path):
-                config_path = os.path.join(crawler_path, 'config.json')
-                main_path = os.path.join(crawler_path, 'main.py')
-                
-                if os.path.exists(config_path) and os.path.exists(main_path):
-                    try:
-                        with open(config_path, 'r', encoding='utf-8') as f:
-                            config = json.load(f)
-                        
-                        crawlers.append({
-                            'id': crawler_dir,
-                            'name': config.get('name', crawler_dir),
-                            'description': config.get('description', ''),
-                            'version': config.get('version', '1.0'),
-                            'author': config.get('author', '未知'),
-                            'parameters': config.get('parameters', {})
-                        })
-                    except Exception as e:
-                        logging.error(f"读取爬虫配置失败: {crawler_dir}, 错误: {str(e)}")
-        
-        return crawlers
+        return self.registry.all()
     
     def get_crawler_by_id(self, crawler_id):
         """根据ID获取爬虫信息"""
-        crawler_path = os.path.join(self.crawlers_dir, crawler_id)
-        config_path = os.path.join(crawler_path, 'config.json')
-        
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                
-                # 检查爬虫是否支持Web界面
-                web_support = config.get('web_support', False)
-                
-                return {
-                    'id': crawler_id,
-                    'name': config.get('name', crawler_id),
-                    'description': config.get('description', ''),
-                    'version': config.get('version', '1.0'),
-                    'author': config.get('author', '未知'),
-                    'parameters': config.get('parameters', {}),
-                    'web_support': web_support,
-                    'database': config.get('database', None)
-                }
-            except Exception as e:
-                logging.error(f"读取爬虫配置失败: {crawler_id}, 错误: {str(e)}")
-        
-        return None
+        return self.registry.get(crawler_id)
+    
+    def _log_max_bytes(self, crawler):
+        """单次运行日志的大小上限(字节)，优先使用爬虫limits中的log_max_mb，0表示不限制"""
+        max_mb = (crawler.get('limits') or {}).get('log_max_mb')
+        if max_mb is None:
+            max_mb = self.app.config.get('LOG_MAX_MB', 0)
+        return int(float(max_mb) * 1024 * 1024) or None
     
-    def run_crawler(self, crawler_id, run_type='manual', schedule_id=None):
+    def run_crawler(self, crawler_id, run_type='manual', schedule_id=None, params=None, shards=None):
         """运行爬虫
         
+        运行先进入队列，在全局并发数和爬虫的max_instances限制内立即启动，
+        否则以queued状态等待，有运行结束时按优先级启动。
+        
+        分片数大于1时，创建一个父运行记录和shards个并行的子运行，每个子运行通过环境变量得知自己的分片序号，
+        父运行的状态由子运行的状态汇总。
+        
         Args:
             crawler_id: 爬虫ID
             run_type: 运行类型，'manual'表示手动运行，'scheduled'表示定时任务运行
             schedule_id: 定时任务ID，仅当run_type为'scheduled'时有效
+            params: 运行参数，未提供的参数使用config.json中的默认值
+            shards: 分片数，None时使用config.json中的shards（默认1）
+        
+        Returns:
+            str: 运行ID（分片运行时为父运行ID），爬虫不存在或定时运行被跳过时返回None
+        
+        Raises:
+            ValueError: 参数或分片数无效
         """
+        if run_type == 'scheduled' and schedule_id:
+            self._schedule_started[schedule_id] = time.time()
+        
         crawler = self.get_crawler_by_id(crawler_id)
         if not crawler:
+            self._schedule_started.pop(schedule_id, None)
             return None
         
-        # 创建日志目录
-        now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
-        year_dir = os.path.join(self.logs_dir, str(now.year))
-        month_dir = os.path.join(year_dir, str(now.month))
-        os.makedirs(month_dir, exist_ok=True)
+        params = resolve_parameters(crawler.get('parameters'), params)
+        shard_count = validate_shard_count(shards if shards is not None else crawler.get('shards') or 1)
         
-        # 生成日志文件名
-        log_filename = f"{now.strftime('%Y-%m-%d %H-%M-%S')}_{crawler['name']}.log"
-        log_path = os.path.join(month_dir, log_filename)
+        with self._dispatch_lock:
+            # 定时任务的上一次运行尚未结束时，按重叠策略处理
+            if run_type == 'scheduled' and schedule_id:
+                policy = crawler.get('schedule_overlap') or self.app.config.get('SCHEDULE_OVERLAP_POLICY', 'coalesce')
+                running = [r for r in self.active_crawlers.values() if r['schedule_id'] == schedule_id]
+                queued = [r for r in self.run_queue.runs() if r['schedule_id'] == schedule_id]
+                if running or queued:
+                    if policy == 'skip':
+                        logging.info(f"定时任务上一次运行尚未结束，跳过本次运行: {schedule_id}")
+                        self._schedule_started.pop(schedule_id, None)
+                        return None
+                    if policy == 'coalesce' and queued:
+                        # 已有等待中的运行，合并为一次
+                        self._schedule_started.pop(schedule_id, None)
+                        return queued[0]['parent_run_id'] or queued[0]['run_id']
+            
+            # 创建日志目录
+            now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
+            year_dir = os.path.join(self.logs_dir, str(now.year))
+            month_dir = os.path.join(year_dir, str(now.month))
+            os.makedirs(month_dir, exist_ok=True)
+            
+            # 分片运行的父运行只记录汇总状态，没有进程和日志
+            parent_run_id = None
+            if shard_count > 1:
+                parent_run_id = str(uuid.uuid4())
+                with self.app.app_context():
+                    add_crawler_run(parent_run_id, crawler_id, crawler['name'], 'queued', '', run_type, schedule_id,
+                                    self.worker_id, params, shard_count=shard_count)
+            
+            runs = []
+            for shard_index in range(shard_count):
+                # 生成日志文件名，同一秒启动的各分片使用不同的文件
+                suffix = f"_shard{shard_index + 1}of{shard_count}" if parent_run_id else ''
+                log_filename = f"{now.strftime('%Y-%m-%d %H-%M-%S')}_{crawler['name']}{suffix}.log"
+                log_path = os.path.join(month_dir, log_filename)
+                
+                # 生成运行ID
+                run_id = str(uuid.uuid4())
+                
+                run = {
+                    'run_id': run_id,
+                    'crawler_id': crawler_id,
+                    'name': crawler['name'],
+                    'log_path': log_path,
+                    'run_type': run_type,
+                    'schedule_id': schedule_id,
+                    'params': params,
+                    'parent_run_id': parent_run_id,
+                    'shard_index': shard_index if parent_run_id else None,
+                    'shard_count': shard_count if parent_run_id else None,
+                    'persisted': False  # 是否已写入数据库
+                }
+                
+                # 创建日志缓冲区，保证启动后立即订阅的客户端不会丢失日志
+                self.log_broadcaster.open(run_id)
+                
+                self.run_queue.push(run)
+                runs.append(run)
+            
+            startable = self._take_startable_runs()
+            for run in runs:
+                if run in startable:
+                    continue
+                # 无法立即启动，以排队状态记录到数据库
+                with self.app.app_context():
+                    add_crawler_run(run['run_id'], crawler_id, crawler['name'], 'queued', run['log_path'], run_type, schedule_id,
+                                    self.worker_id, params, parent_run_id, run['shard_index'], run['shard_count'])
+                run['persisted'] = True
+                self.events.publish('queued', {
+                    'run_id': run['run_id'],
+                    'crawler_id': crawler_id,
+                    'parent_run_id': parent_run_id
+                })
         
-        # 生成运行ID
-        run_id = str(uuid.uuid4())
+        for startable_run in startable:
+            self._start_run(startable_run)
         
-        # 记录到数据库
+        if parent_run_id:
+            with self.app.app_context():
+                update_parent_run_status(parent_run_id)
+            return parent_run_id
+        return runs[0]['run_id']
+    
+    def _can_start(self, run):
+        """判断排队中的运行能否在当前并发限制下启动（需持有self._dispatch_lock）
+        
+        MAX_CONCURRENT_RUNS只限制本机运行的进程数，本机已满时仍可以分配给有空闲的工作节点。
+        """
+        max_runs = self.app.config.get('MAX_CONCURRENT_RUNS')
+        if max_runs and self._local_run_count() >= max_runs and not self.agents.has_capacity(run['crawler_id']):
+            return False
+        
+        crawler = self.get_crawler_by_id(run['crawler_id'])
+        max_instances = crawler.get('max_instances') if crawler else None
+        if max_instances:
+            instances = sum(1 for r in self.active_crawlers.values() if r['crawler_id'] == run['crawler_id'])
+            if instances >= max_instances:
+                return False
+        
+        # 同一定时任务的运行依次执行（同一次运行的各分片并行）
+        if run['run_type'] == 'scheduled' and run['schedule_id']:
+            if any(r['schedule_id'] == run['schedule_id'] and not (run['parent_run_id'] and r['parent_run_id'] == run['parent_run_id'])
+                   for r in self.active_crawlers.values()):
+                return False
+        
+        return True
+    
+    def _take_startable_runs(self):
+        """从队列中取出所有可以启动的运行，并计入活动爬虫（需持有self._dispatch_lock）"""
+        startable = []
+        while True:
+            run = self.run_queue.pop_startable(self._can_start)
+            if run is None:
+                return startable
+            # 有空闲的工作节点时交给负载最低的节点运行，否则在本机运行
+            run['agent_id'] = self.agents.reserve(run['crawler_id'])
+            now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
+            # 记录活动爬虫
+            self.active_crawlers[run['run_id']] = {
+                'crawler_id': run['crawler_id'],
+                'name': run['name'],
+                'start_time': now.strftime('%Y-%m-%d %H:%M:%S'),  # 已使用Asia/Shanghai时区的now
+                'process': None,
+                'run_type': run['run_type'],
+                'schedule_id': run['schedule_id'],
+                'parent_run_id': run['parent_run_id'],
+                'agent_id': run['agent_id'],
+                'started': time.monotonic(),
+                'capture': None,  # 进程启动后的日志采集状态
+                'cancelled': False  # 进程启动前已被取消
+            }
+            startable.append(run)
+    
+    def _local_run_count(self):
+        """本机运行中的进程数（需持有self._dispatch_lock）"""
+        return sum(1 for r in self.active_crawlers.values() if r['agent_id'] is None)
+    
+    def _request_dispatch(self):
+        """通知调度线程启动队列中可以启动的运行（不阻塞调用线程）"""
+        self._dispatch_wakeup.set()
+    
+    def _dispatch_loop(self):
+        """调度线程主循环"""
+        while True:
+            self._dispatch_wakeup.wait()
+            self._dispatch_wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception as e:
+                logging.error(f"启动排队中的运行失败: {str(e)}")
+    
+    def _dispatch(self):
+        """启动队列中所有满足并发限制的运行"""
+        with self._dispatch_lock:
+            startable = self._take_startable_runs()
+        for run in startable:
+            self._start_run(run)
+    
+    def _start_run(self, run):
+        """启动已出队的运行"""
+        run_id = run['run_id']
+        RUNS_STARTED.inc(crawler_id=run['crawler_id'], run_type=run['run_type'])
         with self.app.app_context():
-            add_crawler_run(run_id, crawler_id, crawler['name'], 'running', log_path, run_type, schedule_id)
+            if run['persisted']:
+                mark_crawler_run_started(run_id, run['agent_id'])
+            else:
+                add_crawler_run(run_id, run['crawler_id'], run['name'], 'running', run['log_path'], run['run_type'], run['schedule_id'],
+                                self.worker_id, run['params'], run['parent_run_id'], run['shard_index'], run['shard_count'], run['agent_id'])
         
-        # 启动爬虫线程
-        thread = threading.Thread(
-            target=self._run_crawler_process,
-            args=(run_id, crawler_id, crawler['name'], log_path, self.app)
-        )
-        thread.daemon = True
-        thread.start()
+        # 超时时间优先使用爬虫的limits配置
+        crawler = self.get_crawler_by_id(run['crawler_id']) or {}
+        limits = crawler.get('limits') or {}
+        timeout = limits.get('timeout_seconds') or self.app.config.get('RUN_TIMEOUT_SECONDS', 3600)
+        run_env = run_environment(run['params'], run['shard_index'], run['shard_count'])
         
-        # 记录活动爬虫
-        self.active_crawlers[run_id] = {
-            'crawler_id': crawler_id,
-            'name': crawler['name'],
-            'start_time': now.strftime('%Y-%m-%d %H:%M:%S'),  # 已使用Asia/Shanghai时区的now
-            'thread': thread,
-            'run_type': run_type,
-            'schedule_id': schedule_id
-        }
+        if run['agent_id']:
+            # 由工作节点在下一次心跳时领取，日志和结果通过/agents接口回传
+            with self.app.app_context():
+                add_agent_assignment(run_id, run['agent_id'], {
+                    'run_id': run_id,
+                    'crawler_id': run['crawler_id'],
+                    'env': run_env,
+                    'timeout': timeout,
+                    'limits': limits,
+                    'log_max_bytes': self._log_max_bytes(crawler)
+                })
+            os.makedirs(os.path.dirname(run['log_path']), exist_ok=True)
+            open(run['log_path'], 'a', encoding='utf-8').close()
+            self.events.publish('started', {
+                'run_id': run_id,
+                'crawler_id': run['crawler_id'],
+                'parent_run_id': run['parent_run_id'],
+                'agent_id': run['agent_id']
+            })
+            return
         
-        return run_id
+        # 启动爬虫进程，输出由输出复用器统一采集
+        self._run_crawler_process(run_id, run['crawler_id'], run['name'], run['log_path'], self.app, timeout, run_env)
+    
+    def _on_leader_heartbeat(self):
+        """调度进程每次续期租约后调用（在心跳线程中调用）"""
+        # 其他进程新增的定时任务只写入了数据库，唤醒调度器重新读取下一次执行时间
+        self.scheduler.wakeup()
+        self._restore_queued_runs()
+        self._expire_stale_agents()
     
-    def _run_crawler_process(self, run_id, crawler_id, crawler_name, log_path, app, timeout=3600):
+    def _expire_stale_agents(self):
+        """将离线节点上的运行标记为错误"""
+        with self.app.app_context():
+            runs = expire_stale_agents(self.agents.lease)
+            for run in runs:
+                logging.warning(f"工作节点已离线，运行标记为错误: {run['id']}, 节点: {run['agent_id']}")
+                self._append_log(run['id'], run['log_path'], "\n错误: 工作节点已离线")
+                self._run_finished(run['id'], run['crawler_id'], 'error')
+                self._close_agent_summary(run['id'])
+                if run['parent_run_id']:
+                    update_parent_run_status(run['parent_run_id'])
+        # 本进程分配的运行在下一次心跳时结束
+    
+    def _restore_queued_runs(self):
+        """接管已退出进程遗留的排队中的运行，加入本进程的队列"""
+        with self.app.app_context():
+            queued_runs = claim_orphaned_runs(self.worker_id, self.leader.lease)
+        if not queued_runs:
+            return
+        
+        with self._dispatch_lock:
+            for queued_run in queued_runs:
+                self.log_broadcaster.open(queued_run['id'])
+                self.run_queue.push({
+                    'run_id': queued_run['id'],
+                    'crawler_id': queued_run['crawler_id'],
+                    'name': queued_run['crawler_name'],
+                    'log_path': queued_run['log_path'],
+                    'run_type': queued_run['run_type'],
+                    'schedule_id': queued_run['schedule_id'],
+                    'params': queued_run['parameters'],
+                    'parent_run_id': queued_run['parent_run_id'],
+                    'shard_index': queued_run['shard_index'],
+                    'shard_count': queued_run['shard_count'],
+                    'persisted': True
+                })
+        
+        self._dispatch()
+    
+    def _run_crawler_process(self, run_id, crawler_id, crawler_name, log_path, app, timeout=3600, run_env=None):
         """在单独的进程中运行爬虫
         
+        进程启动后交给输出复用器，标准输出和标准错误在复用器线程中同时读取，
+        进程退出或超时后由_handle_exit更新运行状态。
+        
         Args:
             run_id: 运行ID
             crawler_id: 爬虫ID
@@ -146,6 +490,7 @@ class CrawlerManager:
             log_path: 日志文件路径
             app: Flask应用实例
             timeout: 超时时间(秒)，默认1小时
+            run_env: 额外传给爬虫进程的环境变量（运行参数和分片信息）
         """
         try:
             # 爬虫路径
@@ -155,165 +500,732 @@ class CrawlerManager:
             # 确保日志目录存在
             os.makedirs(os.path.dirname(log_path), exist_ok=True)
 
-            # 运行爬虫进程
-            with open(log_path, 'w', encoding='utf-8') as log_file:
-                # 使用subprocess.Popen运行爬虫，并将输出重定向到日志文件
-                process = subprocess.Popen(
-                    [sys.executable, main_script],  # 使用sys.executable确保使用正确的Python解释器
-                    stdout=subprocess.PIPE,  # 捕获标准输出
-                    stderr=subprocess.PIPE,  # 捕获标准错误
-                    cwd=crawler_path,
-                    env=os.environ.copy()  # 复制当前环境变量
-                )
+            # 打开日志文件，输出按原始字节写入，超过大小上限时只保留开头和结尾
+            log_writer = RunLogWriter(log_path, self._log_max_bytes(self.get_crawler_by_id(crawler_id) or {}))
+            env = os.environ.copy()
+            env.update(run_env or {})
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [SDK_DIR, env.get('PYTHONPATH')]))
+            # 资源限制由爬虫进程在执行爬虫代码之前设置，之后创建的子进程都会继承
+            rlimits, failed = prepare_limits((self.get_crawler_by_id(crawler_id) or {}).get('limits'))
+            if failed:
+                logging.warning(f"爬虫资源限制未生效: {crawler_id}, {', '.join(failed)}")
+            launched = time.monotonic()
+            try:
+                process, launch_mode = self._spawn(crawler_id, main_script, crawler_path, env, rlimits)
+            except Exception:
+                log_writer.close()
+                raise
+            LAUNCH_DURATION.observe(time.monotonic() - launched, mode=launch_mode)
+            self.resource_sampler.register(run_id, process.pid)
 
-                try:
-                    # 实时处理标准输出和标准错误
-                    for stdout_line in iter(process.stdout.readline, b''):  # 实时读取标准输出
-                        log_file.write(stdout_line.decode('utf-8'))  # 将标准输出写入日志文件
-                        log_file.flush()  # 确保实时写入磁盘
-                    for stderr_line in iter(process.stderr.readline, b''):  # 实时读取标准错误
-                        log_file.write(stderr_line.decode('utf-8'))  # 将标准错误写入日志文件
-                        log_file.flush()  # 确保实时写入磁盘
+            capture = RunCapture(run_id, crawler_id, process, log_path, log_writer, timeout, launch_mode, launched)
+            with self._dispatch_lock:
+                active = self.active_crawlers.get(run_id)
+                if active is not None:
+                    active['process'] = process
+                    active['capture'] = capture
+                    cancelled = active['cancelled']
+                else:
+                    cancelled = False
+            self.output_multiplexer.watch(
+                process,
+                on_output=lambda stream_name, data: self._handle_output(capture, process, data),
+                on_exit=lambda returncode, timed_out: self._handle_exit(capture, app, returncode, timed_out),
+                timeout=timeout,
+                on_timeout=lambda: self._stop_run(capture, 'timeout')
+            )
+            self.events.publish('started', {
+                'run_id': run_id,
+                'crawler_id': crawler_id,
+                'parent_run_id': (active or {}).get('parent_run_id'),
+                'pid': process.pid,
+                'launch_mode': launch_mode
+            })
+            if cancelled:
+                # 启动过程中收到了取消请求
+                self.output_multiplexer.call_soon(lambda: self._stop_run(capture, 'cancelled'))
 
-                    # 等待进程完成，带超时
-                    process.wait(timeout=timeout)
+        except Exception as e:
+            # 记录错误
+            self._append_log(run_id, log_path, f"\n系统错误: {str(e)}")
 
-                    # 更新状态
-                    status = 'completed' if process.returncode == 0 else 'error'
-                    with app.app_context():
-                        update_crawler_status(run_id, status)
+            # 更新状态
+            with app.app_context():
+                update_crawler_status(run_id, 'error')
+            self._run_finished(run_id, crawler_id, 'error')
 
-                except subprocess.TimeoutExpired:
-                    # 超时处理
-                    process.kill()
-                    with open(log_path, 'a', encoding='utf-8') as log_file:
-                        log_file.write(f"\n错误: 爬虫运行超时({timeout}秒)")
-                    with app.app_context():
-                        update_crawler_status(run_id, 'timeout')
+            self._finish_run(run_id)
+    
+    def _spawn(self, crawler_id, main_script, crawler_path, env, rlimits=()):
+        """按爬虫配置的启动方式启动爬虫进程
+        
+        Args:
+            rlimits: 爬虫进程执行爬虫代码之前设置的资源限制（prepare_limits的返回值）
+        
+        Returns:
+            tuple: (进程对象, 实际使用的启动方式)，进程对象的stdout和stderr为管道
+        """
+        crawler = self.get_crawler_by_id(crawler_id) or {}
+        if crawler.get('launch_mode') == 'zygote' and zygote.SUPPORTED:
+            try:
+                zygote_process = self._get_zygote(crawler.get('preload_modules') or ())
+                return zygote_process.launch(main_script, crawler_path, env, rlimits=rlimits), 'zygote'
+            except Exception as e:
+                logging.warning(f"通过zygote启动爬虫失败，改用subprocess: {crawler_id}, 错误: {str(e)}")
+        
+        # 使用subprocess.Popen运行爬虫，输出由输出复用器写入日志文件
+        process = subprocess.Popen(
+            [sys.executable, main_script],  # 使用sys.executable确保使用正确的Python解释器
+            stdout=subprocess.PIPE,  # 捕获标准输出
+            stderr=subprocess.PIPE,  # 捕获标准错误
+            cwd=crawler_path,
+            env=env,
+            start_new_session=PROCESS_GROUPS_SUPPORTED,  # 在独立的进程组中运行，结束时连同孙进程一起结束
+            preexec_fn=limits_preexec_fn(rlimits)  # 在exec之前设置资源限制
+        )
+        return process, 'subprocess'
+    
+    def _get_zygote(self, preload_modules):
+        """获取预导入指定模块的zygote，不存在或已退出时重新启动"""
+        key = tuple(preload_modules)
+        with self._zygotes_lock:
+            zygote_process = self.zygotes.get(key)
+            if zygote_process is None or not zygote_process.alive:
+                zygote_process = self.zygotes[key] = zygote.Zygote(key)
+            return zygote_process
+    
+    def _handle_output(self, capture, process, data):
+        """处理爬虫进程输出的一块完整的行（在输出复用器线程中调用）"""
+        if capture.error is not None:
+            return
+        if capture.launched is not None:
+            FIRST_OUTPUT_DELAY.observe(time.monotonic() - capture.launched, mode=capture.launch_mode)
+            capture.launched = None
+        if PROGRESS_PREFIX_BYTES in data:
+            data = self._take_progress(capture, data)
+            if not data:
+                return
+        try:
+            LOG_BYTES.inc(len(data), crawler_id=capture.crawler_id)
+            # 日志摘要统计全部输出，包括超过大小上限未保留的部分
+            capture.summary.feed_chunk(data)
+            if capture.summary_timer is None:
+                capture.summary_timer = self.output_multiplexer.call_later(
+                    LOG_SUMMARY_FLUSH_SECONDS, lambda: self._flush_log_summary(capture))
+            offset = capture.log_writer.offset
+            kept = capture.log_writer.write(data)
+            if kept:
+                self._publish_log(capture, kept, offset)
+            if capture.log_writer.buffered and capture.log_timer is None:
+                capture.log_timer = self.output_multiplexer.call_later(
+                    LOG_FLUSH_SECONDS, lambda: self._flush_log(capture))
+        except Exception as e:
+            # 输出处理失败时结束整个进程组（孙进程也可能持有输出管道），按进程错误处理
+            capture.error = e
+            self._stop_run(capture, 'error')
+    
+    def _take_progress(self, capture, data):
+        """取出输出中的进度标记行并记录，返回其余的输出"""
+        lines = data.splitlines(keepends=True)
+        kept = []
+        for line in lines:
+            counters = parse_progress_line(line) if line.startswith(PROGRESS_PREFIX_BYTES) else None
+            if counters is not None:
+                self._record_progress(capture, counters)
+            else:
+                kept.append(line)
+        return b''.join(kept) if len(kept) < len(lines) else data
+    
+    def _publish_log(self, capture, data, offset):
+        """推送写入日志文件的一段输出并加入全文索引，无效的UTF-8字节替换为U+FFFD"""
+        text = data.decode('utf-8', errors='replace')
+        self.log_broadcaster.publish(capture.run_id, text, offset, offset + len(data))
+        if self.log_search_enabled:
+            self._index_lines(capture, text)
+    
+    def _flush_log(self, capture):
+        """将日志缓冲区写入日志文件"""
+        if capture.log_timer is not None:
+            capture.log_timer.cancel()
+            capture.log_timer = None
+        capture.log_writer.flush()
+    
+    def _close_log(self, capture):
+        """关闭日志文件，超过大小上限时写入省略说明和保留的结尾部分"""
+        if capture.log_timer is not None:
+            capture.log_timer.cancel()
+            capture.log_timer = None
+        offset = capture.log_writer.offset
+        tail = capture.log_writer.close()
+        if tail:
+            self._publish_log(capture, tail, offset)
+    
+    def _index_lines(self, capture, text):
+        """将日志行加入全文索引缓冲区，攒够一批或超过一定时间后写入"""
+        lines = text.split('\n')
+        if not lines[-1]:
+            lines.pop()
+        for line in lines:
+            capture.line_no += 1
+            line = line.rstrip('\r')
+            if line.strip():
+                capture.search_rows.append((line, capture.run_id, capture.line_no))
+        if len(capture.search_rows) >= SEARCH_BATCH_LINES:
+            self._flush_search_index(capture)
+        elif capture.search_rows and capture.search_timer is None:
+            capture.search_timer = self.output_multiplexer.call_later(
+                SEARCH_FLUSH_SECONDS, lambda: self._flush_search_index(capture))
+    
+    def _flush_search_index(self, capture):
+        """将缓冲的日志行写入全文索引"""
+        if capture.search_timer is not None:
+            capture.search_timer.cancel()
+            capture.search_timer = None
+        if not capture.search_rows:
+            return
+        rows, capture.search_rows = capture.search_rows, []
+        with self.app.app_context():
+            index_log_lines(rows)
+    
+    def _flush_log_summary(self, capture):
+        """保存日志摘要的增量"""
+        if capture.summary_timer is not None:
+            capture.summary_timer.cancel()
+            capture.summary_timer = None
+        if not capture.summary.pending:
+            return
+        with self.app.app_context():
+            add_run_log_summary(capture.run_id, capture.summary.take())
+    
+    def _record_progress(self, capture, counters):
+        """记录爬虫上报的进度计数，短时间内的多次上报只保存最后一次"""
+        capture.progress = counters
+        if capture.progress_timer is None:
+            capture.progress_timer = self.output_multiplexer.call_later(
+                PROGRESS_FLUSH_SECONDS, lambda: self._flush_progress(capture))
+    
+    def _flush_progress(self, capture):
+        """保存等待中的进度计数"""
+        if capture.progress_timer is not None:
+            capture.progress_timer.cancel()
+            capture.progress_timer = None
+        if capture.progress is None:
+            return
+        counters, capture.progress = capture.progress, None
+        with self.app.app_context():
+            update_run_progress(capture.run_id, counters)
+    
+    def _handle_exit(self, capture, app, returncode, timed_out):
+        """爬虫进程退出后更新运行状态（在输出复用器线程中调用）"""
+        run_id = capture.run_id
+        status = 'error'
+        try:
+            # 爬虫进程已退出，取消宽限期后的强制结束（进程组全部退出后组号可能被复用），遗留的孙进程在下面结束
+            capture.exited = True
+            if capture.kill_timer is not None:
+                capture.kill_timer.cancel()
+                capture.kill_timer = None
+            self._close_log(capture)
+            self._flush_search_index(capture)
+            self._flush_progress(capture)
+            self._flush_log_summary(capture)
 
-                except Exception as e:
-                    # 其他进程错误
-                    with open(log_path, 'a', encoding='utf-8') as log_file:
-                        log_file.write(f"\n进程错误: {str(e)}")
-                    with app.app_context():
-                        update_crawler_status(run_id, 'error')
+            if capture.stop_reason == 'cancelled':
+                self._append_log(run_id, capture.log_path, "\n运行已取消")
+                status = 'cancelled'
+            elif timed_out:
+                # 超时处理
+                self._append_log(run_id, capture.log_path, f"\n错误: 爬虫运行超时({capture.timeout}秒)")
+                status = 'timeout'
+            elif capture.error is not None:
+                # 其他进程错误
+                self._append_log(run_id, capture.log_path, f"\n进程错误: {str(capture.error)}")
+                status = 'error'
+            else:
+                status = 'completed' if returncode == 0 else 'error'
 
-        except Exception as e:
-            # 记录错误
-            with open(log_path, 'a', encoding='utf-8') as log_file:
-                log_file.write(f"\n系统错误: {str(e)}")
+            # 爬虫进程已退出，立即结束其进程组中遗留的孙进程（此时进程组仍然存在，不会发给其他进程）
+            if kill_process_group(capture.process) and capture.stop_reason is None:
+                self._append_log(run_id, capture.log_path, "\n结束爬虫遗留的子进程")
 
             # 更新状态
+            resources = self.resource_sampler.unregister(run_id)
+            with app.app_context():
+                update_crawler_status(run_id, status)
+                if resources is not None:
+                    update_run_resources(run_id, resources)
+
+        except Exception as e:
+            status = 'error'
+            self._append_log(run_id, capture.log_path, f"\n系统错误: {str(e)}")
             with app.app_context():
                 update_crawler_status(run_id, 'error')
 
         finally:
-            # 从活动爬虫中移除
-            if run_id in self.active_crawlers:
-                del self.active_crawlers[run_id]
+            self._run_finished(run_id, capture.crawler_id, status, returncode)
+            RUN_DURATION.observe(time.monotonic() - capture.started, crawler_id=capture.crawler_id)
+            self._finish_run(run_id)
     
-    def add_scheduled_task(self, crawler_id, schedule_type, time_value):
-        """添加定时任务"""
-        crawler = self.get_crawler_by_id(crawler_id)
-        if not crawler:
+    def _stop_run(self, capture, reason):
+        """结束运行中的爬虫进程组（在输出复用器线程中调用）"""
+        if capture.stop_reason is not None or capture.exited:
+            return
+        capture.stop_reason = reason
+        capture.kill_timer = self._terminate(capture.process)
+    
+    def _terminate(self, process):
+        """先发送SIGTERM，等待一段时间后强制结束进程组，返回强制结束的定时器"""
+        grace = self.app.config.get('RUN_TERMINATE_GRACE_SECONDS', 10)
+        return terminate_process_group(process, grace, self.output_multiplexer.call_later)
+    
+    def cancel_run(self, run_id):
+        """取消运行
+        
+        排队中的运行直接从队列中移除；运行中的爬虫先收到SIGTERM，
+        RUN_TERMINATE_GRACE_SECONDS秒后仍未退出则强制结束整个进程组。
+        分片运行的父运行会取消其所有未结束的分片。
+        运行不在当前进程中时记录取消请求，由负责该运行的进程在下一次心跳时取消。
+        
+        Args:
+            run_id: 运行ID
+        
+        Returns:
+            bool: 运行存在且尚未结束时返回True
+        """
+        with self._dispatch_lock:
+            queued_run = self.run_queue.remove(run_id)
+            active = self.active_crawlers.get(run_id)
+            capture = None
+            if active is not None:
+                capture = active['capture']
+                active['cancelled'] = True
+        
+        if queued_run is not None:
+            self._cancel_queued_run(queued_run)
+            return True
+        if active is not None:
+            if active['agent_id']:
+                # 工作节点在下一次心跳时结束进程
+                with self.app.app_context():
+                    request_run_cancel(run_id)
+            elif capture is not None:
+                self.output_multiplexer.call_soon(lambda: self._stop_run(capture, 'cancelled'))
+            return True
+        
+        with self.app.app_context():
+            run = get_crawler_by_id(run_id)
+            if run is None or run['status'] not in ('running', 'queued'):
+                return False
+            if run['shard_count'] and not run['parent_run_id']:
+                for shard_run in get_shard_runs(run_id):
+                    if shard_run['status'] in ('running', 'queued'):
+                        self.cancel_run(shard_run['id'])
+                return True
+            request_run_cancel(run_id)
+        return True
+    
+    def _cancel_queued_run(self, run):
+        """将已从队列中移除的运行记录为已取消"""
+        with self.app.app_context():
+            if run['persisted']:
+                update_crawler_status(run['run_id'], 'cancelled')
+            else:
+                add_crawler_run(run['run_id'], run['crawler_id'], run['name'], 'cancelled', run['log_path'], run['run_type'], run['schedule_id'],
+                                self.worker_id, run['params'], run['parent_run_id'], run['shard_index'], run['shard_count'])
+            if run['parent_run_id']:
+                update_parent_run_status(run['parent_run_id'])
+        self.log_broadcaster.close(run['run_id'])
+        self.events.publish('finished', {
+            'run_id': run['run_id'],
+            'crawler_id': run['crawler_id'],
+            'status': 'cancelled',
+            'returncode': None
+        })
+    
+    def _on_beat(self):
+        """每次心跳后调用（在心跳线程中调用）"""
+        self._check_cancel_requests()
+        self._check_agent_runs()
+    
+    def _check_agent_runs(self):
+        """工作节点上的运行结束后，结果可能由其他进程接收，这里据数据库中的状态结束本进程的活动记录"""
+        with self._dispatch_lock:
+            run_ids = [run_id for run_id, r in self.active_crawlers.items() if r['agent_id']]
+        if not run_ids:
+            return
+        with self.app.app_context():
+            statuses = get_run_statuses(run_ids)
+        for run_id in run_ids:
+            if statuses.get(run_id, 'error') != 'running':
+                self._close_agent_summary(run_id)
+                self._finish_run(run_id)
+    
+    def agent_heartbeat(self, agent_id, name, host, capacity, crawlers, load=None):
+        """记录工作节点的心跳，返回分配给该节点的新运行和需要取消的运行
+        
+        Returns:
+            tuple: (待启动的运行列表, 需要取消的运行ID列表)
+        """
+        with self.app.app_context():
+            heartbeat_agent(agent_id, name, host, capacity, crawlers, load)
+            assignments, cancelled = take_agent_assignments(agent_id)
+        # 新节点上线或容量变化后，排队中的运行可能可以启动了
+        self.agents.invalidate()
+        self._dispatch()
+        return assignments, cancelled
+    
+    def append_agent_log(self, run_id, agent_id, offset, line_no, lines, progress=None):
+        """写入工作节点回传的日志
+        
+        节点在网络错误后会重发同一段日志，offset为该段日志在日志文件中的起始字节偏移，
+        已写入的部分会被跳过。
+        
+        Args:
+            run_id: 运行ID
+            agent_id: 节点ID
+            offset: 起始字节偏移
+            line_no: 该段日志之前已回传的行数
+            lines: 日志行（包含换行符）
+            progress: 爬虫上报的进度计数（节点已从日志中去除进度标记行）
+        
+        Returns:
+            int: 日志文件的当前大小，运行不存在或不属于该节点时返回None
+        """
+        with self.app.app_context():
+            run = get_crawler_by_id(run_id)
+        if run is None or run['agent_id'] != agent_id:
             return None
+        if progress:
+            with self.app.app_context():
+                update_run_progress(run_id, progress)
         
-        task_id = str(uuid.uuid4())
+        with self._agent_log_lock:
+            log_path = run['log_path']
+            size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+            data = ''.join(lines).encode('utf-8')
+            if offset > size or offset + len(data) <= size:
+                # 中间有缺失（由节点从返回的偏移重发）或已全部写入
+                return size
+            skip = size - offset
+            if skip:
+                data = data[skip:]
+                # 跳过已写入的行（节点按行回传，已写入的部分在行边界处结束）
+                skipped = 0
+                while lines and skipped + len(lines[0].encode('utf-8')) <= skip:
+                    skipped += len(lines[0].encode('utf-8'))
+                    lines = lines[1:]
+                    line_no += 1
+            with open(log_path, 'ab') as log_file:
+                log_file.write(data)
+            
+            # 只统计新写入的行，同一运行的摘要保留状态，跨两次回传的Traceback也能识别
+            summary = self._agent_summaries.get(run_id)
+            if summary is None:
+                summary = self._agent_summaries[run_id] = LogSummary()
+            for line in lines:
+                summary.feed(line)
+            delta = summary.take()
+            if run['status'] != 'running':
+                # 运行结束后才到达的重发日志，不再保留摘要
+                self._agent_summaries.pop(run_id, None)
         
-        # 根据不同的调度类型设置任务
-        if schedule_type == 'daily':
-            # 每天执行，time_value格式为 HH:MM
-            hour, minute = map(int, time_value.split(':'))
-            job = self.scheduler.add_job(
-                self.run_crawler,
-                'cron',
-                hour=hour,
-                minute=minute,
-                args=[crawler_id, 'scheduled', task_id]
-            )
-        elif schedule_type == 'interval':
-            # 间隔执行，time_value为小时数
-            hours = float(time_value)
-            job = self.scheduler.add_job(
-                self.run_crawler,
-                'interval',
-                hours=hours,
-                args=[crawler_id, 'scheduled', task_id]
-            )
+        self.log_broadcaster.publish(run_id, data.decode('utf-8', errors='replace'), size, size + len(data))
+        LOG_BYTES.inc(len(data), crawler_id=run['crawler_id'])
+        with self.app.app_context():
+            add_run_log_summary(run_id, delta)
+        if self.log_search_enabled:
+            rows = [(line.rstrip('\r\n'), run_id, line_no + i + 1) for i, line in enumerate(lines) if line.strip()]
+            with self.app.app_context():
+                index_log_lines(rows)
+        return size + len(data)
+    
+    def _close_agent_summary(self, run_id):
+        """工作节点上的运行结束后移除其日志摘要，保存尚未保存的统计"""
+        with self._agent_log_lock:
+            summary = self._agent_summaries.pop(run_id, None)
+        if summary is not None and summary.pending:
+            with self.app.app_context():
+                add_run_log_summary(run_id, summary.take())
+    
+    def finish_agent_run(self, run_id, agent_id, returncode, reason=None):
+        """记录工作节点上运行的结果
+        
+        Args:
+            run_id: 运行ID
+            agent_id: 节点ID
+            returncode: 进程退出码
+            reason: 节点主动结束进程的原因：'timeout'、'cancelled'或None
+        
+        Returns:
+            bool: 运行存在且属于该节点时返回True
+        """
+        with self.app.app_context():
+            run = get_crawler_by_id(run_id)
+        if run is None or run['agent_id'] != agent_id:
+            return False
+        if run['status'] != 'running':
+            # 重发的结果
+            return True
+        
+        self._close_agent_summary(run_id)
+        if reason == 'cancelled':
+            self._append_log(run_id, run['log_path'], "\n运行已取消")
+            status = 'cancelled'
+        elif reason == 'timeout':
+            self._append_log(run_id, run['log_path'], "\n错误: 爬虫运行超时")
+            status = 'timeout'
         else:
-            return None
+            status = 'completed' if returncode == 0 else 'error'
+        
+        with self.app.app_context():
+            update_crawler_status(run_id, status)
+        self._run_finished(run_id, run['crawler_id'], status, returncode)
         
-        # 保存任务信息到内存
-        self.scheduled_tasks[task_id] = {
-            'job': job,
+        with self._dispatch_lock:
+            active = self.active_crawlers.get(run_id)
+        if active is not None:
+            RUN_DURATION.observe(time.monotonic() - active['started'], crawler_id=run['crawler_id'])
+            self._finish_run(run_id)
+        elif run['parent_run_id']:
+            # 运行由其他进程分配，该进程在心跳时结束其活动记录
+            with self.app.app_context():
+                update_parent_run_status(run['parent_run_id'])
+        return True
+    
+    def _check_cancel_requests(self):
+        """处理其他进程记录的取消请求（在心跳线程中调用）"""
+        with self.app.app_context():
+            run_ids = get_cancel_requests(self.worker_id)
+        for run_id in run_ids:
+            with self._dispatch_lock:
+                found = run_id in self.active_crawlers or any(r['run_id'] == run_id for r in self.run_queue.runs())
+            if found:
+                self.cancel_run(run_id)
+                continue
+            # 运行已不在本进程中（如进程重启前遗留的记录），直接标记为已取消
+            with self.app.app_context():
+                run = get_crawler_by_id(run_id)
+                if run is None or run['status'] not in ('running', 'queued'):
+                    continue
+                update_crawler_status(run_id, 'cancelled')
+                if run['parent_run_id']:
+                    update_parent_run_status(run['parent_run_id'])
+            self.events.publish('finished', {
+                'run_id': run_id,
+                'crawler_id': run['crawler_id'],
+                'status': 'cancelled',
+                'returncode': None
+            })
+    
+    def _on_job_executed(self, event):
+        """定时任务执行后记录计划触发时间到实际开始运行的间隔（在调度器线程中调用）
+
+        被跳过或合并的触发在run_crawler中已取出开始时间，不计入延迟；执行出错的触发只清理记录。
+        """
+        started = self._schedule_started.pop(event.job_id, None)
+        if started is not None and event.exception is None and event.scheduled_run_time is not None:
+            SCHEDULE_LAG.observe(max(0.0, started - event.scheduled_run_time.timestamp()))
+    
+    def _save_samples(self, rows):
+        """保存资源采样记录（在采样线程中调用）"""
+        with self.app.app_context():
+            add_run_samples(rows)
+    
+    def _run_finished(self, run_id, crawler_id, status, returncode=None):
+        """记录运行结束的指标并发布finished事件（在运行状态写入数据库之后调用）"""
+        RUNS_FINISHED.inc(crawler_id=crawler_id, status=status)
+        self.events.publish('finished', {
+            'run_id': run_id,
             'crawler_id': crawler_id,
-            'crawler_name': crawler['name'],
-            'schedule_type': schedule_type,
-            'time_value': time_value
-        }
+            'status': status,
+            'returncode': returncode
+        })
+    
+    def _finish_run(self, run_id):
+        """运行结束后的清理"""
+        # 出错退出时可能还在采样
+        self.resource_sampler.unregister(run_id)
+        # 通知日志订阅者运行已结束
+        self.log_broadcaster.close(run_id)
+        # 从活动爬虫中移除
+        with self._dispatch_lock:
+            active = self.active_crawlers.pop(run_id, None)
+        # 分片运行的子运行结束后重新汇总父运行的状态
+        if active and active['parent_run_id']:
+            with self.app.app_context():
+                update_parent_run_status(active['parent_run_id'])
+        if active and active['agent_id']:
+            self.agents.release(active['agent_id'])
+        # 空出的并发名额交给排队中的运行（_finish_run可能在输出复用器线程中调用）
+        self._request_dispatch()
+    
+    def _append_log(self, run_id, log_path, text):
+        """向日志文件末尾追加一段文本，并推送给日志订阅者"""
+        offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        with open(log_path, 'a', encoding='utf-8', newline='') as log_file:
+            log_file.write(text)
+        self.log_broadcaster.publish(run_id, text, offset, offset + len(text.encode('utf-8')))
+    
+    def compress_finished_logs(self, batch_size=100):
+        """压缩已结束一段时间的运行日志（由调度器定时调用）
+        
+        压缩后的日志按块压缩并带有索引，查看日志时可以直接按偏移读取，不需要整体解压。
+        """
+        after_minutes = self.app.config.get('LOG_COMPRESS_AFTER_MINUTES', 10)
+        ended_before = datetime.datetime.now(pytz.timezone('Asia/Shanghai')) - datetime.timedelta(minutes=after_minutes)
+        
+        with self.app.app_context():
+            while True:
+                runs = get_uncompressed_runs(ended_before, batch_size)
+                for run in runs:
+                    self._compress_run_log(run['id'], run['log_path'])
+                if len(runs) < batch_size:
+                    break
+    
+    def _compress_run_log(self, run_id, log_path):
+        """压缩单次运行的日志，并将运行记录指向压缩文件"""
+        if is_compressed_log(log_path) or not os.path.exists(log_path):
+            mark_run_log_compressed(run_id, log_path)
+            return
+        
+        compressed_path = log_path + COMPRESSED_SUFFIX
+        try:
+            compress_log(log_path, compressed_path)
+        except Exception as e:
+            logging.error(f"压缩日志失败: {log_path}, 错误: {str(e)}")
+            return
+        
+        # 运行记录指向压缩文件后才删除原日志，查看日志的请求始终能读到其中之一
+        mark_run_log_compressed(run_id, compressed_path)
+        try:
+            os.remove(log_path)
+        except OSError as e:
+            logging.error(f"删除已压缩的日志失败: {log_path}, 错误: {str(e)}")
+    
+    def add_scheduled_task(self, crawler_id, schedule_type, time_value, jitter_seconds=None):
+        """添加定时任务
+        
+        Args:
+            crawler_id: 爬虫ID
+            schedule_type: 调度类型，'daily'、'interval'或'cron'
+            time_value: 时间设置
+            jitter_seconds: 最大随机抖动(秒)，None表示使用全局配置
+        
+        Returns:
+            str: 任务ID，爬虫不存在或调度类型不支持时返回None
+        
+        Raises:
+            ValueError: 时间设置无效
+        """
+        crawler = self.get_crawler_by_id(crawler_id)
+        if not crawler:
+            return None
+        
+        if schedule_type not in SCHEDULE_TYPES:
+            return None
+        
+        # 先创建一次触发器，校验时间设置
+        build_trigger(schedule_type, time_value, self.scheduler.timezone)
+        
+        task_id = str(uuid.uuid4())
         
         # 保存任务信息到数据库
         with self.app.app_context():
-            db_add_scheduled_task(task_id, crawler_id, crawler['name'], schedule_type, time_value)
+            db_add_scheduled_task(task_id, crawler_id, crawler['name'], schedule_type, time_value, jitter_seconds)
+            task = get_scheduled_task_by_id(task_id)
+        
+        # 任务写入共享的任务表，由调度进程执行
+        self._add_task_job(task)
         
         return task_id
     
     def remove_scheduled_task(self, task_id):
         """移除定时任务"""
-        if task_id in self.scheduled_tasks:
-            # 从调度器中移除
-            self.scheduled_tasks[task_id]['job'].remove()
-            # 从任务列表中移除
-            del self.scheduled_tasks[task_id]
-            # 从数据库中移除
-            with self.app.app_context():
-                db_remove_scheduled_task(task_id)
-            return True
-        return False
+        with self.app.app_context():
+            task = get_scheduled_task_by_id(task_id)
+        if task is None:
+            return False
+        
+        # 从调度器中移除（任务可能由其他进程添加，只存在于共享的任务表中）
+        try:
+            self.scheduler.remove_job(task_id)
+        except JobLookupError:
+            pass
+        # 从数据库中移除
+        with self.app.app_context():
+            db_remove_scheduled_task(task_id)
+        return True
+    
+    def spread_scheduled_tasks(self, task_ids, window_seconds):
+        """将多个定时任务的触发时间均匀错开到一个时间窗口内
+        
+        第i个任务（从0开始）的固定偏移为 i * window_seconds / 任务数。
+        
+        Args:
+            task_ids: 任务ID列表，按列表顺序分配偏移
+            window_seconds: 时间窗口(秒)
+        
+        Returns:
+            int: 更新的任务数
+        """
+        with self.app.app_context():
+            tasks = [get_scheduled_task_by_id(task_id) for task_id in task_ids]
+        tasks = [task for task in tasks if task is not None]
+        if not tasks:
+            return 0
+        
+        offsets = [(int(i * window_seconds / len(tasks)), task['id']) for i, task in enumerate(tasks)]
+        with self.app.app_context():
+            set_scheduled_task_offsets(offsets)
+        
+        for (offset, _), task in zip(offsets, tasks):
+            task['offset_seconds'] = offset
+            self._add_task_job(task)
+        return len(tasks)
     
     def get_scheduled_tasks(self):
-        """获取所有定时任务"""
+        """获取所有定时任务，next_run_times为接下来的几次触发时间"""
         # 从数据库获取任务列表
         with self.app.app_context():
-            return db_get_scheduled_tasks()
+            tasks = db_get_scheduled_tasks()
+        
+        for task in tasks:
+            job = self.scheduler.get_job(task['id'])
+            if job is None or job.next_run_time is None:
+                task['next_run_times'] = []
+            else:
+                task['next_run_times'] = next_fire_times(job.trigger, job.next_run_time)
+        return tasks
+    
+    def _add_task_job(self, task):
+        """将定时任务加入调度器，任务ID与定时任务ID相同（已存在时替换）"""
+        jitter = task['jitter_seconds']
+        if jitter is None:
+            jitter = self.app.config.get('SCHEDULE_JITTER_SECONDS', 0)
+        trigger = build_trigger(task['schedule_type'], task['time_value'], self.scheduler.timezone,
+                                offset=task['offset_seconds'], jitter=jitter)
+        
+        return self.scheduler.add_job(
+            run_scheduled_crawler,
+            trigger,
+            args=[task['crawler_id'], task['id']],
+            id=task['id'],
+            replace_existing=True
+        )
         
     def _load_scheduled_tasks_from_db(self):
-        """从数据库加载定时任务（在应用启动时调用）"""
+        """将数据库中尚未加入调度器的定时任务加入调度器（在应用启动时调用）
+        
+        调度器的任务表是持久化的，已有的任务保留其下一次执行时间，
+        进程重启期间错过的执行按misfire_grace_time和coalesce配置补执行。
+        """
         with self.app.app_context():
             tasks = db_get_scheduled_tasks()
             
         for task in tasks:
-            task_id = task['id']
-            crawler_id = task['crawler_id']
-            schedule_type = task['schedule_type']
-            time_value = task['time_value']
-            
-            # 根据不同的调度类型设置任务
-            if schedule_type == 'daily':
-                # 每天执行，time_value格式为 HH:MM
-                hour, minute = map(int, time_value.split(':'))
-                job = self.scheduler.add_job(
-                    self.run_crawler,
-                    'cron',
-                    hour=hour,
-                    minute=minute,
-                    args=[crawler_id, 'scheduled', task_id]
-                )
-            elif schedule_type == 'interval':
-                # 间隔执行，time_value为小时数
-                hours = float(time_value)
-                job = self.scheduler.add_job(
-                    self.run_crawler,
-                    'interval',
-                    hours=hours,
-                    args=[crawler_id, 'scheduled', task_id]
-                )
-            
-            # 保存任务信息到内存
-            self.scheduled_tasks[task_id] = {
-                'job': job,
-                'crawler_id': crawler_id,
-                'crawler_name': task['crawler_name'],
-                'schedule_type': schedule_type,
-                'time_value': time_value
-            }
\ No newline at end of file
+            if self.scheduler.get_job(task['id']) is not None:
+                continue
+            try:
+                self._add_task_job(task)
+            except ValueError as e:
+                logging.error(f"定时任务配置无效: {task['id']}, 错误: {str(e)}")
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+import logging
+
+
+class _Snapshot:
+    """某一时刻的爬虫配置快照，创建后不再修改"""
+
+    def __init__(self, crawlers, stamps, dir_stamp):
+        self.crawlers = crawlers  # 爬虫ID -> 爬虫信息
+        self.stamps = stamps  # 爬虫ID -> (目录mtime, config.json的mtime和大小)
+        self.dir_stamp = dir_stamp
+        self.ordered = [crawlers[crawler_id] for crawler_id in sorted(crawlers)]
+
+
+class CrawlerRegistry:
+    """爬虫配置的内存缓存
+
+    启动时扫描一次crawlers目录，之后通过比较目录和config.json的mtime判断是否需要重新加载，
+    只有发生变化的爬虫会重新解析配置。检查最多每check_interval秒进行一次，
+    查询直接读取当前快照，刷新时生成新快照并整体替换，读取方不会看到更新到一半的数据。
+    返回的爬虫信息字典被多个请求共享，调用方不应修改。
+    """
+
+    def __init__(self, crawlers_dir, check_interval=2.0):
+        """
+        Args:
+            crawlers_dir: 爬虫目录
+            check_interval: 两次检查文件变化的最小间隔(秒)
+        """
+        self.crawlers_dir = crawlers_dir
+        self.check_interval = check_interval
+        self._snapshot = _Snapshot({}, {}, None)
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, crawler_id):
+        """根据ID获取爬虫信息，不存在时返回None"""
+        self._ensure_fresh()
+        return self._snapshot.crawlers.get(crawler_id)
+
+    def all(self):
+        """获取所有爬虫信息（按ID排序）"""
+        self._ensure_fresh()
+        return list(self._snapshot.ordered)
+
+    def invalidate(self):
+        """使缓存失效，下次查询时重新检查文件变化"""
+        self._checked_at = None
+
+    def _ensure_fresh(self):
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return
+        with self._lock:
+            # 其他线程可能已经完成了检查
+            if self._checked_at is not checked_at:
+                return
+            try:
+                self._refresh()
+            except OSError as e:
+                logging.error(f"扫描爬虫目录失败: {str(e)}")
+            self._checked_at = time.monotonic()
+
+    def _refresh(self):
+        """检查文件变化，有变化时生成新快照"""
+        snapshot = self._snapshot
+        dir_stamp = os.stat(self.crawlers_dir).st_mtime_ns
+        if dir_stamp != snapshot.dir_stamp:
+            names = os.listdir(self.crawlers_dir)
+        else:
+            names = list(snapshot.stamps)
+
+        crawlers = {}
+        stamps = {}
+        changed = dir_stamp != snapshot.dir_stamp
+        for crawler_id in names:
+            crawler_path = os.path.join(self.crawlers_dir, crawler_id)
+            stamp = self._stamp(crawler_path)
+            if stamp is None:
+                changed = changed or crawler_id in snapshot.stamps
+                continue
+            stamps[crawler_id] = stamp
+            if snapshot.stamps.get(crawler_id) == stamp:
+                # 未发生变化，沿用已解析的配置
+                if crawler_id in snapshot.crawlers:
+                    crawlers[crawler_id] = snapshot.crawlers[crawler_id]
+                continue
+            changed = True
+            crawler = self._load_crawler(crawler_id, crawler_path)
+            if crawler is not None:
+                crawlers[crawler_id] = crawler
+
+        if changed:
+            self._snapshot = _Snapshot(crawlers, stamps, dir_stamp)
+
+    @staticmethod
+    def _stamp(crawler_path):
+        """计算爬虫目录的变化标记，不是爬虫目录时返回None"""
+        try:
+            dir_stat = os.stat(crawler_path)
+        except OSError:
+            return None
+        if not os.path.isdir(crawler_path):
+            return None
+        try:
+            config_stat = os.stat(os.path.join(crawler_path, 'config.json'))
+            config_stamp = (config_stat.st_mtime_ns, config_stat.st_size)
+        except OSError:
+            config_stamp = None
+        return (dir_stat.st_mtime_ns, config_stamp)
+
+    @staticmethod
+    def _load_crawler(crawler_id, crawler_path):
+        """解析爬虫配置，目录中缺少config.json或main.py时返回None"""
+        config_path = os.path.join(crawler_path, 'config.json')
+        main_path = os.path.join(crawler_path, 'main.py')
+        if not (os.path.exists(config_path) and os.path.exists(main_path)):
+            return None
+
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+
+            return {
+                'id': crawler_id,
+                'name': config.get('name', crawler_id),
+                'description': config.get('description', ''),
+                'version': config.get('version', '1.0'),
+                'author': config.get('author', '未知'),
+                'parameters': config.get('parameters', {}),
+                # 检查爬虫是否支持Web界面
+                'web_support': config.get('web_support', False),
+                'database': config.get('database', None),
+                'max_instances': config.get('max_instances', None),
+                'schedule_overlap': config.get('schedule_overlap', None),
+                # 默认的分片数，大于1时每次运行启动多个并行的分片
+                'shards': config.get('shards', 1),
+                # 资源限制：memory_mb、cpu_seconds、open_files、timeout_seconds和log_max_mb
+                'limits': config.get('limits', {}),
+                # 启动方式：subprocess每次启动新的解释器，zygote由预导入模块的进程fork
+                'launch_mode': config.get('launch_mode', 'subprocess'),
+                'preload_modules': config.get('preload_modules', [])
+            }
+        except Exception as e:
+            logging.error(f"读取爬虫配置失败: {crawler_id}, 错误: {str(e)}")
+            return None
@@ -0,0 +1,132 @@
+import os
+import threading
+import logging
+import importlib.util
+from flask import Flask
+
+
+class _WebApp:
+    """已加载的爬虫Web界面"""
+
+    def __init__(self, stamp, wsgi_app):
+        self.stamp = stamp  # 加载时web.py和config.json的变化标记
+        self.wsgi_app = wsgi_app  # 加载失败时为None
+
+
+class CrawlerWebDispatcher:
+    """按需加载爬虫Web界面的WSGI中间件
+
+    /crawler/<爬虫ID>/下的请求交给该爬虫web.py中create_blueprint创建的蓝图处理。
+    蓝图在第一次访问时才导入并注册到一个独立的Flask应用上，之后缓存；
+    每次访问时比较web.py和config.json的mtime，发生变化后重新导入，新添加的爬虫也不需要重启。
+    独立应用复制了主应用的URL规则（包括static）、模板全局变量和过滤器，爬虫模板可以继承layout.html、
+    用url_for生成主应用的地址，渲染结果与注册到主应用时相同。其他请求直接交给主应用。
+    """
+
+    def __init__(self, wsgi_app, app, crawlers_dir, registry, prefix='/crawler/'):
+        """
+        Args:
+            wsgi_app: 主应用的WSGI入口
+            app: 主Flask应用，爬虫Web界面沿用其配置、模板目录和应用上下文清理函数
+            crawlers_dir: 爬虫目录
+            registry: 爬虫配置缓存（CrawlerRegistry）
+            prefix: 爬虫Web界面的URL前缀
+        """
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.crawlers_dir = crawlers_dir
+        self.registry = registry
+        self.prefix = prefix
+        self._apps = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.prefix):
+            crawler_id = path[len(self.prefix):].split('/', 1)[0]
+            web_app = self._get_app(crawler_id) if crawler_id else None
+            if web_app is not None:
+                return web_app(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def loaded(self):
+        """已加载Web界面的爬虫ID"""
+        return sorted(crawler_id for crawler_id, web_app in self._apps.items() if web_app.wsgi_app is not None)
+
+    def _get_app(self, crawler_id):
+        """获取爬虫的Web界面，未加载或文件已变化时加载，不支持Web界面时返回None"""
+        crawler = self.registry.get(crawler_id)
+        if crawler is None or not crawler.get('web_support', False):
+            return None
+        crawler_path = os.path.join(self.crawlers_dir, crawler_id)
+        stamp = self._stamp(crawler_path)
+        if stamp is None:
+            return None
+
+        web_app = self._apps.get(crawler_id)
+        if web_app is None or web_app.stamp != stamp:
+            with self._lock:
+                # 其他线程可能已经完成了加载
+                web_app = self._apps.get(crawler_id)
+                if web_app is None or web_app.stamp != stamp:
+                    web_app = self._apps[crawler_id] = _WebApp(stamp, self._load(crawler_id, crawler_path))
+        return web_app.wsgi_app
+
+    @staticmethod
+    def _stamp(crawler_path):
+        """web.py和config.json的变化标记，没有web.py时返回None"""
+        stamp = []
+        for name in ('web.py', 'config.json'):
+            try:
+                stat = os.stat(os.path.join(crawler_path, name))
+            except OSError:
+                return None
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    def _share_main_app(self, web_app):
+        """让爬虫的Flask应用沿用主应用的URL规则、模板环境和清理函数"""
+        # 复制主应用的URL规则（static由static_folder创建），url_for('index')等可以生成主应用的地址
+        for rule in self.app.url_map.iter_rules():
+            if rule.endpoint == 'static':
+                continue
+            web_app.url_map.add(rule.empty())
+            web_app.view_functions[rule.endpoint] = self.app.view_functions[rule.endpoint]
+
+        # 主应用注册的模板过滤器、全局变量和上下文处理器（url_for、request等以爬虫应用自己的为准）
+        web_app.jinja_env.filters.update(self.app.jinja_env.filters)
+        web_app.jinja_env.tests.update(self.app.jinja_env.tests)
+        for name, value in self.app.jinja_env.globals.items():
+            web_app.jinja_env.globals.setdefault(name, value)
+        for key, processors in self.app.template_context_processors.items():
+            shared = web_app.template_context_processors.setdefault(key, [])
+            shared.extend(processor for processor in processors if processor not in shared)
+        web_app.teardown_appcontext_funcs.extend(self.app.teardown_appcontext_funcs)
+
+    def _load(self, crawler_id, crawler_path):
+        """导入web.py并创建只包含该爬虫蓝图的Flask应用，失败时返回None"""
+        try:
+            # 动态导入web.py模块
+            spec = importlib.util.spec_from_file_location(
+                f"crawler_{crawler_id}_web", os.path.join(crawler_path, 'web.py'))
+            web_module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(web_module)
+            if not hasattr(web_module, 'create_blueprint'):
+                logging.error(f"爬虫Web界面缺少create_blueprint: {crawler_id}")
+                return None
+
+            web_app = Flask(
+                f"crawler_{crawler_id}",
+                root_path=self.app.root_path,
+                template_folder=self.app.template_folder,
+                static_folder=self.app.static_folder,
+                static_url_path=self.app.static_url_path
+            )
+            web_app.config.update(self.app.config)
+            self._share_main_app(web_app)
+            web_app.register_blueprint(web_module.create_blueprint(crawler_id, crawler_path))
+            logging.info(f"已加载爬虫Web界面: {crawler_id}")
+            return web_app
+        except Exception as e:
+            logging.error(f"加载爬虫Web界面失败: {crawler_id}, 错误: {str(e)}")
+            return None
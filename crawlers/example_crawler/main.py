@@ -5,6 +5,32 @@ import sys
 import os
 import sqlite3
 
+try:
+    from crawler_sdk import BatchWriter, connect, report_progress
+except ImportError:
+    # 不通过爬虫管理系统运行时（如直接执行python main.py）没有SDK，逐行写入SQLite
+    def connect(db_path):
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def report_progress(**counters):
+        pass
+
+    class BatchWriter:
+        def __init__(self, db_path, table, columns):
+            self.rows_written = 0
+            self._conn = connect(db_path)
+            self._sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        def add(self, row):
+            with self._conn:
+                self._conn.execute(self._sql, row)
+            self.rows_written += 1
+
+        def close(self):
+            self._conn.close()
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -13,7 +39,12 @@ logging.basicConfig(
 )
 
 def main():
-    logging.info("示例爬虫开始运行")
+    # 运行参数和分片信息由爬虫管理系统通过环境变量传入
+    task_count = int(os.environ.get('CRAWLER_PARAM_TASK_COUNT', '10'))
+    shard_index = int(os.environ.get('CRAWLER_SHARD_INDEX', '0'))
+    shard_count = int(os.environ.get('CRAWLER_SHARD_COUNT', '1'))
+    
+    logging.info(f"示例爬虫开始运行（分片 {shard_index + 1}/{shard_count}）")
     print("print示例输出")
     
     # 获取当前目录
@@ -23,8 +54,8 @@ def main():
     db_path = os.path.join(current_dir, 'crawler_data.db')
     logging.info(f"数据库路径: {db_path}")
     
-    # 创建数据库连接
-    conn = sqlite3.connect(db_path)
+    # 创建数据库连接（WAL模式）
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     # 创建表（如果不存在）
@@ -38,9 +69,14 @@ def main():
     )
     ''')
     conn.commit()
+    conn.close()
+    
+    # 数据先缓冲，攒够一批或每隔几秒在一个事务中写入，写入的行数由管理系统记录在运行历史中
+    writer = BatchWriter(db_path, 'crawler_data', ['title', 'url', 'content'])
     
     # 模拟爬虫工作
-    for i in range(10):
+    # 每个分片只处理序号对分片数取余等于分片序号的任务
+    for i in range(shard_index, task_count, shard_count):
         logging.info(f"正在处理第 {i+1} 个任务")
         time.sleep(random.uniform(0.5, 2))
         
@@ -55,18 +91,16 @@ def main():
             content = f"这是第 {i+1} 个爬取的内容，包含一些随机文本: {random.randint(1000, 9999)}"
             
             try:
-                cursor.execute(
-                    "INSERT INTO crawler_data (title, url, content) VALUES (?, ?, ?)",
-                    (title, url, content)
-                )
-                conn.commit()
+                writer.add((title, url, content))
                 logging.info(f"已保存数据: {title}")
             except Exception as e:
                 logging.error(f"保存数据失败: {str(e)}")
+        
+        report_progress(tasks=1)
     
-    # 关闭数据库连接
-    conn.close()
-    logging.info("示例爬虫运行完成")
+    # 写入剩余的数据
+    writer.close()
+    logging.info(f"示例爬虫运行完成，共写入 {writer.rows_written} 条数据")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, jsonify, request
 import os
 import sqlite3
 import json
+from database.crawler_data import get_data_source, data_response
 
 
 # 创建蓝图
@@ -19,6 +20,9 @@ def create_blueprint(crawler_id, crawler_path):
         config = json.load(f)
 
     # 获取数据库路径
+    database = config.get('database', 'crawler_data.db')
+    db_path = os.path.join(crawler_path, database)
+    data_source = get_data_source(crawler_path, database)
 
     # 创建蓝图
     blueprint = Blueprint(
@@ -36,20 +40,10 @@ def create_blueprint(crawler_id, crawler_path):
                                crawler_name=config.get('name', crawler_id),
                                crawler_id=crawler_id)
 
-    # 路由：获取爬虫数据
+    # 路由：分页获取爬虫数据，format=ndjson/csv时流式导出
     @blueprint.route('/data')
     def get_data():
-        conn = sqlite3.connect(os.path.join(crawler_path, "crawler_data.db"))
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM crawler_data ORDER BY created_at DESC")
-        rows = cursor.fetchall()
-
-        data = [dict(row) for row in rows]
-        conn.close()
-
-        return jsonify(data)
+        return data_response(data_source, 'crawler_data', request.args, default_order='id')
 
     # 路由：添加爬虫数据（用于测试）
     @blueprint.route('/add', methods=['POST'])
@@ -61,7 +55,7 @@ def create_blueprint(crawler_id, crawler_path):
         if not all([title, url]):
             return jsonify({'status': 'error', 'message': '标题和URL不能为空'}), 400
 
-        conn = sqlite3.connect(os.path.join(crawler_path, "crawler_data.db"))
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
         cursor.execute(
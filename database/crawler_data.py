@@ -0,0 +1,370 @@
+"""爬虫数据库的只读查询
+
+爬虫的Web界面通过这里读取爬虫自己的数据库（config.json中的database字段）。
+每个数据库文件共用一个只读连接池；查询使用键集分页和列投影，
+导出时按键集逐批读取并以NDJSON或CSV流式输出，不会把整张表读入内存。
+"""
+import base64
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import urllib.request
+from flask import Response, jsonify, stream_with_context
+from database.models import ConnectionPool
+
+# 每页默认和最多返回的行数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+# 导出时每批读取的行数
+EXPORT_BATCH_SIZE = 500
+
+# 过滤条件：参数名为"列名"或"列名__操作"
+FILTER_OPERATORS = {
+    'eq': '=',
+    'ne': '!=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'like': 'LIKE',
+}
+# 查询参数中不作为过滤条件的名字
+RESERVED_ARGS = ('limit', 'cursor', 'fields', 'order_by', 'order', 'format')
+# 导出格式 -> MIME类型
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def connect_readonly(path):
+    """以只读方式打开爬虫数据库
+
+    使用mode=ro打开并设置query_only，Web界面的查询不会修改数据库，也不会创建不存在的数据库文件。
+    """
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro"
+    db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA query_only=ON")
+    db.execute("PRAGMA busy_timeout=5000")
+    return db
+
+
+def encode_cursor(key):
+    """将分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(key, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    """解析游标字符串，格式错误时抛出ValueError"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('无效的分页游标')
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError('无效的分页游标')
+    return key
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _json_value(value):
+    # BLOB列按base64输出
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    return value
+
+
+class _Query:
+    """校验过的查询：投影的列、过滤条件和排序键"""
+
+    def __init__(self, table, columns, conditions, params, order_column, descending):
+        self.table = table
+        self.columns = columns
+        self.conditions = conditions
+        self.params = params
+        # 排序列为None时只按rowid排序
+        self.order_column = order_column
+        self.descending = descending
+
+    def sql(self, cursor_key, limit):
+        """生成一页的查询语句
+
+        排序键为(排序列, rowid)，从游标位置继续时用行值比较定位起点，排序列上有索引时每一页都不需要扫描前面的行。
+        """
+        conditions = list(self.conditions)
+        params = list(self.params)
+        comparison = '<' if self.descending else '>'
+        direction = 'DESC' if self.descending else 'ASC'
+        if self.order_column is None:
+            key_columns = 'rowid'
+            order = f"rowid {direction}"
+        else:
+            key_columns = f"{_quote(self.order_column)}, rowid"
+            order = f"{_quote(self.order_column)} {direction}, rowid {direction}"
+        if cursor_key is not None:
+            conditions.append(f"({key_columns}) {comparison} ({', '.join('?' * len(cursor_key))})")
+            params.extend(cursor_key)
+
+        select = ', '.join(_quote(column) for column in self.columns)
+        if self.order_column is not None:
+            select += f", {_quote(self.order_column)} AS __order_key__"
+        sql = f"SELECT {select}, rowid AS __row_key__ FROM {_quote(self.table)}"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+    def key(self, row):
+        """一行的排序键，用于生成下一页的游标"""
+        if self.order_column is None:
+            return [row['__row_key__']]
+        return [row['__order_key__'], row['__row_key__']]
+
+
+class CrawlerDataSource:
+    """一个爬虫数据库的只读访问
+
+    表名、列名和排序列都按数据库中的实际结构校验后再拼入SQL，过滤条件的值通过参数绑定传入。
+    """
+
+    def __init__(self, path, max_idle=4):
+        self.path = path
+        self.pool = ConnectionPool(path, max_idle, connect=connect_readonly)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _execute(self, sql, params=()):
+        db = self.pool.acquire()
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            self.pool.release(db)
+
+    def table_columns(self, table):
+        """返回表的列名和rowid别名列（INTEGER PRIMARY KEY），表不存在时返回([], None)"""
+        rows = self._execute(f"PRAGMA table_info({_quote(table)})")
+        pk_columns = [row for row in rows if row['pk']]
+        rowid_alias = None
+        if len(pk_columns) == 1 and pk_columns[0]['type'].upper() == 'INTEGER':
+            rowid_alias = pk_columns[0]['name']
+        return [row['name'] for row in rows], rowid_alias
+
+    def _prepare(self, table, fields=None, filters=None, order_by=None, descending=True):
+        """校验查询参数
+
+        Returns:
+            _Query: 表不存在时返回None
+
+        Raises:
+            ValueError: 列名、过滤操作或排序列无效
+        """
+        if not self.exists():
+            return None
+        columns, rowid_alias = self.table_columns(table)
+        if not columns:
+            return None
+
+        if fields:
+            unknown = [field for field in fields if field not in columns]
+            if unknown:
+                raise ValueError(f"未知的列: {', '.join(unknown)}")
+            selected = list(dict.fromkeys(fields))
+        else:
+            selected = columns
+
+        conditions = []
+        params = []
+        for name, value in (filters or {}).items():
+            column, _, operator = name.partition('__')
+            operator = operator or 'eq'
+            if column not in columns:
+                raise ValueError(f"未知的过滤列: {column}")
+            if operator not in FILTER_OPERATORS:
+                raise ValueError(f"不支持的过滤操作: {operator}")
+            if operator == 'like':
+                # 按包含匹配，转义用户输入中的通配符
+                value = '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                conditions.append(f"{_quote(column)} LIKE ? ESCAPE '\\'")
+            else:
+                conditions.append(f"{_quote(column)} {FILTER_OPERATORS[operator]} ?")
+            params.append(value)
+
+        if order_by in (None, 'rowid', rowid_alias):
+            order_column = None
+        elif order_by in columns:
+            order_column = order_by
+        else:
+            raise ValueError(f"未知的排序列: {order_by}")
+
+        return _Query(table, selected, conditions, params, order_column, descending)
+
+    def _fetch(self, query, cursor_key, limit):
+        """读取一页，返回(行列表, 下一页的排序键)"""
+        sql, params = query.sql(cursor_key, limit + 1)
+        rows = self._execute(sql, params)
+        next_key = query.key(rows[limit - 1]) if len(rows) > limit else None
+        data = [{column: _json_value(row[column]) for column in query.columns} for row in rows[:limit]]
+        return data, next_key
+
+    def query(self, table, fields=None, filters=None, order_by=None, descending=True,
+              limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """分页查询
+
+        Args:
+            table: 表名
+            fields: 返回的列，None表示全部列
+            filters: 过滤条件，{"列名" 或 "列名__操作": 值}，操作见FILTER_OPERATORS
+            order_by: 排序列，默认按rowid排序；排序列不应包含NULL
+            descending: 是否倒序
+            limit: 每页行数
+            cursor: 上一页返回的游标
+
+        Returns:
+            tuple: (行列表, 下一页的游标)，没有下一页时游标为None
+
+        Raises:
+            ValueError: 参数无效
+        """
+        query = self._prepare(table, fields, filters, order_by, descending)
+        if query is None:
+            return [], None
+        cursor_key = decode_cursor(cursor, 1 if query.order_column is None else 2) if cursor else None
+        rows, next_key = self._fetch(query, cursor_key, limit)
+        return rows, encode_cursor(next_key) if next_key is not None else None
+
+    def export(self, table, fields=None, filters=None, order_by=None, descending=True,
+               batch_size=EXPORT_BATCH_SIZE):
+        """逐批读取全部符合条件的行
+
+        参数在调用时校验，行在迭代时才读取。每批是一次独立的键集查询，
+        批与批之间不占用连接，也不会长时间持有读锁阻塞爬虫写入。
+
+        Returns:
+            tuple: (列名列表, 行的迭代器)
+
+        Raises:
+            ValueError: 参数无效
+        """
+        query = self._prepare(table, fields, filters, order_by, descending)
+        if query is None:
+            return list(fields or []), iter(())
+
+        def rows():
+            cursor_key = None
+            while True:
+                batch, cursor_key = self._fetch(query, cursor_key, batch_size)
+                yield from batch
+                if cursor_key is None:
+                    return
+
+        return query.columns, rows()
+
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def get_data_source(crawler_path, database):
+    """获取爬虫数据库对应的数据源，同一个数据库文件共用一个连接池
+
+    Args:
+        crawler_path: 爬虫目录
+        database: config.json中的database字段，相对于爬虫目录
+    """
+    path = os.path.abspath(os.path.join(crawler_path, database))
+    with _sources_lock:
+        source = _sources.get(path)
+        if source is None:
+            source = _sources[path] = CrawlerDataSource(path)
+        return source
+
+
+def parse_query_args(args):
+    """从请求参数中解析查询条件
+
+    支持limit、cursor、fields（逗号分隔）、order_by、order（asc/desc），其余参数作为过滤条件。
+
+    Returns:
+        dict: query()的关键字参数
+    """
+    fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return {
+        'fields': fields or None,
+        'filters': {name: value for name, value in args.items() if name not in RESERVED_ARGS},
+        'order_by': args.get('order_by') or None,
+        'descending': args.get('order', 'desc').lower() != 'asc',
+        'limit': min(max(limit, 1), MAX_PAGE_SIZE),
+        'cursor': args.get('cursor') or None,
+    }
+
+
+def _ndjson_lines(rows, batch_size):
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(row, ensure_ascii=False) + '\n')
+        if len(buffer) >= batch_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_lines(columns, rows, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+        count += 1
+        if count >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    yield buffer.getvalue()
+
+
+def data_response(source, table, args, default_order=None):
+    """按请求参数返回一页数据或流式导出
+
+    format参数为ndjson或csv时导出全部符合条件的行（忽略limit和cursor），否则返回一页JSON：
+    {"rows": [...], "next_cursor": "..."}。
+
+    Args:
+        source: CrawlerDataSource
+        table: 表名
+        args: request.args
+        default_order: 未指定order_by时的排序列
+    """
+    options = parse_query_args(args)
+    options['order_by'] = options['order_by'] or default_order
+    fmt = args.get('format', 'json')
+    try:
+        if fmt == 'json':
+            rows, next_cursor = source.query(table, **options)
+            return jsonify({'rows': rows, 'next_cursor': next_cursor})
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        del options['limit'], options['cursor']
+        columns, rows = source.export(table, **options)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if fmt == 'csv':
+        body = _csv_lines(columns, rows, EXPORT_BATCH_SIZE)
+    else:
+        body = _ndjson_lines(rows, EXPORT_BATCH_SIZE)
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{table}.{fmt}"'
+    return response
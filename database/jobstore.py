@@ -0,0 +1,124 @@
+import pickle
+import sqlite3
+from contextlib import contextmanager
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+
+class SQLiteJobStore(BaseJobStore):
+    """将APScheduler的任务保存在SQLite数据库中
+
+    任务表由数据库迁移创建（apscheduler_jobs），结构与APScheduler自带的SQLAlchemyJobStore相同。
+    多个进程共用同一个任务表，任务只由持有调度租约的进程执行。
+
+    保存的任务通过模块路径引用要执行的函数，只能使用模块级函数，不能使用绑定方法。
+    """
+
+    def __init__(self, path, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        """
+        Args:
+            path: 数据库文件路径
+            pickle_protocol: 序列化任务使用的pickle协议
+        """
+        super().__init__()
+        self.path = path
+        self.pickle_protocol = pickle_protocol
+
+    @contextmanager
+    def _connection(self):
+        """从连接池取出连接，正常结束时提交"""
+        # 避免循环导入
+        from database.models import _get_pool
+
+        pool = _get_pool(self.path)
+        db = pool.acquire()
+        try:
+            yield db
+            db.commit()
+        finally:
+            pool.release(db)
+
+    def lookup_job(self, job_id):
+        with self._connection() as db:
+            row = db.execute("SELECT job_state FROM apscheduler_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row['job_state']) if row else None
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        return self._get_jobs("WHERE next_run_time <= ?", (timestamp,))
+
+    def get_next_run_time(self):
+        with self._connection() as db:
+            row = db.execute(
+                "SELECT next_run_time FROM apscheduler_jobs WHERE next_run_time IS NOT NULL "
+                "ORDER BY next_run_time LIMIT 1"
+            ).fetchone()
+        return utc_timestamp_to_datetime(row['next_run_time']) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        with self._connection() as db:
+            try:
+                db.execute(
+                    "INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time),
+                     pickle.dumps(job.__getstate__(), self.pickle_protocol))
+                )
+            except sqlite3.IntegrityError:
+                raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self._connection() as db:
+            cursor = db.execute(
+                "UPDATE apscheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (datetime_to_utc_timestamp(job.next_run_time),
+                 pickle.dumps(job.__getstate__(), self.pickle_protocol), job.id)
+            )
+            if cursor.rowcount == 0:
+                raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._connection() as db:
+            cursor = db.execute("DELETE FROM apscheduler_jobs WHERE id = ?", (job_id,))
+            if cursor.rowcount == 0:
+                raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._connection() as db:
+            db.execute("DELETE FROM apscheduler_jobs")
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where='', params=()):
+        jobs = []
+        failed_job_ids = []
+        with self._connection() as db:
+            rows = db.execute(f"SELECT id, job_state FROM apscheduler_jobs {where} ORDER BY next_run_time", params).fetchall()
+            for row in rows:
+                try:
+                    jobs.append(self._reconstitute_job(row['job_state']))
+                except BaseException:
+                    self._logger.exception('无法恢复任务"%s"，已删除', row['id'])
+                    failed_job_ids.append(row['id'])
+
+            # 删除无法恢复的任务
+            if failed_job_ids:
+                db.executemany("DELETE FROM apscheduler_jobs WHERE id = ?", [(job_id,) for job_id in failed_job_ids])
+
+        return jobs
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} (path={self.path})>'
@@ -1,61 +1,327 @@
 import sqlite3
 import os
 import datetime
+import threading
+import json
+import base64
+import html
+import logging
+import time
+import pytz
 from flask import current_app, g
+from database.writer import get_writer, sync_writes
+
+# 新建连接时应用的PRAGMA
+# WAL模式下读写互不阻塞；synchronous=NORMAL在WAL模式下只在检查点时同步磁盘
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def _create_log_search_table(db):
+    """创建日志全文索引表
+    
+    优先使用trigram分词器，支持任意子串（包括中文）搜索；
+    SQLite版本不支持时退回unicode61分词器，SQLite未编译FTS5时不创建索引。
+    """
+    for tokenizer in ('trigram', 'unicode61'):
+        try:
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS log_search USING fts5("
+                "line, run_id UNINDEXED, line_no UNINDEXED, "
+                f"tokenize='{tokenizer}')"
+            )
+            return
+        except sqlite3.OperationalError as e:
+            error = e
+    logging.warning(f"SQLite不支持FTS5，日志搜索不可用: {str(error)}")
+
+
+# 数据库结构迁移，按顺序执行，已执行到的版本号记录在PRAGMA user_version中
+# 每一项为SQL语句列表，或接收数据库连接的函数
+MIGRATIONS = [
+    # 1: 初始表结构
+    [
+        # 创建爬虫运行记录表
+        """
+        CREATE TABLE IF NOT EXISTS crawler_runs (
+            id TEXT PRIMARY KEY,
+            crawler_id TEXT NOT NULL,
+            crawler_name TEXT NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP,
+            status TEXT NOT NULL,
+            log_path TEXT NOT NULL,
+            run_type TEXT DEFAULT 'manual',
+            schedule_id TEXT
+        )
+        """,
+        # 创建定时任务表
+        """
+        CREATE TABLE IF NOT EXISTS scheduled_tasks (
+            id TEXT PRIMARY KEY,
+            crawler_id TEXT NOT NULL,
+            crawler_name TEXT NOT NULL,
+            schedule_type TEXT NOT NULL,
+            time_value TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+        """,
+    ],
+    # 2: 运行记录索引（状态查询、历史记录排序）
+    [
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_status ON crawler_runs(status)",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_start_time ON crawler_runs(start_time)",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_crawler_start ON crawler_runs(crawler_id, start_time)",
+    ],
+    # 3: 历史记录按(start_time, id)分页，索引需要包含id列
+    [
+        "DROP INDEX IF EXISTS idx_crawler_runs_status",
+        "DROP INDEX IF EXISTS idx_crawler_runs_start_time",
+        "DROP INDEX IF EXISTS idx_crawler_runs_crawler_start",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_start ON crawler_runs(start_time, id)",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_status_start ON crawler_runs(status, start_time, id)",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_crawler_start ON crawler_runs(crawler_id, start_time, id)",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_schedule_start ON crawler_runs(schedule_id, start_time, id)",
+    ],
+    # 4: 日志压缩标记，0表示日志尚未处理，1表示已压缩（或日志文件已不存在）
+    [
+        "ALTER TABLE crawler_runs ADD COLUMN log_compressed INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_uncompressed ON crawler_runs(end_time) WHERE log_compressed = 0",
+    ],
+    # 5: 日志全文索引
+    _create_log_search_table,
+    # 6: 运行的资源占用采样和汇总
+    [
+        """
+        CREATE TABLE IF NOT EXISTS run_samples (
+            run_id TEXT NOT NULL,
+            elapsed REAL NOT NULL,
+            cpu_seconds REAL NOT NULL,
+            rss INTEGER NOT NULL,
+            read_bytes INTEGER NOT NULL,
+            write_bytes INTEGER NOT NULL,
+            threads INTEGER NOT NULL,
+            PRIMARY KEY (run_id, elapsed)
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE crawler_runs ADD COLUMN cpu_seconds REAL",
+        "ALTER TABLE crawler_runs ADD COLUMN peak_rss INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN avg_rss INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN io_read_bytes INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN io_write_bytes INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN peak_threads INTEGER",
+    ],
+    # 7: 多进程部署时的调度：持久化的调度任务、进程心跳和调度进程租约
+    [
+        """
+        CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+            id TEXT PRIMARY KEY,
+            next_run_time REAL,
+            job_state BLOB NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_apscheduler_jobs_next_run_time ON apscheduler_jobs(next_run_time)",
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_workers (
+            id TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_leader (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            worker_id TEXT NOT NULL,
+            heartbeat REAL NOT NULL
+        )
+        """,
+        # 运行所属的进程，进程退出后由调度进程接管其排队中的运行
+        "ALTER TABLE crawler_runs ADD COLUMN worker_id TEXT",
+    ],
+    # 8: 定时任务的固定偏移和随机抖动(秒)，jitter_seconds为NULL时使用全局配置
+    [
+        "ALTER TABLE scheduled_tasks ADD COLUMN offset_seconds INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE scheduled_tasks ADD COLUMN jitter_seconds INTEGER",
+    ],
+    # 9: 运行参数（JSON）和分片运行，分片的子运行通过parent_run_id指向汇总状态的父运行
+    [
+        "ALTER TABLE crawler_runs ADD COLUMN parameters TEXT",
+        "ALTER TABLE crawler_runs ADD COLUMN parent_run_id TEXT",
+        "ALTER TABLE crawler_runs ADD COLUMN shard_index INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN shard_count INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_parent ON crawler_runs(parent_run_id, shard_index) WHERE parent_run_id IS NOT NULL",
+    ],
+    # 10: 取消请求，运行不在处理请求的进程中时，由负责该运行的进程在心跳时取消
+    [
+        "ALTER TABLE crawler_runs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 11: 工作节点（agent）：节点心跳、待节点领取的运行，以及运行所在的节点
+    [
+        """
+        CREATE TABLE IF NOT EXISTS agents (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            host TEXT,
+            capacity INTEGER NOT NULL,
+            crawlers TEXT NOT NULL,
+            load REAL,
+            heartbeat REAL NOT NULL,
+            registered_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS agent_assignments (
+            run_id TEXT PRIMARY KEY,
+            agent_id TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_agent_assignments_agent ON agent_assignments(agent_id)",
+        "ALTER TABLE crawler_runs ADD COLUMN agent_id TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_crawler_runs_agent ON crawler_runs(agent_id) WHERE status = 'running'",
+    ],
+    # 12: 爬虫上报的进度计数
+    [
+        "ALTER TABLE crawler_runs ADD COLUMN rows_written INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN progress TEXT",
+    ],
+    # 13: 采集日志时统计的日志摘要
+    [
+        "ALTER TABLE crawler_runs ADD COLUMN log_lines INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN log_bytes INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN warning_count INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN error_count INTEGER",
+        "ALTER TABLE crawler_runs ADD COLUMN last_error TEXT",
+    ],
+]
+
+# 运行资源汇总的列
+RESOURCE_COLUMNS = ('cpu_seconds', 'peak_rss', 'avg_rss', 'io_read_bytes', 'io_write_bytes', 'peak_threads')
+# 日志摘要中按增量累加的计数列
+LOG_SUMMARY_COUNTERS = ('log_lines', 'log_bytes', 'warning_count', 'error_count')
+
+
+class ConnectionPool:
+    """SQLite连接池
+
+    连接在应用上下文中被独占使用，上下文结束时归还，
+    请求线程和后台线程都可以复用已建立的连接，避免每次重新连接和设置PRAGMA。
+    """
+
+    def __init__(self, path, max_idle=8, connect=None):
+        """
+        Args:
+            path: 数据库文件路径
+            max_idle: 最多保留的空闲连接数
+            connect: 新建连接的函数connect(path)，默认为connect_db
+        """
+        self.path = path
+        self.max_idle = max_idle
+        self.connect = connect or connect_db
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取出一个空闲连接，没有时新建"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.connect(self.path)
+
+    def release(self, db):
+        """归还连接，空闲连接过多时直接关闭"""
+        if db.in_transaction:
+            db.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(db)
+                return
+        db.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(path):
+    """获取数据库文件对应的连接池"""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def connect_db(path):
+    """新建数据库连接并应用PRAGMA"""
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False  # 连接由连接池在线程间传递，同一时间只有一个线程使用
+    )
+    db.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        db.execute(pragma)
+    
+    # 确保数据库使用Asia/Shanghai时区
+    db.execute("PRAGMA timezone='Asia/Shanghai'")
+    return db
 
 def get_db():
-    """获取数据库连接"""
+    """获取数据库连接（同一应用上下文中复用同一个连接）"""
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
-        
-        # 确保数据库使用Asia/Shanghai时区
-        g.db.execute("PRAGMA timezone='Asia/Shanghai'")
+        g.db = _get_pool(current_app.config['DATABASE']).acquire()
     return g.db
 
 def close_db(e=None):
-    """关闭数据库连接"""
+    """将数据库连接归还连接池"""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        _get_pool(current_app.config['DATABASE']).release(db)
+
+def _get_writer():
+    """获取当前数据库的写入线程"""
+    return get_writer(current_app.config['DATABASE'])
+
+def _sync_writes():
+    """等待已提交给写入线程的写操作落库，保证读到最新的运行记录"""
+    sync_writes(current_app.config['DATABASE'])
 
 def init_db():
-    """初始化数据库"""
-    db = get_db()
-    
-    # 创建爬虫运行记录表
-    db.execute("""
-    CREATE TABLE IF NOT EXISTS crawler_runs (
-        id TEXT PRIMARY KEY,
-        crawler_id TEXT NOT NULL,
-        crawler_name TEXT NOT NULL,
-        start_time TIMESTAMP NOT NULL,
-        end_time TIMESTAMP,
-        status TEXT NOT NULL,
-        log_path TEXT NOT NULL,
-        run_type TEXT DEFAULT 'manual',
-        schedule_id TEXT
-    )
-    """)
-    
-    # 创建定时任务表
-    db.execute("""
-    CREATE TABLE IF NOT EXISTS scheduled_tasks (
-        id TEXT PRIMARY KEY,
-        crawler_id TEXT NOT NULL,
-        crawler_name TEXT NOT NULL,
-        schedule_type TEXT NOT NULL,
-        time_value TEXT NOT NULL,
-        created_at TIMESTAMP NOT NULL
-    )
-    """)
+    """初始化数据库，执行尚未执行的结构迁移"""
+    db = get_db()
     
-    db.commit()
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for target_version, migration in enumerate(MIGRATIONS, start=1):
+        if target_version <= version:
+            continue
+        # 加写锁后再次检查版本，避免多个进程重复执行同一迁移
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] >= target_version:
+                db.rollback()
+                continue
+            if callable(migration):
+                migration(db)
+            else:
+                for statement in migration:
+                    db.execute(statement)
+            db.execute(f"PRAGMA user_version = {target_version}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    
+    # 根据表的统计信息优化查询计划
+    db.execute("PRAGMA optimize")
 
-def add_crawler_run(run_id, crawler_id, crawler_name, status, log_path, run_type='manual', schedule_id=None):
+def add_crawler_run(run_id, crawler_id, crawler_name, status, log_path, run_type='manual', schedule_id=None, worker_id=None,
+                    parameters=None, parent_run_id=None, shard_index=None, shard_count=None, agent_id=None):
     """添加爬虫运行记录
     
     Args:
@@ -66,6 +332,12 @@ def add_crawler_run(run_id, crawler_id, crawler_name, status, log_path, run_type
         log_path: 日志路径
         run_type: 运行类型，'manual'表示手动运行，'scheduled'表示定时任务运行
         schedule_id: 定时任务ID，仅当run_type为'scheduled'时有效
+        worker_id: 负责该运行的进程ID
+        parameters: 运行参数（字典）
+        parent_run_id: 分片运行的父运行ID
+        shard_index: 分片序号（从0开始）
+        shard_count: 分片总数，父运行和子运行都会记录
+        agent_id: 执行该运行的工作节点ID，None表示在本机运行
     """
     import datetime
     import pytz
@@ -73,12 +345,13 @@ def add_crawler_run(run_id, crawler_id, crawler_name, status, log_path, run_type
     # 使用Asia/Shanghai时区的当前时间
     now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
     
-    db = get_db()
-    db.execute(
-        "INSERT INTO crawler_runs (id, crawler_id, crawler_name, start_time, status, log_path, run_type, schedule_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (run_id, crawler_id, crawler_name, now, status, log_path, run_type, schedule_id)
+    # 交给写入线程批量提交，之后的读操作会等待其落库
+    _get_writer().submit(
+        "INSERT INTO crawler_runs (id, crawler_id, crawler_name, start_time, status, log_path, run_type, schedule_id, worker_id, "
+        "parameters, parent_run_id, shard_index, shard_count, agent_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (run_id, crawler_id, crawler_name, now, status, log_path, run_type, schedule_id, worker_id,
+         json.dumps(parameters, ensure_ascii=False) if parameters else None, parent_run_id, shard_index, shard_count, agent_id)
     )
-    db.commit()
     return run_id
 
 def update_crawler_status(run_id, status):
@@ -89,21 +362,318 @@ def update_crawler_status(run_id, status):
     # 使用Asia/Shanghai时区的当前时间
     now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
     
-    db = get_db()
-    db.execute(
+    _get_writer().submit(
         "UPDATE crawler_runs SET status = ?, end_time = ? WHERE id = ?",
         (status, now, run_id)
     )
-    db.commit()
 
-def get_crawler_runs(limit=100):
-    """获取爬虫运行记录"""
+def update_parent_run_status(parent_run_id):
+    """根据分片子运行的状态汇总父运行的状态和资源占用
+    
+    有子运行在运行时父运行为running，全部在排队时为queued；全部结束后，
+    有子运行出错为error，其次有超时为timeout，其次有取消为cancelled，否则为completed。
+    资源占用、写入行数和日志摘要的计数为各分片之和。
+    """
+    import datetime
+    import pytz
+    
+    # 使用Asia/Shanghai时区的当前时间
+    now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
+    
+    # 与子运行的状态更新经同一写入线程按顺序执行，汇总时能读到子运行的最新状态
+    children = "SELECT {} FROM crawler_runs WHERE parent_run_id = :parent"
+    active = f"EXISTS ({children.format('1')} AND status IN ('running', 'queued'))"
+    resources = ', '.join(
+        f"{column} = ({children.format(f'SUM({column})')})"
+        for column in RESOURCE_COLUMNS + ('rows_written',) + LOG_SUMMARY_COUNTERS
+    )
+    _get_writer().submit(
+        f"""
+        UPDATE crawler_runs SET
+            status = CASE
+                WHEN EXISTS ({children.format('1')} AND status = 'running') THEN 'running'
+                WHEN {active} THEN 'queued'
+                WHEN EXISTS ({children.format('1')} AND status = 'error') THEN 'error'
+                WHEN EXISTS ({children.format('1')} AND status = 'timeout') THEN 'timeout'
+                WHEN EXISTS ({children.format('1')} AND status = 'cancelled') THEN 'cancelled'
+                ELSE 'completed'
+            END,
+            end_time = CASE WHEN {active} THEN NULL ELSE :now END,
+            {resources}
+        WHERE id = :parent
+        """,
+        {'parent': parent_run_id, 'now': now}
+    )
+
+def request_run_cancel(run_id):
+    """记录取消请求，由负责该运行的进程在下一次心跳时取消"""
+    _get_writer().submit(
+        "UPDATE crawler_runs SET cancel_requested = 1 WHERE id = ? AND status IN ('running', 'queued')",
+        (run_id,)
+    )
+
+def get_cancel_requests(worker_id):
+    """获取由指定进程负责、已请求取消的运行ID"""
+    _sync_writes()
+    db = get_db()
+    rows = db.execute(
+        "SELECT id FROM crawler_runs WHERE worker_id = ? AND agent_id IS NULL AND cancel_requested = 1 "
+        "AND status IN ('running', 'queued')",
+        (worker_id,)
+    ).fetchall()
+    return [row['id'] for row in rows]
+
+def get_shard_runs(parent_run_id):
+    """获取分片运行的各个子运行，按分片序号排序"""
+    _sync_writes()
     db = get_db()
     runs = db.execute(
-        "SELECT * FROM crawler_runs ORDER BY start_time DESC LIMIT ?",
-        (limit,)
+        "SELECT * FROM crawler_runs WHERE parent_run_id = ? ORDER BY shard_index",
+        (parent_run_id,)
+    ).fetchall()
+    return [_run_to_dict(run) for run in runs]
+
+def mark_crawler_run_started(run_id, agent_id=None):
+    """将排队中的运行标记为运行中，开始时间更新为实际启动时间，agent_id为执行该运行的工作节点"""
+    import datetime
+    import pytz
+    
+    # 使用Asia/Shanghai时区的当前时间
+    now = datetime.datetime.now(pytz.timezone('Asia/Shanghai'))
+    
+    _get_writer().submit(
+        "UPDATE crawler_runs SET status = 'running', start_time = ?, agent_id = ? WHERE id = ?",
+        (now, agent_id, run_id)
+    )
+
+def get_uncompressed_runs(ended_before, limit=100):
+    """获取已结束但日志尚未压缩的运行记录
+    
+    Args:
+        ended_before: 只返回结束时间早于该时间的运行
+        limit: 最多返回的记录数
+    """
+    _sync_writes()
+    db = get_db()
+    runs = db.execute(
+        "SELECT id, log_path FROM crawler_runs WHERE log_compressed = 0 AND end_time < ? ORDER BY end_time LIMIT ?",
+        (ended_before, limit)
+    ).fetchall()
+    
+    return [{'id': run['id'], 'log_path': run['log_path']} for run in runs]
+
+def mark_run_log_compressed(run_id, log_path):
+    """记录运行日志已压缩，并更新日志路径"""
+    _get_writer().submit(
+        "UPDATE crawler_runs SET log_compressed = 1, log_path = ? WHERE id = ?",
+        (log_path, run_id)
+    )
+    _sync_writes()
+
+def add_run_samples(rows):
+    """保存资源采样记录
+    
+    Args:
+        rows: (运行ID, 距运行开始的秒数, CPU秒数, RSS字节数, 读字节数, 写字节数, 线程数)的列表
+    """
+    _get_writer().submit_many(
+        "INSERT OR REPLACE INTO run_samples (run_id, elapsed, cpu_seconds, rss, read_bytes, write_bytes, threads) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+
+def update_run_resources(run_id, summary):
+    """保存运行的资源占用汇总
+    
+    Args:
+        run_id: 运行ID
+        summary: 包含RESOURCE_COLUMNS各字段的字典
+    """
+    assignments = ', '.join(f"{column} = ?" for column in RESOURCE_COLUMNS)
+    _get_writer().submit(
+        f"UPDATE crawler_runs SET {assignments} WHERE id = ?",
+        tuple(summary.get(column) for column in RESOURCE_COLUMNS) + (run_id,)
+    )
+
+def update_run_progress(run_id, counters):
+    """保存爬虫上报的进度计数
+    
+    Args:
+        run_id: 运行ID
+        counters: 计数名 -> 累计值，rows_written另外保存在单独的列中
+    """
+    rows_written = counters.get('rows_written')
+    _get_writer().submit(
+        "UPDATE crawler_runs SET rows_written = ?, progress = ? WHERE id = ?",
+        (int(rows_written) if rows_written is not None else None, json.dumps(counters, ensure_ascii=False), run_id)
+    )
+
+def add_run_log_summary(run_id, delta):
+    """将采集日志时统计的增量累加到运行记录
+    
+    Args:
+        run_id: 运行ID
+        delta: LogSummary.take()的返回值，last_error为None时保留原有的错误信息
+    """
+    assignments = ', '.join(f"{column} = COALESCE({column}, 0) + :{column}" for column in LOG_SUMMARY_COUNTERS)
+    _get_writer().submit(
+        f"UPDATE crawler_runs SET {assignments}, last_error = COALESCE(:last_error, last_error) WHERE id = :run_id",
+        dict(delta, run_id=run_id)
+    )
+
+def get_run_samples(run_id):
+    """获取运行的资源采样记录，按时间顺序排列"""
+    _sync_writes()
+    db = get_db()
+    samples = db.execute(
+        "SELECT elapsed, cpu_seconds, rss, read_bytes, write_bytes, threads FROM run_samples "
+        "WHERE run_id = ? ORDER BY elapsed",
+        (run_id,)
+    ).fetchall()
+    
+    return [dict(sample) for sample in samples]
+
+def index_log_lines(rows):
+    """将日志行写入全文索引
+    
+    Args:
+        rows: (行文本, 运行ID, 行号)的列表
+    """
+    _get_writer().submit_many(
+        "INSERT INTO log_search (line, run_id, line_no) VALUES (?, ?, ?)",
+        rows
+    )
+
+def log_search_available():
+    """日志全文索引是否可用"""
+    db = get_db()
+    return db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'log_search'"
+    ).fetchone() is not None
+
+def search_log_lines(query, crawler_id=None, start_from=None, start_to=None, limit=50):
+    """全文搜索日志行，按写入时间倒序返回
+    
+    Args:
+        query: 搜索词，作为整体短语匹配
+        crawler_id: 按爬虫ID过滤
+        start_from: 运行开始时间下限（含）
+        start_to: 运行开始时间上限（不含）
+        limit: 最多返回的记录数
+    
+    Returns:
+        list: 匹配的日志行，snippet_html为已转义并用<mark>标出匹配词的片段
+    """
+    conditions = ["log_search MATCH ?"]
+    # 搜索词作为短语匹配，避免其中的特殊字符被当作FTS5查询语法
+    params = ['"' + query.replace('"', '""') + '"']
+    if crawler_id:
+        conditions.append("r.crawler_id = ?")
+        params.append(crawler_id)
+    if start_from:
+        conditions.append("r.start_time >= ?")
+        params.append(start_from)
+    if start_to:
+        conditions.append("r.start_time < ?")
+        params.append(start_to)
+    
+    db = get_db()
+    rows = db.execute(
+        "SELECT s.run_id, s.line_no, snippet(log_search, 0, char(2), char(3), '...', 24) AS snippet, "
+        "r.crawler_id, r.crawler_name, r.start_time "
+        "FROM log_search s JOIN crawler_runs r ON r.id = s.run_id "
+        f"WHERE {' AND '.join(conditions)} ORDER BY s.rowid DESC LIMIT ?",
+        params + [limit]
     ).fetchall()
     
+    result = []
+    for row in rows:
+        snippet_html = html.escape(row['snippet']).replace('\x02', '<mark>').replace('\x03', '</mark>')
+        result.append({
+            'run_id': row['run_id'],
+            'line_no': row['line_no'],
+            'snippet_html': snippet_html,
+            'crawler_id': row['crawler_id'],
+            'crawler_name': row['crawler_name'],
+            'start_time': row['start_time']
+        })
+    
+    return result
+
+def heartbeat_scheduler(worker_id, lease_seconds):
+    """记录进程心跳，并尝试获取或续期调度进程租约
+    
+    同一时间只有一个进程持有租约，持有者超过lease_seconds没有续期时其他进程可以接管。
+    
+    Returns:
+        bool: 当前进程是否为调度进程
+    """
+    now = time.time()
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            "INSERT INTO scheduler_workers (id, heartbeat) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat",
+            (worker_id, now)
+        )
+        db.execute(
+            "INSERT INTO scheduler_leader (id, worker_id, heartbeat) VALUES (1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET worker_id = excluded.worker_id, heartbeat = excluded.heartbeat "
+            "WHERE scheduler_leader.worker_id = excluded.worker_id OR scheduler_leader.heartbeat < ?",
+            (worker_id, now, now - lease_seconds)
+        )
+        leader = db.execute("SELECT worker_id FROM scheduler_leader WHERE id = 1").fetchone()['worker_id']
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return leader == worker_id
+
+def release_scheduler(worker_id):
+    """进程退出时注销心跳并释放调度进程租约，其他进程可以立即接管"""
+    db = get_db()
+    db.execute("DELETE FROM scheduler_leader WHERE id = 1 AND worker_id = ?", (worker_id,))
+    db.execute("DELETE FROM scheduler_workers WHERE id = ?", (worker_id,))
+    db.commit()
+
+def claim_orphaned_runs(worker_id, lease_seconds):
+    """接管已退出进程遗留的排队中的运行，并将其遗留的运行中记录标记为错误
+    
+    Args:
+        worker_id: 接管运行的进程ID
+        lease_seconds: 超过该时间没有心跳的进程视为已退出
+    
+    Returns:
+        list: 接管的运行记录（按入队时间排序）
+    """
+    _sync_writes()
+    stale_before = time.time() - lease_seconds
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        runs = db.execute(
+            "SELECT * FROM crawler_runs WHERE status = 'queued' AND (worker_id IS NULL OR worker_id NOT IN "
+            "(SELECT id FROM scheduler_workers WHERE heartbeat >= ?)) ORDER BY start_time",
+            (stale_before,)
+        ).fetchall()
+        db.executemany(
+            "UPDATE crawler_runs SET worker_id = ? WHERE id = ?",
+            [(worker_id, run['id']) for run in runs]
+        )
+        # 进程退出后其运行的爬虫已无法跟踪（工作节点上的运行仍会上报结果，不受影响）
+        db.execute(
+            "UPDATE crawler_runs SET status = 'error', end_time = ? WHERE status = 'running' AND agent_id IS NULL AND (worker_id IS NULL OR "
+            "worker_id NOT IN (SELECT id FROM scheduler_workers WHERE heartbeat >= ?))",
+            (datetime.datetime.now(pytz.timezone('Asia/Shanghai')), stale_before)
+        )
+        # 清理早已停止心跳的进程
+        db.execute("DELETE FROM scheduler_workers WHERE heartbeat < ?", (stale_before - 86400,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
     # 将 Row 对象转换为字典
     result = []
     for run in runs:
@@ -112,20 +682,266 @@ def get_crawler_runs(limit=100):
             'crawler_id': run['crawler_id'],
             'crawler_name': run['crawler_name'],
             'start_time': run['start_time'],
-            'end_time': run['end_time'],
-            'status': run['status'],
             'log_path': run['log_path'],
             'run_type': run['run_type'],
-            'schedule_id': run['schedule_id']
+            'schedule_id': run['schedule_id'],
+            'parameters': json.loads(run['parameters']) if run['parameters'] else {},
+            'parent_run_id': run['parent_run_id'],
+            'shard_index': run['shard_index'],
+            'shard_count': run['shard_count']
         })
     
     return result
 
+def get_run_statuses(run_ids):
+    """批量获取运行的当前状态
+    
+    Returns:
+        dict: 运行ID -> 状态，不存在的运行不包含在内
+    """
+    if not run_ids:
+        return {}
+    _sync_writes()
+    db = get_db()
+    placeholders = ', '.join('?' for _ in run_ids)
+    rows = db.execute(f"SELECT id, status FROM crawler_runs WHERE id IN ({placeholders})", list(run_ids)).fetchall()
+    return {row['id']: row['status'] for row in rows}
+
+# 工作节点相关函数
+def heartbeat_agent(agent_id, name, host, capacity, crawlers, load=None):
+    """记录工作节点的心跳（首次心跳即为注册）
+    
+    Args:
+        agent_id: 节点ID
+        name: 节点名称
+        host: 节点的主机名
+        capacity: 节点可同时运行的爬虫数
+        crawlers: 节点上可运行的爬虫ID列表
+        load: 节点的系统负载
+    """
+    now = time.time()
+    db = get_db()
+    db.execute(
+        "INSERT INTO agents (id, name, host, capacity, crawlers, load, heartbeat, registered_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET name = excluded.name, host = excluded.host, capacity = excluded.capacity, "
+        "crawlers = excluded.crawlers, load = excluded.load, heartbeat = excluded.heartbeat",
+        (agent_id, name, host, capacity, json.dumps(crawlers, ensure_ascii=False), load, now, now)
+    )
+    db.commit()
+
+def get_live_agents(lease_seconds):
+    """获取仍在心跳的工作节点，running为节点上正在运行的爬虫数"""
+    _sync_writes()
+    db = get_db()
+    rows = db.execute(
+        "SELECT agents.*, (SELECT COUNT(*) FROM crawler_runs WHERE crawler_runs.agent_id = agents.id "
+        "AND crawler_runs.status = 'running') AS running FROM agents WHERE heartbeat >= ? ORDER BY name",
+        (time.time() - lease_seconds,)
+    ).fetchall()
+    
+    result = []
+    for row in rows:
+        result.append({
+            'id': row['id'],
+            'name': row['name'],
+            'host': row['host'],
+            'capacity': row['capacity'],
+            'crawlers': json.loads(row['crawlers']),
+            'load': row['load'],
+            'heartbeat': row['heartbeat'],
+            'running': row['running']
+        })
+    
+    return result
+
+def add_agent_assignment(run_id, agent_id, payload):
+    """记录分配给工作节点的运行，节点在下一次心跳时领取"""
+    _get_writer().submit(
+        "INSERT OR REPLACE INTO agent_assignments (run_id, agent_id, payload) VALUES (?, ?, ?)",
+        (run_id, agent_id, json.dumps(payload, ensure_ascii=False))
+    )
+
+def take_agent_assignments(agent_id):
+    """领取分配给工作节点的运行（领取后删除）
+    
+    Returns:
+        tuple: (待启动的运行列表, 需要取消的运行ID列表)
+    """
+    _sync_writes()
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute("SELECT run_id, payload FROM agent_assignments WHERE agent_id = ?", (agent_id,)).fetchall()
+        db.execute("DELETE FROM agent_assignments WHERE agent_id = ?", (agent_id,))
+        cancelled = db.execute(
+            "SELECT id FROM crawler_runs WHERE agent_id = ? AND status = 'running' AND cancel_requested = 1",
+            (agent_id,)
+        ).fetchall()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [json.loads(row['payload']) for row in rows], [row['id'] for row in cancelled]
+
+def expire_stale_agents(lease_seconds):
+    """将已停止心跳的工作节点上的运行标记为错误，并清理其未领取的运行
+    
+    Returns:
+        list: 被标记为错误的运行记录
+    """
+    _sync_writes()
+    stale_before = time.time() - lease_seconds
+    db = get_db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        runs = db.execute(
+            "SELECT * FROM crawler_runs WHERE status = 'running' AND agent_id IS NOT NULL AND agent_id NOT IN "
+            "(SELECT id FROM agents WHERE heartbeat >= ?)",
+            (stale_before,)
+        ).fetchall()
+        db.executemany(
+            "UPDATE crawler_runs SET status = 'error', end_time = ? WHERE id = ?",
+            [(datetime.datetime.now(pytz.timezone('Asia/Shanghai')), run['id']) for run in runs]
+        )
+        db.execute(
+            "DELETE FROM agent_assignments WHERE agent_id NOT IN (SELECT id FROM agents WHERE heartbeat >= ?)",
+            (stale_before,)
+        )
+        # 清理早已停止心跳的节点
+        db.execute("DELETE FROM agents WHERE heartbeat < ?", (stale_before - 86400,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [_run_to_dict(run) for run in runs]
+
+def _run_to_dict(run):
+    """将运行记录的Row对象转换为字典"""
+    result = {
+        'id': run['id'],
+        'crawler_id': run['crawler_id'],
+        'crawler_name': run['crawler_name'],
+        'start_time': run['start_time'],
+        'end_time': run['end_time'],
+        'status': run['status'],
+        'log_path': run['log_path'],
+        'run_type': run['run_type'],
+        'schedule_id': run['schedule_id'],
+        'parameters': json.loads(run['parameters']) if run['parameters'] else {},
+        'parent_run_id': run['parent_run_id'],
+        'shard_index': run['shard_index'],
+        'shard_count': run['shard_count'],
+        'agent_id': run['agent_id'],
+        'rows_written': run['rows_written'],
+        'progress': json.loads(run['progress']) if run['progress'] else {},
+        'last_error': run['last_error']
+    }
+    for column in LOG_SUMMARY_COUNTERS:
+        result[column] = run[column]
+    for column in RESOURCE_COLUMNS:
+        result[column] = run[column]
+    return result
+
+def get_crawler_runs(limit=100):
+    """获取爬虫运行记录"""
+    _sync_writes()
+    db = get_db()
+    runs = db.execute(
+        "SELECT * FROM crawler_runs ORDER BY start_time DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    
+    # 将 Row 对象转换为字典
+    result = []
+    for run in runs:
+        result.append(_run_to_dict(run))
+    
+    return result
+
+def encode_history_cursor(start_time, run_id):
+    """将分页位置编码为不透明的游标字符串"""
+    raw = json.dumps([start_time, run_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_history_cursor(cursor):
+    """解析游标字符串，格式错误时抛出ValueError"""
+    try:
+        start_time, run_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('无效的分页游标')
+    return str(start_time), str(run_id)
+
+def query_crawler_runs(limit=50, cursor=None, crawler_id=None, status=None, run_type=None,
+                       schedule_id=None, start_from=None, start_to=None, parent_run_id=None):
+    """按开始时间倒序分页查询运行记录
+    
+    使用(start_time, id)作为键集分页，每一页都通过索引定位起点，翻到很深的页也不会变慢。
+    
+    Args:
+        limit: 每页记录数
+        cursor: 上一页返回的游标，None表示第一页
+        crawler_id: 按爬虫ID过滤
+        status: 按状态过滤
+        run_type: 按运行类型过滤
+        schedule_id: 按定时任务ID过滤
+        start_from: 开始时间下限（含），格式如 2024-01-01 或 2024-01-01 08:00:00
+        start_to: 开始时间上限（不含）
+        parent_run_id: 查询该父运行的分片子运行，None时只查询顶层运行（不含分片子运行）
+    
+    Returns:
+        tuple: (运行记录列表, 下一页游标)，没有下一页时游标为None
+    """
+    conditions = []
+    params = []
+    for column, value in (('crawler_id', crawler_id), ('status', status),
+                          ('run_type', run_type), ('schedule_id', schedule_id)):
+        if value:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    if parent_run_id:
+        conditions.append("parent_run_id = ?")
+        params.append(parent_run_id)
+    else:
+        conditions.append("parent_run_id IS NULL")
+    if start_from:
+        conditions.append("start_time >= ?")
+        params.append(start_from)
+    if start_to:
+        conditions.append("start_time < ?")
+        params.append(start_to)
+    if cursor:
+        conditions.append("(start_time, id) < (?, ?)")
+        params.extend(decode_history_cursor(cursor))
+    
+    where = f"WHERE {' AND '.join(conditions)}"
+    
+    _sync_writes()
+    db = get_db()
+    # CAST取出原始文本，用于生成游标，避免时间在类型转换中丢失精度
+    runs = db.execute(
+        f"SELECT *, CAST(start_time AS TEXT) AS start_time_key FROM crawler_runs {where} "
+        "ORDER BY start_time DESC, id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+    
+    next_cursor = None
+    if len(runs) > limit:
+        runs = runs[:limit]
+        next_cursor = encode_history_cursor(runs[-1]['start_time_key'], runs[-1]['id'])
+    
+    # 将 Row 对象转换为字典
+    result = []
+    for run in runs:
+        result.append(_run_to_dict(run))
+    
+    return result, next_cursor
+
 def get_active_crawlers():
-    """获取活动中的爬虫"""
+    """获取活动中的爬虫（运行中和排队中）"""
+    _sync_writes()
     db = get_db()
     crawlers = db.execute(
-        "SELECT * FROM crawler_runs WHERE status = 'running'"
+        "SELECT * FROM crawler_runs WHERE status IN ('running', 'queued')"
     ).fetchall()
     
     # 将 Row 对象转换为字典
@@ -136,13 +952,22 @@ def get_active_crawlers():
             'crawler_id': crawler['crawler_id'],
             'crawler_name': crawler['crawler_name'],
             'start_time': crawler['start_time'],
-            'status': crawler['status']
+            'status': crawler['status'],
+            'parent_run_id': crawler['parent_run_id'],
+            'shard_index': crawler['shard_index'],
+            'shard_count': crawler['shard_count'],
+            'agent_id': crawler['agent_id'],
+            'rows_written': crawler['rows_written'],
+            'warning_count': crawler['warning_count'],
+            'error_count': crawler['error_count'],
+            'last_error': crawler['last_error']
         })
     
     return result
 
 def get_crawler_by_id(run_id):
     """根据ID获取爬虫运行记录"""
+    _sync_writes()
     db = get_db()
     run = db.execute(
         "SELECT * FROM crawler_runs WHERE id = ?",
@@ -152,28 +977,19 @@ def get_crawler_by_id(run_id):
     if run is None:
         return None
     
-    return {
-        'id': run['id'],
-        'crawler_id': run['crawler_id'],
-        'crawler_name': run['crawler_name'],
-        'start_time': run['start_time'],
-        'end_time': run['end_time'],
-        'status': run['status'],
-        'log_path': run['log_path'],
-        'run_type': run['run_type'],
-        'schedule_id': run['schedule_id']
-    }
+    return _run_to_dict(run)
 
 # 定时任务相关函数
-def add_scheduled_task(task_id, crawler_id, crawler_name, schedule_type, time_value):
+def add_scheduled_task(task_id, crawler_id, crawler_name, schedule_type, time_value, jitter_seconds=None):
     """添加定时任务记录
     
     Args:
         task_id: 任务ID
         crawler_id: 爬虫ID
         crawler_name: 爬虫名称
-        schedule_type: 调度类型，'daily'或'interval'
-        time_value: 时间值，daily类型为HH:MM格式，interval类型为小时数
+        schedule_type: 调度类型，'daily'、'interval'或'cron'
+        time_value: 时间值，daily类型为HH:MM格式，interval类型为小时数，cron类型为crontab表达式
+        jitter_seconds: 最大随机抖动(秒)，None表示使用全局配置
     """
     import datetime
     import pytz
@@ -183,8 +999,9 @@ def add_scheduled_task(task_id, crawler_id, crawler_name, schedule_type, time_va
     
     db = get_db()
     db.execute(
-        "INSERT INTO scheduled_tasks (id, crawler_id, crawler_name, schedule_type, time_value, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (task_id, crawler_id, crawler_name, schedule_type, time_value, now)
+        "INSERT INTO scheduled_tasks (id, crawler_id, crawler_name, schedule_type, time_value, created_at, jitter_seconds) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (task_id, crawler_id, crawler_name, schedule_type, time_value, now, jitter_seconds)
     )
     db.commit()
     return task_id
@@ -210,7 +1027,9 @@ def get_scheduled_tasks():
             'crawler_name': task['crawler_name'],
             'schedule_type': task['schedule_type'],
             'time_value': task['time_value'],
-            'created_at': task['created_at']
+            'created_at': task['created_at'],
+            'offset_seconds': task['offset_seconds'],
+            'jitter_seconds': task['jitter_seconds']
         })
     
     return result
@@ -232,5 +1051,17 @@ def get_scheduled_task_by_id(task_id):
         'crawler_name': task['crawler_name'],
         'schedule_type': task['schedule_type'],
         'time_value': task['time_value'],
-        'created_at': task['created_at']
-    }
\ No newline at end of file
+        'created_at': task['created_at'],
+        'offset_seconds': task['offset_seconds'],
+        'jitter_seconds': task['jitter_seconds']
+    }
+
+def set_scheduled_task_offsets(offsets):
+    """更新定时任务的固定偏移
+    
+    Args:
+        offsets: (偏移秒数, 任务ID)的列表
+    """
+    db = get_db()
+    db.executemany("UPDATE scheduled_tasks SET offset_seconds = ? WHERE id = ?", offsets)
+    db.commit()
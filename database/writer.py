@@ -0,0 +1,181 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from metrics import DB_WRITE_LATENCY, DB_COMMIT_DURATION
+
+# 单次提交最多包含的写操作数
+MAX_BATCH = 500
+# 提交失败时的重试次数
+COMMIT_RETRIES = 3
+# 重试仍失败的一批写操作放回队列，等待多少秒后再次尝试（逐次加倍）
+REQUEUE_DELAY_INITIAL = 0.5
+REQUEUE_DELAY_MAX = 10.0
+
+
+class _Many:
+    """标记executemany的参数列表"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class DBWriter:
+    """数据库写入线程
+
+    运行记录的写操作不在调用方线程中直接提交，而是放入队列，由单个写线程
+    取出队列中已有的全部操作，在一个事务中执行后一次提交（组提交）。
+    所有写操作都来自同一个连接，不会互相争抢写锁。
+
+    写操作提交前对其他连接不可见。读操作前调用sync()等待此前提交的写操作落库，
+    保证调用方能读到自己刚写入的数据。提交失败（如数据库被其他进程锁定）的写操作放回队列重试，
+    不会被丢弃，在此期间sync()等待超时后返回False。
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: 数据库文件路径
+        """
+        self.path = path
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._submitted = 0  # 已提交到队列的写操作序号
+        self._committed = 0  # 已落库的写操作序号
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, sql, params=()):
+        """提交一个写操作
+
+        Returns:
+            int: 写操作序号，可传给sync等待其落库
+        """
+        with self._condition:
+            self._submitted += 1
+            self._queue.append((self._submitted, sql, params, time.monotonic()))
+            self._condition.notify_all()
+            return self._submitted
+
+    def submit_many(self, sql, seq_of_params):
+        """提交一个批量写操作（使用executemany执行）
+
+        Returns:
+            int: 写操作序号
+        """
+        with self._condition:
+            self._submitted += 1
+            self._queue.append((self._submitted, sql, _Many(seq_of_params), time.monotonic()))
+            self._condition.notify_all()
+            return self._submitted
+
+    def sync(self, seq=None, timeout=5):
+        """等待写操作落库
+
+        Args:
+            seq: 要等待的写操作序号，默认为调用时已提交的全部写操作
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        with self._condition:
+            if seq is None:
+                seq = self._submitted
+            if self._committed >= seq:
+                return True
+            return self._condition.wait_for(lambda: self._committed >= seq, timeout)
+
+    def close(self, timeout=5):
+        """等待队列中的写操作全部落库后停止写线程"""
+        self.sync(timeout=timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _run(self):
+        # 避免循环导入
+        from database.models import connect_db
+
+        db = connect_db(self.path)
+        requeue_delay = REQUEUE_DELAY_INITIAL
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    break
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), MAX_BATCH))]
+
+            started = time.monotonic()
+            if not self._write_batch(db, batch):
+                # 放回队列头部，保持写操作的顺序，稍后整批重试
+                with self._condition:
+                    self._queue.extendleft(reversed(batch))
+                    if self._closed:
+                        logging.error(f"数据库写入线程停止，{len(self._queue)}个写操作未能落库")
+                        break
+                logging.error(f"数据库写入失败，{len(batch)}个写操作将在{requeue_delay:.1f}秒后重试")
+                time.sleep(requeue_delay)
+                requeue_delay = min(requeue_delay * 2, REQUEUE_DELAY_MAX)
+                continue
+            requeue_delay = REQUEUE_DELAY_INITIAL
+            committed = time.monotonic()
+            DB_COMMIT_DURATION.observe(committed - started)
+            for item in batch:
+                DB_WRITE_LATENCY.observe(committed - item[3])
+
+            with self._condition:
+                self._committed = batch[-1][0]
+                self._condition.notify_all()
+
+        db.close()
+
+    def _write_batch(self, db, batch):
+        """在一个事务中执行一批写操作
+
+        Returns:
+            bool: 是否已提交，重试COMMIT_RETRIES次仍失败时返回False
+        """
+        for attempt in range(COMMIT_RETRIES):
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                for _, sql, params, _ in batch:
+                    try:
+                        if isinstance(params, _Many):
+                            db.executemany(sql, params.rows)
+                        else:
+                            db.execute(sql, params)
+                    except Exception as e:
+                        # 单个操作失败不影响同一批中的其他操作
+                        logging.error(f"数据库写入失败: {str(e)}, SQL: {sql}")
+                db.commit()
+                return True
+            except Exception as e:
+                if db.in_transaction:
+                    db.rollback()
+                logging.error(f"数据库提交失败(第{attempt + 1}次): {str(e)}")
+                time.sleep(0.1 * (attempt + 1))
+        return False
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path):
+    """获取数据库文件对应的写入线程"""
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = DBWriter(path)
+        return writer
+
+
+def sync_writes(path):
+    """如果数据库有写入线程，等待已提交的写操作落库"""
+    writer = _writers.get(path)
+    if writer is not None and not writer.sync():
+        logging.warning(f"等待数据库写入超时，读取的数据可能不是最新的: {path}")
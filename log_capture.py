@@ -0,0 +1,180 @@
+"""运行日志的写入和大小限制
+
+爬虫输出按块以二进制写入日志文件，不做解码，爬虫输出的非UTF-8字节原样保存，
+查看和推送时再按UTF-8解码并替换无效字节。写入先进入内存缓冲区，攒够flush_bytes字节后写入文件，
+调用方另外定时调用flush()，保证输出到出现在日志文件中的延迟不超过定时间隔。
+
+单次运行的日志超过上限时保留开头和结尾各一半：开头部分照常写入文件，之后的输出只在内存中保留
+最近的部分，运行结束时在开头部分之后写入省略说明和保留的结尾。只依赖标准库，工作节点也使用这里的限制逻辑。
+"""
+import os
+from collections import deque
+
+# 内存缓冲区攒够多少字节后写入文件
+DEFAULT_FLUSH_BYTES = 64 * 1024
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+class HeadTailLimiter:
+    """按"保留开头和结尾"的方式限制日志大小
+
+    输入应为以换行结尾的完整行（最后一块可以不以换行结尾），开头和结尾都在行边界处截断。
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: 日志的最大字节数（不含省略说明），开头和结尾各保留一半
+        """
+        self.max_bytes = max_bytes
+        self.head_bytes = max_bytes // 2
+        self.tail_bytes = max_bytes - self.head_bytes
+        self.head_written = 0
+        self.truncated = False  # 开头部分已写满，之后的输出进入结尾缓冲区
+        self._tail = deque()
+        self._tail_size = 0
+        self.dropped_bytes = 0
+        self.dropped_lines = 0
+
+    def accept(self, data):
+        """处理一块输出
+
+        Returns:
+            bytes: 应立即写入日志文件的部分（开头部分写满后为空）
+        """
+        if not self.truncated:
+            room = self.head_bytes - self.head_written
+            if len(data) <= room:
+                self.head_written += len(data)
+                return data
+            # 开头部分在最后一个能放下的换行处截断
+            cut = data.rfind(b'\n', 0, room) + 1
+            head, data = data[:cut], data[cut:]
+            self.head_written += len(head)
+            self.truncated = True
+        else:
+            head = b''
+
+        self._tail.append(data)
+        self._tail_size += len(data)
+        self._trim_tail()
+        return head
+
+    def _trim_tail(self):
+        """丢弃结尾缓冲区中超出上限的最早部分"""
+        while self._tail_size > self.tail_bytes and self._tail:
+            first = self._tail[0]
+            excess = self._tail_size - self.tail_bytes
+            if excess >= len(first):
+                self._tail.popleft()
+                self._drop(first)
+                continue
+            # 从超出部分之后的第一个换行处截断，结尾从完整的一行开始
+            cut = first.find(b'\n', excess - 1) + 1
+            if cut == 0:
+                cut = len(first)
+            self._tail[0] = first[cut:]
+            self._drop(first[:cut])
+            if not self._tail[0]:
+                self._tail.popleft()
+
+    def _drop(self, data):
+        self._tail_size -= len(data)
+        self.dropped_bytes += len(data)
+        self.dropped_lines += data.count(b'\n')
+
+    def finish(self):
+        """输出结束，返回应追加到日志文件的省略说明和结尾部分（没有省略时为空）"""
+        if not self.truncated:
+            return b''
+        tail = b''.join(self._tail)
+        self._tail.clear()
+        self._tail_size = 0
+        if not self.dropped_bytes:
+            return tail
+        notice = (
+            f"\n... 日志超过上限{_format_size(self.max_bytes)}，"
+            f"中间省略了{_format_size(self.dropped_bytes)}（约{self.dropped_lines}行） ...\n\n"
+        )
+        return notice.encode('utf-8') + tail
+
+
+class RunLogWriter:
+    """一次运行的日志文件
+
+    offset为已交给写入器（写入文件或在缓冲区中）的字节数，即下一段日志在文件中的起始偏移。
+    """
+
+    def __init__(self, path, max_bytes=None, flush_bytes=DEFAULT_FLUSH_BYTES):
+        """
+        Args:
+            path: 日志文件路径
+            max_bytes: 日志大小上限，None或0表示不限制
+            flush_bytes: 缓冲区攒够多少字节后写入文件
+        """
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.limiter = HeadTailLimiter(max_bytes) if max_bytes else None
+        self.offset = 0
+        self._buffer = bytearray()
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    @property
+    def buffered(self):
+        """缓冲区中是否有尚未写入文件的数据"""
+        return bool(self._buffer)
+
+    @property
+    def truncated(self):
+        return self.limiter is not None and self.limiter.truncated
+
+    def write(self, data):
+        """写入一块输出
+
+        Returns:
+            bytes: 实际保留到日志文件中的部分（超过上限后为空，结尾部分在close时写入）
+        """
+        if self.limiter is not None:
+            data = self.limiter.accept(data)
+        if data:
+            self._buffer += data
+            self.offset += len(data)
+            if len(self._buffer) >= self.flush_bytes:
+                self.flush()
+        return data
+
+    def flush(self):
+        """将缓冲区写入文件"""
+        view = memoryview(self._buffer)
+        written = 0
+        try:
+            while written < len(view):
+                written += os.write(self._fd, view[written:])
+        finally:
+            view.release()
+            del self._buffer[:written]
+
+    def close(self):
+        """写入省略说明和保留的结尾并关闭文件
+
+        Returns:
+            bytes: 关闭时追加的部分
+        """
+        if self._fd is None:
+            return b''
+        tail = self.limiter.finish() if self.limiter is not None else b''
+        if tail:
+            self._buffer += tail
+            self.offset += len(tail)
+        try:
+            self.flush()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        return tail
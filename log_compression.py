@@ -0,0 +1,110 @@
+import bisect
+import os
+import struct
+import zlib
+
+# 压缩日志文件的扩展名
+COMPRESSED_SUFFIX = '.zlog'
+# 每个压缩块的原始数据大小，读取任意位置时最多只需解压一个块
+BLOCK_SIZE = 256 * 1024
+
+# 文件格式：
+#   文件头 MAGIC
+#   若干个zlib压缩块
+#   块索引，每个块一条(原始偏移, 压缩偏移, 压缩长度, 原始长度)
+#   文件尾(索引偏移, 块数量, 原始总大小, TRAILER_MAGIC)
+MAGIC = b'ZLOG1\n'
+TRAILER_MAGIC = b'ZLOGIDX1'
+_INDEX_ENTRY = struct.Struct('<QQII')
+_TRAILER = struct.Struct('<QQQ8s')
+
+
+def is_compressed_log(log_path):
+    """是否为压缩日志文件"""
+    return log_path.endswith(COMPRESSED_SUFFIX)
+
+
+def compress_log(src_path, dst_path, level=6):
+    """将文本日志压缩为按块压缩、带索引的文件
+
+    先写入临时文件，完成后再重命名，不会留下写了一半的压缩文件。
+
+    Args:
+        src_path: 原日志文件路径
+        dst_path: 压缩文件路径
+        level: zlib压缩级别
+    """
+    tmp_path = dst_path + '.tmp'
+    index = []
+    total = 0
+    try:
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            dst.write(MAGIC)
+            while True:
+                data = src.read(BLOCK_SIZE)
+                if not data:
+                    break
+                compressed = zlib.compress(data, level)
+                index.append((total, dst.tell(), len(compressed), len(data)))
+                dst.write(compressed)
+                total += len(data)
+
+            index_offset = dst.tell()
+            for entry in index:
+                dst.write(_INDEX_ENTRY.pack(*entry))
+            dst.write(_TRAILER.pack(index_offset, len(index), total, TRAILER_MAGIC))
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, dst_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CompressedLog:
+    """按偏移读取压缩日志，只解压需要的块"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是有效的压缩日志文件: {path}")
+            self._file.seek(-_TRAILER.size, os.SEEK_END)
+            index_offset, block_count, self.size, trailer_magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+            if trailer_magic != TRAILER_MAGIC:
+                raise ValueError(f"压缩日志文件索引损坏: {path}")
+            self._file.seek(index_offset)
+            raw_index = self._file.read(block_count * _INDEX_ENTRY.size)
+            self._blocks = [_INDEX_ENTRY.unpack_from(raw_index, i * _INDEX_ENTRY.size) for i in range(block_count)]
+            self._block_offsets = [block[0] for block in self._blocks]
+        except Exception:
+            self._file.close()
+            raise
+
+    def read(self, offset, length):
+        """读取原始日志中[offset, offset + length)范围的数据"""
+        if offset >= self.size or length <= 0:
+            return b''
+        end = min(offset + length, self.size)
+        chunks = []
+        index = bisect.bisect_right(self._block_offsets, offset) - 1
+        while index < len(self._blocks):
+            block_offset, compressed_offset, compressed_length, block_length = self._blocks[index]
+            if block_offset >= end:
+                break
+            self._file.seek(compressed_offset)
+            data = zlib.decompress(self._file.read(compressed_length))
+            chunks.append(data[max(0, offset - block_offset):end - block_offset])
+            index += 1
+        return b''.join(chunks)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,128 @@
+import os
+from log_compression import CompressedLog, is_compressed_log
+
+# 单次返回的默认最大字节数
+DEFAULT_CHUNK_SIZE = 256 * 1024
+# 单次返回的字节数上限（防止客户端请求过大的片段）
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# 单次返回的字节数下限，至少能容纳一个完整的UTF-8字符，保证每次读取都有进展
+MIN_CHUNK_SIZE = 4
+
+
+def _trim_incomplete_utf8(data):
+    """去掉末尾不完整的UTF-8字符，返回可安全解码的部分"""
+    # UTF-8字符最长4字节，只需检查末尾3个字节
+    for i in range(1, min(4, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            # 续字节，继续向前找首字节
+            continue
+        if byte & 0x80 == 0:
+            # ASCII字符，完整
+            return data
+        # 多字节字符的首字节，计算该字符应有的长度
+        if byte & 0xE0 == 0xC0:
+            length = 2
+        elif byte & 0xF0 == 0xE0:
+            length = 3
+        else:
+            length = 4
+        return data if i >= length else data[:-i]
+    return data
+
+
+def _skip_utf8_continuation(data):
+    """跳过开头的UTF-8续字节，返回跳过的字节数"""
+    skipped = 0
+    while skipped < len(data) and skipped < 3 and data[skipped] & 0xC0 == 0x80:
+        skipped += 1
+    return skipped
+
+
+def get_log_size(log_path):
+    """获取日志大小（字节），压缩日志返回原始大小"""
+    if is_compressed_log(log_path):
+        with CompressedLog(log_path) as log:
+            return log.size
+    return os.path.getsize(log_path)
+
+
+def _read_range(log_path, offset, length):
+    """读取日志中指定范围的原始字节，返回(数据, 日志大小)"""
+    if is_compressed_log(log_path):
+        with CompressedLog(log_path) as log:
+            return log.read(offset, length), log.size
+
+    size = os.path.getsize(log_path)
+    with open(log_path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length), size
+
+
+def read_log_text(log_path):
+    """读取完整日志文本（支持压缩日志）"""
+    data, _ = _read_range(log_path, 0, get_log_size(log_path))
+    return data.decode('utf-8', errors='replace')
+
+
+def read_log_chunk(log_path, offset=0, max_bytes=DEFAULT_CHUNK_SIZE):
+    """从指定字节偏移开始读取日志片段
+
+    Args:
+        log_path: 日志文件路径
+        offset: 起始字节偏移
+        max_bytes: 本次最多读取的字节数
+
+    Returns:
+        dict: content为日志文本，offset为实际起始偏移，next_offset为下次请求应使用的偏移，
+              size为文件当前大小，eof表示是否已读到文件末尾
+    """
+    max_bytes = max(MIN_CHUNK_SIZE, min(int(max_bytes), MAX_CHUNK_SIZE))
+    offset = int(offset)
+    data, size = _read_range(log_path, max(offset, 0), max_bytes)
+    # 文件被截断或偏移非法时从头读取
+    if offset < 0 or offset > size:
+        offset = 0
+        data, size = _read_range(log_path, 0, max_bytes)
+
+    # 片段末尾可能截断了多字节字符，留到下次读取（片段只有这一个不完整字符时原样返回，避免没有进展）
+    if offset + len(data) < size:
+        data = _trim_incomplete_utf8(data) or data
+
+    next_offset = offset + len(data)
+    return {
+        'content': data.decode('utf-8', errors='replace'),
+        'offset': offset,
+        'next_offset': next_offset,
+        'size': size,
+        'eof': next_offset >= size
+    }
+
+
+def read_log_tail(log_path, max_bytes=DEFAULT_CHUNK_SIZE):
+    """读取日志文件末尾的片段（用于日志页面首次渲染）
+
+    Returns:
+        dict: 字段同read_log_chunk，truncated表示是否省略了文件开头部分
+    """
+    max_bytes = max(MIN_CHUNK_SIZE, min(int(max_bytes), MAX_CHUNK_SIZE))
+    size = get_log_size(log_path)
+    offset = max(0, size - max_bytes)
+    data, size = _read_range(log_path, offset, max_bytes)
+
+    # 起始位置可能落在多字节字符中间
+    if offset > 0:
+        skipped = _skip_utf8_continuation(data)
+        data = data[skipped:]
+        offset += skipped
+    data = _trim_incomplete_utf8(data)
+
+    next_offset = offset + len(data)
+    return {
+        'content': data.decode('utf-8', errors='replace'),
+        'offset': offset,
+        'next_offset': next_offset,
+        'size': size,
+        'eof': next_offset >= size,
+        'truncated': offset > 0
+    }
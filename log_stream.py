@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class _RunStream:
+    """单次运行的日志环形缓冲区"""
+
+    def __init__(self):
+        self.entries = deque()  # (seq, offset, next_offset, text)
+        self.size = 0  # 缓冲的日志字节数
+        self.next_seq = 0
+        self.closed = False
+        self.closed_at = None
+        self.condition = threading.Condition()
+
+
+class LogBroadcaster:
+    """按运行ID缓存最近的日志，并分发给所有SSE订阅者
+
+    采集线程写入日志文件后调用publish，多个订阅者共享同一份内存缓冲区，
+    不需要重复读取日志文件。每条日志记录其在日志文件中的字节偏移，
+    订阅者可以据此与/logs/tail接口的结果衔接。
+    """
+
+    def __init__(self, max_entries=2000, max_bytes=4 * 1024 * 1024, retain_seconds=60):
+        """
+        Args:
+            max_entries: 每个运行缓存的最大日志段数（每次publish为一段，可以包含多行）
+            max_bytes: 每个运行缓存的最大日志字节数，至少保留最新的一段
+            retain_seconds: 运行结束后缓冲区保留的秒数
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.retain_seconds = retain_seconds
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, run_id):
+        """为运行创建缓冲区（在启动爬虫进程前调用）"""
+        with self._lock:
+            self._purge_expired()
+            if run_id not in self._streams:
+                self._streams[run_id] = _RunStream()
+
+    def publish(self, run_id, text, offset, next_offset):
+        """发布一段日志
+
+        Args:
+            run_id: 运行ID
+            text: 日志文本
+            offset: 该段日志在日志文件中的起始字节偏移
+            next_offset: 该段日志结束后的字节偏移
+        """
+        stream = self._streams.get(run_id)
+        if stream is None:
+            return
+        with stream.condition:
+            entries = stream.entries
+            entries.append((stream.next_seq, offset, next_offset, text))
+            stream.size += next_offset - offset
+            stream.next_seq += 1
+            while len(entries) > 1 and (len(entries) > self.max_entries or stream.size > self.max_bytes):
+                _, old_offset, old_next_offset, _ = entries.popleft()
+                stream.size -= old_next_offset - old_offset
+            stream.condition.notify_all()
+
+    def close(self, run_id):
+        """标记运行结束，订阅者收到剩余日志后结束"""
+        stream = self._streams.get(run_id)
+        if stream is None:
+            return
+        with stream.condition:
+            stream.closed = True
+            stream.closed_at = time.time()
+            stream.condition.notify_all()
+
+    def is_live(self, run_id):
+        """运行是否有可订阅的缓冲区"""
+        return run_id in self._streams
+
+    def _purge_expired(self):
+        """清理结束时间超过保留期的缓冲区（需持有self._lock）"""
+        now = time.time()
+        expired = [run_id for run_id, stream in self._streams.items()
+                   if stream.closed and now - stream.closed_at > self.retain_seconds]
+        for run_id in expired:
+            del self._streams[run_id]
+
+    def subscribe(self, run_id, offset=0, heartbeat=15):
+        """订阅运行日志，生成SSE格式的消息
+
+        先发送缓冲区中偏移在offset之后的日志，再等待新的日志。
+        如果缓冲区已不包含offset处的日志，发送gap事件，由客户端通过/logs/tail补齐。
+
+        Args:
+            run_id: 运行ID
+            offset: 客户端已读取到的字节偏移
+            heartbeat: 无新日志时发送心跳的间隔(秒)
+        """
+        stream = self._streams.get(run_id)
+        if stream is None:
+            yield _format_event('end', {'offset': offset})
+            return
+
+        last_seq = None
+        last_offset = offset
+        while True:
+            pending, gap, finished = [], False, False
+            with stream.condition:
+                if not self._has_pending(stream, last_seq, last_offset):
+                    if stream.closed:
+                        finished = True
+                    else:
+                        stream.condition.wait(heartbeat)
+                if not finished:
+                    pending, gap = self._collect(stream, last_seq, last_offset)
+                    finished = not pending and stream.closed
+
+            if finished:
+                break
+            if not pending:
+                # 等待超时且没有新日志，发送心跳保持连接
+                yield ': keepalive\n\n'
+                continue
+
+            if gap:
+                yield _format_event('gap', {'offset': pending[0][1]})
+            for seq, entry_offset, next_offset, text in pending:
+                yield _format_event('log', {
+                    'offset': entry_offset,
+                    'next_offset': next_offset,
+                    'text': text
+                }, event_id=next_offset)
+                last_seq = seq
+                last_offset = next_offset
+
+        yield _format_event('end', {'offset': last_offset})
+
+    @staticmethod
+    def _has_pending(stream, last_seq, last_offset):
+        """是否有订阅者尚未收到的日志（需持有stream.condition）"""
+        if not stream.entries:
+            return False
+        if last_seq is None:
+            return stream.entries[-1][2] > last_offset
+        return stream.entries[-1][0] > last_seq
+
+    @staticmethod
+    def _collect(stream, last_seq, last_offset):
+        """取出订阅者尚未收到的日志（需持有stream.condition）
+
+        Returns:
+            tuple: (待发送的日志列表, 是否有日志已被环形缓冲区丢弃)
+        """
+        entries = stream.entries
+        if not entries:
+            return [], False
+        if last_seq is None:
+            # 首次订阅，按字节偏移定位
+            if entries[0][1] > last_offset:
+                return list(entries), True
+            return [e for e in entries if e[2] > last_offset], False
+        start = last_seq + 1 - entries[0][0]
+        if start < 0:
+            return list(entries), True
+        return [entries[i] for i in range(start, len(entries))], False
+
+
+def _format_event(event, data, event_id=None):
+    """格式化一条SSE消息"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
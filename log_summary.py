@@ -0,0 +1,100 @@
+import re
+
+# 最后一条错误信息最多保存的字符数
+MAX_ERROR_LENGTH = 500
+
+# logging默认格式"%(asctime)s - %(levelname)s - %(message)s"中的级别和消息
+_LEVEL_PATTERN = re.compile(r' - (WARNING|ERROR|CRITICAL) - (.*)')
+_TRACEBACK_START = 'Traceback (most recent call last):'
+# 按块统计时先在原始字节中查找这些标记，没有标记的块不需要解码和逐行处理
+_CHUNK_MARKERS = (b' - WARNING - ', b' - ERROR - ', b' - CRITICAL - ', _TRACEBACK_START.encode('ascii'))
+
+
+class LogSummary:
+    """在采集日志时统计行数、字节数、警告和错误数，以及最后一条错误信息
+
+    按"%(asctime)s - %(levelname)s - %(message)s"格式识别WARNING、ERROR和CRITICAL级别的日志，
+    未捕获异常的Traceback也计为一次错误，其最后一行（异常类型和消息）作为错误信息。
+    统计的是上次take()之后的增量，由调用方定期累加到运行记录中。
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.warnings = 0
+        self.errors = 0
+        self.last_error = None
+        self._in_traceback = False  # 正在读取Traceback的堆栈行
+
+    def feed(self, text, size=None):
+        """统计一行日志
+
+        Args:
+            text: 解码后的一行（可以包含换行符）
+            size: 该行的原始字节数，默认按UTF-8编码计算
+        """
+        self.lines += 1
+        self.bytes += size if size is not None else len(text.encode('utf-8'))
+        self._classify(text.rstrip('\r\n'))
+
+    def feed_chunk(self, data):
+        """统计一块日志
+
+        Args:
+            data: 一行或多行原始字节，最后一行可以没有换行符
+        """
+        self.lines += data.count(b'\n')
+        if data and not data.endswith(b'\n'):
+            self.lines += 1
+        self.bytes += len(data)
+        if not self._in_traceback and not any(marker in data for marker in _CHUNK_MARKERS):
+            return
+        for line in data.decode('utf-8', errors='replace').split('\n'):
+            self._classify(line.rstrip('\r'))
+
+    def _classify(self, line):
+        """识别一行（不含换行符）的级别和Traceback"""
+        if self._in_traceback:
+            # 堆栈行有缩进，第一个没有缩进的行是异常信息
+            if line.startswith((' ', '\t')) or not line:
+                return
+            self._in_traceback = False
+            self.last_error = line[:MAX_ERROR_LENGTH]
+            return
+        if line.startswith(_TRACEBACK_START):
+            self._in_traceback = True
+            self.errors += 1
+            return
+        # 先做简单的子串判断，大多数行不需要执行正则
+        if ' - ' not in line:
+            return
+        match = _LEVEL_PATTERN.search(line)
+        if match is None:
+            return
+        if match.group(1) == 'WARNING':
+            self.warnings += 1
+        else:
+            self.errors += 1
+            self.last_error = match.group(2)[:MAX_ERROR_LENGTH]
+
+    @property
+    def pending(self):
+        """是否有尚未取出的统计"""
+        return self.lines > 0
+
+    def take(self):
+        """取出上次take()之后的增量统计并清零
+
+        Returns:
+            dict: log_lines、log_bytes、warning_count、error_count和last_error（没有新的错误时为None）
+        """
+        delta = {
+            'log_lines': self.lines,
+            'log_bytes': self.bytes,
+            'warning_count': self.warnings,
+            'error_count': self.errors,
+            'last_error': self.last_error,
+        }
+        self.lines = self.bytes = self.warnings = self.errors = 0
+        self.last_error = None
+        return delta
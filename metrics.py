@@ -0,0 +1,167 @@
+import bisect
+import math
+import threading
+
+# 所有指标，按创建顺序输出
+_registry = []
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类，按标签值分别保存数值
+
+    指标的值在事件发生时更新，导出时只读取内存中的数值。
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}的标签应为{self.labelnames}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        """返回(后缀, 标签值, 额外标签, 数值)的列表"""
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        for suffix, key, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的当前值，也可以在导出时通过函数取值"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """导出时调用function取值（只用于无标签的指标，function应当只读取内存中的数据）"""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            return [('', (), (), self._function())]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    """按区间统计观测值的分布"""
+
+    type_name = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各区间的计数（不累加）、观测值总和
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(('_bucket', key, (('le', _format_value(float(bound))),), cumulative))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+def render():
+    """按Prometheus文本格式导出所有指标"""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+# 运行状态
+ACTIVE_RUNS = Gauge('crawler_runs_active', '正在运行的爬虫进程数')
+QUEUED_RUNS = Gauge('crawler_runs_queued', '排队等待启动的运行数')
+RUNS_STARTED = Counter('crawler_runs_started_total', '已启动的运行数', ('crawler_id', 'run_type'))
+RUNS_FINISHED = Counter('crawler_runs_finished_total', '已结束的运行数（按最终状态）', ('crawler_id', 'status'))
+RUN_DURATION = Histogram(
+    'crawler_run_duration_seconds', '运行时长(秒)', ('crawler_id',),
+    buckets=(1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200)
+)
+LAUNCH_DURATION = Histogram(
+    'crawler_launch_seconds', '启动爬虫进程的耗时(秒)', ('mode',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+FIRST_OUTPUT_DELAY = Histogram(
+    'crawler_first_output_seconds', '从开始启动爬虫进程到第一行输出的时间(秒)，包含解释器启动和模块导入', ('mode',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+LOG_BYTES = Counter('crawler_log_bytes_total', '写入日志的字节数', ('crawler_id',))
+
+# 定时任务
+SCHEDULE_LAG = Histogram(
+    'crawler_schedule_lag_seconds', '定时任务计划触发时间与实际开始运行的间隔(秒)',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+)
+
+# 数据库写入
+DB_WRITE_LATENCY = Histogram(
+    'crawler_db_write_latency_seconds', '写操作从提交到落库的时间(秒)',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_COMMIT_DURATION = Histogram(
+    'crawler_db_commit_seconds', '写入线程每批写操作的事务耗时(秒)',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
@@ -0,0 +1,330 @@
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+# 每次从管道读取的最大字节数
+READ_SIZE = 256 * 1024
+# 单行超过多少字节时不再等待换行，直接回调已读到的部分
+MAX_LINE_BYTES = 1024 * 1024
+# 进程退出后等待管道中剩余输出的秒数（孙进程可能仍持有管道）
+EXIT_LINGER = 1.0
+# 检查进程是否退出的间隔(秒)
+POLL_INTERVAL = 0.5
+
+
+class Timer:
+    """复用器中的定时回调，可以在触发前取消"""
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Watch:
+    """一个被监视的子进程"""
+
+    def __init__(self, process, on_output, on_exit, on_timeout=None):
+        self.process = process
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.on_timeout = on_timeout
+        self.streams = {}  # 文件对象 -> 流名称('stdout'/'stderr')
+        self.buffers = {}  # 流名称 -> 未满一行的数据(bytearray)
+        self.timed_out = False
+        self.exited_at = None
+        self.timers = []
+        self.finished = False
+
+
+class OutputMultiplexer:
+    """在单个I/O线程中复用所有爬虫进程的标准输出和标准错误
+
+    每个进程的stdout和stderr同时被监视，每次读到数据后把其中完整的行一次回调，
+    避免先读完stdout再读stderr导致的管道写满阻塞。超时通过定时器实现，
+    不需要为每个进程占用一个阻塞在process.wait上的线程。
+    所有回调都在I/O线程中执行，回调中不应做耗时操作。
+    """
+
+    def __init__(self):
+        # Windows的select不支持管道，退回为每个流使用一个读取线程
+        self._use_selector = os.name != 'nt'
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, None)
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._watches = []
+        self._poll_timer = None
+        self._thread = threading.Thread(target=self._run, name='output-multiplexer', daemon=True)
+        self._thread.start()
+
+    def watch(self, process, on_output, on_exit, timeout=None, on_timeout=None):
+        """监视一个子进程的输出
+
+        Args:
+            process: subprocess.Popen对象，stdout和stderr必须为PIPE
+            on_output: 回调on_output(stream_name, data)，data为一行或多行以换行符结尾的bytes，
+                管道关闭时剩余的不完整行和超过MAX_LINE_BYTES的长行可以不以换行符结尾
+            on_exit: 回调on_exit(returncode, timed_out)，进程退出且输出读完后调用
+            timeout: 超时时间(秒)，超时后结束进程，None表示不限制
+            on_timeout: 超时后调用on_timeout()结束进程，None表示直接kill进程
+        """
+        watch = _Watch(process, on_output, on_exit, on_timeout)
+        if timeout is not None:
+            watch.timers.append(self.call_later(timeout, lambda: self._on_timeout(watch)))
+        self.call_soon(lambda: self._add_watch(watch))
+
+    def call_soon(self, callback):
+        """在I/O线程中执行回调（线程安全）"""
+        with self._lock:
+            self._pending.append(callback)
+        self._wakeup()
+
+    def call_later(self, delay, callback):
+        """在delay秒后于I/O线程中执行回调（线程安全）
+
+        Returns:
+            Timer: 可用于取消的定时器
+        """
+        timer = Timer(time.monotonic() + delay, callback)
+        with self._lock:
+            heapq.heappush(self._timers, (timer.deadline, next(self._timer_seq), timer))
+        self._wakeup()
+        return timer
+
+    def _wakeup(self):
+        """唤醒阻塞在select上的I/O线程"""
+        if threading.current_thread() is self._thread:
+            return
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # 缓冲区已满说明I/O线程已经会被唤醒
+            pass
+
+    def _run(self):
+        """I/O线程主循环"""
+        while True:
+            try:
+                events = self._selector.select(self._next_timeout())
+                for key, _ in events:
+                    if key.data is None:
+                        self._drain_wakeup()
+                    else:
+                        watch, name = key.data
+                        self._read(watch, key.fileobj, name)
+                self._run_pending()
+                self._run_timers()
+            except Exception as e:
+                logging.error(f"输出复用器异常: {str(e)}")
+
+    def _next_timeout(self):
+        """计算select的等待时间"""
+        with self._lock:
+            if self._pending:
+                return 0
+            while self._timers and self._timers[0][2].cancelled:
+                heapq.heappop(self._timers)
+            if not self._timers:
+                return None
+            return max(0, self._timers[0][0] - time.monotonic())
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+        for callback in pending:
+            self._invoke(callback)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                due.append(heapq.heappop(self._timers)[2])
+        for timer in due:
+            if not timer.cancelled:
+                self._invoke(timer.callback)
+
+    def _invoke(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            logging.error(f"输出复用器回调异常: {str(e)}")
+
+    def _add_watch(self, watch):
+        """开始监视进程的输出（在I/O线程中调用）"""
+        self._watches.append(watch)
+        for name in ('stdout', 'stderr'):
+            stream = getattr(watch.process, name)
+            if stream is None:
+                continue
+            watch.streams[stream] = name
+            watch.buffers[name] = bytearray()
+            if self._use_selector:
+                self._selector.register(stream, selectors.EVENT_READ, (watch, name))
+            else:
+                threading.Thread(target=self._read_in_thread, args=(watch, stream, name), daemon=True).start()
+        self._schedule_poll()
+
+    def _read(self, watch, stream, name):
+        """读取管道中已有的数据（在I/O线程中调用）"""
+        try:
+            data = os.read(stream.fileno(), READ_SIZE)
+        except OSError:
+            data = b''
+        if data:
+            self._on_data(watch, name, data)
+        else:
+            self._on_eof(watch, stream, name)
+
+    def _read_in_thread(self, watch, stream, name):
+        """Windows下在独立线程中读取管道，数据交给I/O线程处理"""
+        while True:
+            try:
+                data = stream.read1(READ_SIZE)
+            except (OSError, ValueError):
+                data = b''
+            if not data:
+                self.call_soon(lambda: self._on_eof(watch, stream, name))
+                return
+            self.call_soon(lambda data=data: self._on_data(watch, name, data))
+
+    def _on_data(self, watch, name, data):
+        """回调数据中完整的行，最后不完整的一行留到下次"""
+        if watch.finished:
+            return
+        buffer = watch.buffers[name]
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            buffer += data
+            if len(buffer) >= MAX_LINE_BYTES:
+                watch.buffers[name] = bytearray()
+                self._emit(watch, name, bytes(buffer))
+            return
+        if buffer:
+            chunk = bytes(buffer) + data[:end]
+            buffer.clear()
+        else:
+            chunk = data[:end] if end < len(data) else data
+        buffer += data[end:]
+        self._emit(watch, name, chunk)
+
+    def _on_eof(self, watch, stream, name):
+        """管道关闭，输出剩余的不完整行"""
+        if stream not in watch.streams:
+            return
+        self._flush_stream(watch, stream, name)
+        if not watch.streams:
+            self._check_exit(watch)
+
+    def _flush_stream(self, watch, stream, name):
+        """关闭管道并输出剩余的不完整行"""
+        self._close_stream(watch, stream)
+        remaining = watch.buffers.get(name)
+        if remaining:
+            watch.buffers[name] = bytearray()
+            self._emit(watch, name, bytes(remaining))
+
+    def _emit(self, watch, name, line):
+        try:
+            watch.on_output(name, line)
+        except Exception as e:
+            logging.error(f"处理进程输出失败: {str(e)}")
+
+    def _close_stream(self, watch, stream):
+        del watch.streams[stream]
+        if self._use_selector:
+            try:
+                self._selector.unregister(stream)
+            except (KeyError, ValueError):
+                pass
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+    def _on_timeout(self, watch):
+        """进程超时，强制结束"""
+        if watch.finished or watch.process.poll() is not None:
+            return
+        watch.timed_out = True
+        if watch.on_timeout is not None:
+            watch.on_timeout()
+            return
+        try:
+            watch.process.kill()
+        except OSError:
+            pass
+
+    def _schedule_poll(self):
+        """定时检查所有进程是否已退出"""
+        if self._poll_timer is None and self._watches:
+            self._poll_timer = self.call_later(POLL_INTERVAL, self._poll_watches)
+
+    def _poll_watches(self):
+        self._poll_timer = None
+        for watch in list(self._watches):
+            self._check_exit(watch)
+        self._schedule_poll()
+
+    def _check_exit(self, watch):
+        """进程退出且输出读完后结束监视；输出未读完则最多再等待EXIT_LINGER秒"""
+        if watch.finished or watch.process.poll() is None:
+            return
+        if not watch.streams:
+            self._finish(watch)
+        elif watch.exited_at is None:
+            watch.exited_at = time.monotonic()
+            watch.timers.append(self.call_later(EXIT_LINGER, lambda: self._finish(watch)))
+
+    def _finish(self, watch):
+        """结束监视并回调on_exit"""
+        if watch.finished:
+            return
+        # 先读完管道中已到达的数据
+        if self._use_selector:
+            for stream, name in list(watch.streams.items()):
+                self._drain(watch, stream, name)
+        for stream, name in list(watch.streams.items()):
+            self._flush_stream(watch, stream, name)
+        watch.finished = True
+        for timer in watch.timers:
+            timer.cancel()
+        self._watches.remove(watch)
+        try:
+            watch.on_exit(watch.process.wait(), watch.timed_out)
+        except Exception as e:
+            logging.error(f"处理进程退出失败: {str(e)}")
+
+    def _drain(self, watch, stream, name):
+        """非阻塞地读取管道中剩余的数据"""
+        os.set_blocking(stream.fileno(), False)
+        while True:
+            try:
+                data = os.read(stream.fileno(), READ_SIZE)
+            except (BlockingIOError, OSError):
+                return
+            if not data:
+                return
+            self._on_data(watch, name, data)
@@ -0,0 +1,135 @@
+"""爬虫进程的资源限制和进程组管理
+
+爬虫进程在独立的会话（进程组）中启动，结束运行时向整个进程组发送信号，
+爬虫启动的浏览器等孙进程也会一并结束。资源限制在爬虫进程执行爬虫代码之前（subprocess方式在exec之前，
+zygote方式在runpy之前）由子进程自己设置，爬虫从第一行代码起就受限制，其子进程也会继承。
+"""
+import logging
+import os
+import signal
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块
+    resource = None
+
+# 支持进程组信号（Windows不支持，只能结束爬虫进程本身）
+PROCESS_GROUPS_SUPPORTED = hasattr(os, 'killpg')
+# 支持设置资源限制（Windows不支持）
+LIMITS_SUPPORTED = resource is not None
+
+# config.json中limits的配置项 -> (资源, 换算到setrlimit单位的倍数)
+RLIMIT_OPTIONS = {
+    'memory_mb': ('RLIMIT_AS', 1024 * 1024),
+    'cpu_seconds': ('RLIMIT_CPU', 1),
+    'open_files': ('RLIMIT_NOFILE', 1),
+}
+
+
+def prepare_limits(limits):
+    """将config.json中的资源限制换算为爬虫进程启动时要设置的rlimit（在管理进程中调用）
+
+    memory_mb限制虚拟内存大小（超出时内存分配失败），cpu_seconds限制CPU时间（超出时进程收到SIGXCPU后被结束），
+    open_files限制打开的文件数。限制作用于每个进程，由之后创建的子进程继承。
+    无权设置的值（超过当前的硬限制）在这里检查，子进程中设置失败时无法报告。
+
+    Args:
+        limits: config.json中的limits字段
+
+    Returns:
+        tuple: ([(资源名, 软限制, 硬限制)], 无法生效的配置项列表)，前者可以序列化为JSON传给zygote
+    """
+    rlimits = []
+    failed = []
+    for option, (name, scale) in RLIMIT_OPTIONS.items():
+        value = (limits or {}).get(option)
+        if not value:
+            continue
+        if not LIMITS_SUPPORTED or not hasattr(resource, name):
+            failed.append(option)
+            continue
+        try:
+            soft = int(value * scale)
+            # CPU时间的硬限制比软限制多几秒，进程先收到SIGXCPU，有机会输出信息后退出
+            hard = soft + 5 if name == 'RLIMIT_CPU' else soft
+            current_hard = resource.getrlimit(getattr(resource, name))[1]
+            if soft < 0 or (current_hard != resource.RLIM_INFINITY and hard > current_hard):
+                raise ValueError(f"超过当前的硬限制{current_hard}")
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"设置资源限制失败: {option}={value}, 错误: {str(e)}")
+            failed.append(option)
+            continue
+        rlimits.append((name, soft, hard))
+    return rlimits, failed
+
+
+def set_limits(rlimits):
+    """在当前进程中设置资源限制（在爬虫子进程执行爬虫代码之前调用）
+
+    Args:
+        rlimits: prepare_limits返回的[(资源名, 软限制, 硬限制)]
+    """
+    for name, soft, hard in rlimits:
+        try:
+            resource.setrlimit(getattr(resource, name), (soft, hard))
+        except (OSError, ValueError):
+            # 子进程中无法报告错误，能设置的限制已在prepare_limits中检查过
+            pass
+
+
+def limits_preexec_fn(rlimits):
+    """subprocess.Popen的preexec_fn，在exec之前设置资源限制；没有要设置的限制时返回None"""
+    if not rlimits:
+        return None
+    return lambda: set_limits(rlimits)
+
+
+def signal_process_group(process, sig):
+    """向爬虫进程所在的进程组发送信号，不支持进程组时只发给爬虫进程
+
+    爬虫进程退出后，其进程组中仍在运行的孙进程同样会收到信号。
+
+    Returns:
+        bool: 是否有进程收到信号
+    """
+    if PROCESS_GROUPS_SUPPORTED:
+        try:
+            os.killpg(process.pid, sig)
+            return True
+        except (ProcessLookupError, PermissionError):
+            return False
+    if process.poll() is not None:
+        return False
+    try:
+        process.send_signal(sig)
+        return True
+    except OSError:
+        return False
+
+
+def terminate_process_group(process, grace_seconds, call_later):
+    """先发送SIGTERM，grace_seconds秒后向仍在运行的进程发送SIGKILL
+
+    进程组号在组内进程全部退出后可能被系统复用，调用方应在爬虫进程退出时取消返回的定时器，
+    并用kill_process_group立即结束遗留的孙进程。
+
+    Args:
+        process: 爬虫进程
+        grace_seconds: 等待进程自行退出的时间(秒)
+        call_later: 定时回调函数call_later(delay, callback)
+
+    Returns:
+        call_later返回的定时器，可以cancel()
+    """
+    signal_process_group(process, signal.SIGTERM)
+    return call_later(grace_seconds, lambda: kill_process_group(process))
+
+
+def kill_process_group(process):
+    """立即强制结束爬虫进程组中的所有进程
+
+    Returns:
+        bool: 是否有进程收到信号
+    """
+    return signal_process_group(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import logging
+
+# /proc/<pid>/stat中各字段的位置（从进程名之后的状态字段开始计数）
+_STAT_PPID = 1
+_STAT_UTIME = 11
+_STAT_STIME = 12
+_STAT_CUTIME = 13
+_STAT_CSTIME = 14
+_STAT_THREADS = 17
+_STAT_RSS = 21
+
+PROC_DIR = '/proc'
+
+
+def _read_stat(pid):
+    """读取进程的stat字段列表，进程不存在时返回None"""
+    try:
+        with open(f'{PROC_DIR}/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # 进程名可能包含空格和括号，从最后一个右括号之后开始解析
+    return data[data.rfind(b')') + 2:].split()
+
+
+def _read_io(pid):
+    """读取进程的读写字节数(rchar, wchar)，包括网络读写；无权限时返回(0, 0)"""
+    read_bytes = write_bytes = 0
+    try:
+        with open(f'{PROC_DIR}/{pid}/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith(b'wchar:'):
+                    write_bytes = int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return read_bytes, write_bytes
+
+
+class _RunStats:
+    """一次运行的采样状态和汇总"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.start = time.monotonic()
+        self.cpu_seconds = 0.0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.peak_rss = 0
+        self.rss_total = 0
+        self.peak_threads = 0
+        self.samples = 0
+
+    def summary(self):
+        return {
+            'cpu_seconds': round(self.cpu_seconds, 2),
+            'peak_rss': self.peak_rss,
+            'avg_rss': self.rss_total // self.samples if self.samples else 0,
+            'io_read_bytes': self.read_bytes,
+            'io_write_bytes': self.write_bytes,
+            'peak_threads': self.peak_threads
+        }
+
+
+class ResourceSampler:
+    """定时采样爬虫进程树的资源占用
+
+    一个后台线程每隔interval秒扫描一次/proc，按父子关系找出每个运行的进程树，
+    汇总CPU时间、内存(RSS)、读写字节数和线程数。采样结果通过on_samples回调批量交给调用方保存。
+
+    只支持提供/proc的系统（Linux），其他系统上不采样。
+    """
+
+    def __init__(self, on_samples, interval=5.0):
+        """
+        Args:
+            on_samples: 回调函数，参数为(运行ID, 距运行开始的秒数, CPU秒数, RSS字节数, 读字节数, 写字节数, 线程数)的列表
+            interval: 采样间隔(秒)
+        """
+        self.on_samples = on_samples
+        self.interval = interval
+        self.available = os.path.isdir(f'{PROC_DIR}/self')
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if self.available else 100
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if self.available else 4096
+        self._stop = threading.Event()
+        self._thread = None
+        if self.available:
+            self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+            self._thread.start()
+
+    def register(self, run_id, pid):
+        """开始采样一个运行的进程树"""
+        if not self.available:
+            return
+        with self._lock:
+            self._runs[run_id] = _RunStats(pid)
+
+    def unregister(self, run_id):
+        """停止采样，返回该运行的资源汇总；未采样时返回None"""
+        with self._lock:
+            stats = self._runs.pop(run_id, None)
+        return stats.summary() if stats is not None else None
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                rows = self.sample()
+                if rows:
+                    self.on_samples(rows)
+            except Exception as e:
+                logging.error(f"资源采样失败: {str(e)}")
+
+    def sample(self):
+        """采样一次所有运行，返回采样记录列表"""
+        with self._lock:
+            runs = list(self._runs.items())
+        if not runs:
+            return []
+
+        # 一次扫描/proc得到所有进程的父子关系，所有运行共用
+        stats = {}
+        children = {}
+        for name in os.listdir(PROC_DIR):
+            if not name.isdigit():
+                continue
+            fields = _read_stat(name)
+            if fields is None:
+                continue
+            pid = int(name)
+            stats[pid] = fields
+            children.setdefault(int(fields[_STAT_PPID]), []).append(pid)
+
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            for run_id, run in runs:
+                row = self._sample_run(run_id, run, stats, children, now)
+                if row is not None:
+                    rows.append(row)
+        return rows
+
+    def _sample_run(self, run_id, run, stats, children, now):
+        """汇总一个运行的进程树，更新运行的统计值并返回采样记录"""
+        if run.pid not in stats:
+            return None
+        cpu_ticks = rss_pages = threads = read_bytes = write_bytes = 0
+        pending = [run.pid]
+        while pending:
+            pid = pending.pop()
+            fields = stats[pid]
+            # 已退出并被回收的子进程的CPU时间累计在父进程的cutime/cstime中
+            cpu_ticks += sum(int(fields[i]) for i in (_STAT_UTIME, _STAT_STIME, _STAT_CUTIME, _STAT_CSTIME))
+            rss_pages += int(fields[_STAT_RSS])
+            threads += int(fields[_STAT_THREADS])
+            io = _read_io(pid)
+            read_bytes += io[0]
+            write_bytes += io[1]
+            pending.extend(child for child in children.get(pid, ()) if child in stats)
+
+        rss = rss_pages * self._page_size
+        # 子进程退出后其读写量不再计入，累计值取历史最大值保持单调
+        run.cpu_seconds = max(run.cpu_seconds, cpu_ticks / self._clock_ticks)
+        run.read_bytes = max(run.read_bytes, read_bytes)
+        run.write_bytes = max(run.write_bytes, write_bytes)
+        run.peak_rss = max(run.peak_rss, rss)
+        run.peak_threads = max(run.peak_threads, threads)
+        run.rss_total += rss
+        run.samples += 1
+        return (run_id, round(now - run.start, 1), round(run.cpu_seconds, 2), rss,
+                run.read_bytes, run.write_bytes, threads)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+
+class RunEventBus:
+    """进程内的运行状态事件
+
+    运行进入队列(queued)、开始(started)和结束(finished)时由爬虫管理器发布，
+    SSE订阅者等待新事件，不需要轮询数据库。事件只在本进程内传递，
+    其他进程中的运行状态变化由StatusSnapshot的定时刷新获得。
+    """
+
+    def __init__(self, max_events=1000):
+        """
+        Args:
+            max_events: 保留的最近事件数，断线重连时据此补发
+        """
+        self.seq = 0  # 最后一个事件的序号
+        self._events = deque(maxlen=max_events)  # (seq, event, data)
+        self._condition = threading.Condition()
+
+    def publish(self, event, data):
+        """发布一个事件
+
+        Args:
+            event: 事件类型：'queued'、'started'或'finished'
+            data: 事件内容，包含run_id和crawler_id
+        """
+        data = dict(data, time=time.time())
+        with self._condition:
+            self.seq += 1
+            self._events.append((self.seq, event, data))
+            self._condition.notify_all()
+
+    def wait(self, last_seq, timeout):
+        """等待序号大于last_seq的事件
+
+        Returns:
+            list: [(seq, event, data)]，超时时为空；last_seq之后的事件已被丢弃时只返回保留的部分
+        """
+        with self._condition:
+            if self.seq <= last_seq:
+                self._condition.wait(timeout)
+            return [entry for entry in self._events if entry[0] > last_seq]
+
+    def subscribe(self, snapshot, last_seq=None, interval=2.0, heartbeat=15):
+        """订阅运行事件，生成SSE格式的消息
+
+        连接后先发送一次status事件（活动运行列表），之后转发运行事件，
+        活动运行列表有变化时（有事件或每隔interval秒检查一次）再发送status事件。
+        所有订阅者共用同一个StatusSnapshot，数据库查询次数与订阅者数量无关。
+
+        Args:
+            snapshot: 活动运行列表的快照（StatusSnapshot）
+            last_seq: 客户端最后收到的事件序号（Last-Event-ID），None表示只接收之后的事件
+            interval: 没有事件时检查活动运行列表的间隔(秒)
+            heartbeat: 无消息时发送心跳的间隔(秒)
+        """
+        if last_seq is None or last_seq > self.seq:
+            last_seq = self.seq
+        sent_etag = None
+        idle_since = time.monotonic()
+        while True:
+            etag, body = snapshot.get()
+            if etag != sent_etag:
+                sent_etag = etag
+                idle_since = time.monotonic()
+                yield _format_event('status', body.decode('utf-8'))
+
+            for seq, event, data in self.wait(last_seq, interval):
+                last_seq = seq
+                idle_since = time.monotonic()
+                yield _format_event(event, json.dumps(data, ensure_ascii=False), event_id=seq)
+
+            if time.monotonic() - idle_since >= heartbeat:
+                idle_since = time.monotonic()
+                yield ': keepalive\n\n'
+
+
+class StatusSnapshot:
+    """活动运行列表的共享快照
+
+    /crawlers/status和/events的所有请求共用同一份JSON，运行事件发生后或距上次查询超过max_age秒时
+    才重新查询数据库，同时到达的请求只查询一次。ETag为JSON内容的摘要，多个进程对相同的状态给出相同的ETag。
+    """
+
+    def __init__(self, bus, loader, max_age=2.0, dumps=json.dumps):
+        """
+        Args:
+            bus: 运行事件（RunEventBus），有新事件时快照失效
+            loader: 查询活动运行列表的函数
+            max_age: 快照的最长有效时间(秒)，用于获得其他进程中的状态变化和运行进度
+            dumps: 将活动运行列表序列化为JSON字符串的函数，应与jsonify一致（传入app.json.dumps）
+        """
+        self.bus = bus
+        self.loader = loader
+        self.max_age = max_age
+        self.dumps = dumps
+        self._seq = None
+        self._loaded = 0.0
+        self._etag = None
+        self._body = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns:
+            tuple: (ETag, JSON内容的bytes)
+        """
+        with self._lock:
+            seq = self.bus.seq
+            if self._body is None or seq != self._seq or time.monotonic() - self._loaded >= self.max_age:
+                body = self.dumps(self.loader()).encode('utf-8')
+                self._seq = seq
+                self._loaded = time.monotonic()
+                if body != self._body:
+                    self._body = body
+                    self._etag = hashlib.sha1(body).hexdigest()[:16]
+            return self._etag, self._body
+
+
+def _format_event(event, data, event_id=None):
+    """格式化一条SSE消息，data为JSON字符串"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"data: {data}\n\n"
+    return message
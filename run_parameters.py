@@ -0,0 +1,137 @@
+import json
+import re
+
+# 支持的参数类型
+PARAMETER_TYPES = ('string', 'int', 'float', 'bool')
+# 单次运行最多拆分的分片数
+MAX_SHARDS = 64
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'on')
+_FALSE_VALUES = ('0', 'false', 'no', 'off', '')
+
+
+def _infer_type(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'string'
+
+
+def parameter_specs(parameters):
+    """将config.json中的parameters整理为统一的参数定义
+
+    每个参数可以写成完整定义 {"type": "int", "default": 10, "description": "抓取页数", "required": false}，
+    也可以直接写默认值（类型由默认值推断）。
+
+    Args:
+        parameters: config.json中的parameters字段
+
+    Returns:
+        dict: 参数名 -> {'type', 'default', 'description', 'required'}
+    """
+    specs = {}
+    for name, spec in (parameters or {}).items():
+        if isinstance(spec, dict) and ('type' in spec or 'default' in spec):
+            default = spec.get('default')
+            param_type = spec.get('type') or _infer_type(default)
+            specs[name] = {
+                'type': param_type if param_type in PARAMETER_TYPES else 'string',
+                'default': default,
+                'description': spec.get('description', ''),
+                'required': bool(spec.get('required', False))
+            }
+        else:
+            specs[name] = {'type': _infer_type(spec), 'default': spec, 'description': '', 'required': False}
+    return specs
+
+
+def _convert(name, param_type, value):
+    """将参数值转换为定义的类型，表单提交的字符串也可以转换"""
+    try:
+        if param_type == 'bool':
+            if isinstance(value, bool):
+                return value
+            text = str(value).strip().lower()
+            if text in _TRUE_VALUES:
+                return True
+            if text in _FALSE_VALUES:
+                return False
+            raise ValueError
+        if param_type == 'int':
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                raise ValueError
+            return int(value)
+        if param_type == 'float':
+            if isinstance(value, bool):
+                raise ValueError
+            return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'参数{name}的值无效，应为{param_type}类型: {value}')
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def resolve_parameters(parameters, values):
+    """校验本次运行的参数值，未提供的参数使用默认值
+
+    Args:
+        parameters: config.json中的parameters字段
+        values: 本次运行提供的参数值，None表示全部使用默认值
+
+    Returns:
+        dict: 参数名 -> 转换后的值（没有默认值且未提供的参数不包含在内）
+
+    Raises:
+        ValueError: 参数未定义、类型不符或缺少必填参数
+    """
+    specs = parameter_specs(parameters)
+    values = values or {}
+    unknown = [name for name in values if name not in specs]
+    if unknown:
+        raise ValueError(f"未定义的参数: {', '.join(unknown)}")
+
+    resolved = {}
+    for name, spec in specs.items():
+        value = values.get(name)
+        if value is None or (value == '' and spec['type'] != 'string'):
+            value = spec['default']
+        if value is None:
+            if spec['required']:
+                raise ValueError(f'缺少必填参数: {name}')
+            continue
+        resolved[name] = _convert(name, spec['type'], value)
+    return resolved
+
+
+def validate_shard_count(shards):
+    """校验分片数，返回整数
+
+    Raises:
+        ValueError: 分片数不是1到MAX_SHARDS之间的整数
+    """
+    try:
+        count = int(shards)
+    except (TypeError, ValueError):
+        raise ValueError(f'分片数无效: {shards}')
+    if not 1 <= count <= MAX_SHARDS:
+        raise ValueError(f'分片数应在1到{MAX_SHARDS}之间')
+    return count
+
+
+def run_environment(params=None, shard_index=None, shard_count=None):
+    """生成传给爬虫进程的环境变量
+
+    CRAWLER_PARAMS为全部参数的JSON，每个参数另有CRAWLER_PARAM_<参数名大写>；
+    分片运行时通过CRAWLER_SHARD_INDEX（从0开始）和CRAWLER_SHARD_COUNT告知当前分片。
+    """
+    env = {'CRAWLER_PARAMS': json.dumps(params or {}, ensure_ascii=False)}
+    for name, value in (params or {}).items():
+        key = 'CRAWLER_PARAM_' + re.sub(r'[^0-9A-Za-z]', '_', name).upper()
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        env[key] = str(value)
+    env['CRAWLER_SHARD_INDEX'] = str(shard_index or 0)
+    env['CRAWLER_SHARD_COUNT'] = str(shard_count or 1)
+    return env
@@ -0,0 +1,43 @@
+"""爬虫进度标记的解析
+
+爬虫（通常通过sdk/crawler_sdk.py）向标准输出打印以PROGRESS_PREFIX开头的一行，
+内容为各进度计数的累计值的JSON，如 ##crawler-progress {"rows_written":1500,"pages":30}。
+管理系统和工作节点采集输出时识别这些行，不写入运行日志，计数保存在运行记录中。
+"""
+import json
+import re
+
+PROGRESS_PREFIX = '##crawler-progress '
+PROGRESS_PREFIX_BYTES = PROGRESS_PREFIX.encode('ascii')
+
+# 单次运行最多保存的计数个数
+MAX_COUNTERS = 32
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+
+
+def parse_progress_line(line):
+    """解析一行输出中的进度标记
+
+    Args:
+        line: 输出的一行（bytes或str）
+
+    Returns:
+        dict: 计数名 -> 累计值；不是进度标记或格式无效时返回None（按普通日志处理）
+    """
+    if isinstance(line, bytes):
+        if not line.startswith(PROGRESS_PREFIX_BYTES):
+            return None
+        line = line.decode('utf-8', errors='replace')
+    elif not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        counters = json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+    if not isinstance(counters, dict) or len(counters) > MAX_COUNTERS:
+        return None
+    for name, value in counters.items():
+        if not _NAME_PATTERN.match(name) or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+    return counters
@@ -0,0 +1,66 @@
+import bisect
+import itertools
+import threading
+
+# 运行类型的优先级，数值越小越优先
+RUN_PRIORITIES = {
+    'manual': 0,
+    'scheduled': 1
+}
+
+
+class RunQueue:
+    """等待执行的运行队列
+
+    手动运行优先于定时运行，同一优先级按入队顺序出队。
+    队列中的运行可能因并发限制暂时不能启动，因此出队时按优先级顺序
+    找到第一个满足条件的运行，而不是只看队首。
+    """
+
+    def __init__(self):
+        self._items = []  # 按(优先级, 入队序号)排序
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def push(self, run):
+        """加入队列
+
+        Args:
+            run: 运行信息字典，至少包含run_id和run_type
+        """
+        priority = RUN_PRIORITIES.get(run.get('run_type'), len(RUN_PRIORITIES))
+        with self._lock:
+            bisect.insort(self._items, (priority, next(self._seq), run['run_id'], run))
+
+    def pop_startable(self, can_start):
+        """按优先级顺序取出第一个可以启动的运行
+
+        Args:
+            can_start: 判断运行能否启动的函数can_start(run)
+
+        Returns:
+            dict: 运行信息，没有可启动的运行时返回None
+        """
+        with self._lock:
+            for index, item in enumerate(self._items):
+                if can_start(item[3]):
+                    del self._items[index]
+                    return item[3]
+        return None
+
+    def remove(self, run_id):
+        """从队列中移除运行，返回被移除的运行信息"""
+        with self._lock:
+            for index, item in enumerate(self._items):
+                if item[2] == run_id:
+                    del self._items[index]
+                    return item[3]
+        return None
+
+    def runs(self):
+        """按出队顺序返回队列中的运行"""
+        with self._lock:
+            return [item[3] for item in self._items]
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,86 @@
+import datetime
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# 支持的调度类型
+SCHEDULE_TYPES = ('daily', 'interval', 'cron')
+
+
+class OffsetTrigger(BaseTrigger):
+    """在另一个触发器的触发时间上加固定偏移和随机抖动
+
+    偏移用于把同一时间触发的多个任务错开到一个时间窗口内，
+    抖动在每次触发时随机推迟0到jitter秒，进一步打散同一时刻的启动。
+    下一次触发时间总是根据上一次未加抖动的触发时间计算，抖动不会累积。
+    """
+
+    def __init__(self, trigger, offset=0, jitter=None):
+        """
+        Args:
+            trigger: 基础触发器
+            offset: 固定偏移(秒)
+            jitter: 最大随机抖动(秒)，None或0表示不抖动
+        """
+        self.trigger = trigger
+        self.offset = offset
+        self.jitter = jitter or None
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        delta = datetime.timedelta(seconds=self.offset)
+        if previous_fire_time is not None:
+            # 上一次的触发时间可能加了抖动，从其之后查找下一个基础触发时间
+            base_now = previous_fire_time - delta + datetime.timedelta(microseconds=1)
+        else:
+            base_now = now - delta
+        next_fire_time = self.trigger.get_next_fire_time(None, base_now)
+        if next_fire_time is None:
+            return None
+        return self._apply_jitter(next_fire_time + delta, self.jitter, now)
+
+    def __str__(self):
+        return f'{self.trigger} offset={self.offset}s jitter={self.jitter}s'
+
+    def __repr__(self):
+        return f'<OffsetTrigger ({self.trigger!r}, offset={self.offset}, jitter={self.jitter})>'
+
+
+def build_trigger(schedule_type, time_value, timezone, offset=0, jitter=None):
+    """根据定时任务配置创建触发器
+
+    Args:
+        schedule_type: 'daily'每天定时(HH:MM)，'interval'间隔执行(小时数)，'cron'标准crontab表达式(5个字段)
+        time_value: 时间设置
+        timezone: 时区
+        offset: 固定偏移(秒)
+        jitter: 最大随机抖动(秒)
+
+    Raises:
+        ValueError: 调度类型或时间设置无效
+    """
+    if schedule_type == 'daily':
+        hour, minute = map(int, time_value.split(':'))
+        trigger = CronTrigger(hour=hour, minute=minute, timezone=timezone)
+    elif schedule_type == 'interval':
+        hours = float(time_value)
+        if hours <= 0:
+            raise ValueError('间隔时间必须大于0')
+        trigger = IntervalTrigger(hours=hours, timezone=timezone)
+    elif schedule_type == 'cron':
+        trigger = CronTrigger.from_crontab(time_value.strip(), timezone=timezone)
+    else:
+        raise ValueError(f'不支持的调度类型: {schedule_type}')
+
+    if not offset and not jitter:
+        return trigger
+    return OffsetTrigger(trigger, offset, jitter)
+
+
+def next_fire_times(trigger, first_fire_time, count=3):
+    """从first_fire_time开始列出之后的count个触发时间（抖动是随机的，之后的时间只是估计）"""
+    fire_times = []
+    fire_time = first_fire_time
+    while fire_time is not None and len(fire_times) < count:
+        fire_times.append(fire_time)
+        fire_time = trigger.get_next_fire_time(fire_time, fire_time)
+    return fire_times
@@ -0,0 +1,94 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import uuid
+from database.models import heartbeat_scheduler, release_scheduler
+
+
+def new_worker_id():
+    """生成当前进程的唯一ID（主机名:进程号:随机后缀）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SchedulerLeader:
+    """在多个进程中选出唯一的调度进程
+
+    每个进程定时在数据库中记录心跳并尝试续期调度租约，同一时间只有一个进程持有租约。
+    持有租约的进程超过lease秒没有续期（进程退出或卡死）时，其他进程在下一次心跳时接管。
+    """
+
+    def __init__(self, app, worker_id, on_elected, on_demoted, on_heartbeat=None, on_beat=None, interval=5, lease=15):
+        """
+        Args:
+            app: Flask应用实例
+            worker_id: 当前进程ID
+            on_elected: 成为调度进程时调用
+            on_demoted: 失去调度租约时调用
+            on_heartbeat: 作为调度进程每次续期后调用
+            on_beat: 每次心跳后调用（不论是否为调度进程）
+            interval: 心跳间隔(秒)
+            lease: 租约有效期(秒)，应为心跳间隔的数倍
+        """
+        self.app = app
+        self.worker_id = worker_id
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.on_heartbeat = on_heartbeat
+        self.on_beat = on_beat
+        self.interval = interval
+        self.lease = lease
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='scheduler-leader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """停止心跳并释放租约"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            with self.app.app_context():
+                release_scheduler(self.worker_id)
+        except Exception as e:
+            logging.error(f"释放调度租约失败: {str(e)}")
+
+    def _run(self):
+        # 启动后立即尝试获取租约
+        while not self._stop.is_set():
+            self._beat()
+            self._stop.wait(self.interval)
+
+    def _beat(self):
+        try:
+            with self.app.app_context():
+                leader = heartbeat_scheduler(self.worker_id, self.lease)
+        except Exception as e:
+            # 无法确认租约时按失去租约处理，避免两个进程同时调度
+            logging.error(f"调度租约续期失败: {str(e)}")
+            leader = False
+
+        try:
+            if leader and not self.is_leader:
+                self.is_leader = True
+                logging.info(f"当前进程成为调度进程: {self.worker_id}")
+                self.on_elected()
+            elif not leader and self.is_leader:
+                self.is_leader = False
+                logging.warning(f"当前进程失去调度租约: {self.worker_id}")
+                self.on_demoted()
+            if leader and self.on_heartbeat is not None:
+                self.on_heartbeat()
+        except Exception as e:
+            logging.error(f"调度进程切换失败: {str(e)}")
+
+        if self.on_beat is not None:
+            try:
+                self.on_beat()
+            except Exception as e:
+                logging.error(f"心跳回调失败: {str(e)}")
@@ -0,0 +1,227 @@
+"""爬虫脚本使用的SDK
+
+爬虫管理系统启动爬虫时会把本目录加入爬虫进程的模块搜索路径，爬虫中可以直接 import crawler_sdk。
+只依赖标准库。
+
+    from crawler_sdk import BatchWriter, report_progress
+
+    with BatchWriter('crawler_data.db', 'crawler_data', ['title', 'url', 'content']) as writer:
+        for item in items:
+            writer.add((item.title, item.url, item.content))
+            report_progress(pages=1)
+
+BatchWriter把多行数据攒成一批，在一个事务中用executemany写入，攒够batch_size行或距上次写入超过
+flush_interval秒时写入一次，退出with块、调用close()或进程正常退出时写入剩余的数据。
+数据库被锁定等暂时性错误时这一批数据留在缓冲区，之后与新数据一起再次写入，缓冲区最多保留
+max_buffered行，满了之后add()在写入成功前拒绝新的行（抛出异常，该行没有加入缓冲区）。
+其他错误（违反约束、列不存在、类型不支持等）时改为逐行写入，只丢弃出错的行，
+出错的行打印到标准错误并计入rows_failed，其余的行照常写入。
+每次写入后向标准输出打印一行进度标记，管理系统从中读取写入的行数等计数并保存在运行记录中，
+这一行不会出现在运行日志里。
+"""
+import atexit
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+# 进度标记行的前缀（与管理系统run_progress.PROGRESS_PREFIX一致）
+PROGRESS_PREFIX = '##crawler-progress '
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 2.0
+# 写入暂时失败时缓冲区最多保留的批数
+DEFAULT_MAX_BUFFERED_BATCHES = 20
+
+# 本进程累计的进度计数
+_progress = {}
+_progress_lock = threading.Lock()
+
+
+def report_progress(**counters):
+    """累加进度计数并输出进度标记
+
+    计数名只能包含字母、数字和下划线，值为数字，如report_progress(pages=1, items=20)。
+    管理系统保存每个计数的累计值，rows_written由BatchWriter自动累加。
+    """
+    with _progress_lock:
+        for name, value in counters.items():
+            _progress[name] = _progress.get(name, 0) + value
+        line = PROGRESS_PREFIX + json.dumps(_progress, separators=(',', ':')) + '\n'
+    try:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    except (OSError, ValueError):
+        # 标准输出已关闭
+        pass
+
+
+def connect(db_path, timeout=30):
+    """打开爬虫数据库，使用WAL模式，写入时不阻塞管理系统Web界面的读取"""
+    conn = sqlite3.connect(db_path, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _is_transient(error):
+    """数据库被锁定或繁忙，稍后重试可以成功"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+class BatchWriter:
+    """批量写入一张表"""
+
+    def __init__(self, db_path, table, columns, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, on_conflict=None, max_buffered=None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            table: 表名
+            columns: 写入的列名列表
+            batch_size: 攒够多少行写入一次
+            flush_interval: 缓冲的数据最多等待多少秒后写入
+            on_conflict: 冲突时的处理方式，如'IGNORE'、'REPLACE'，默认报错
+            max_buffered: 写入暂时失败时缓冲区最多保留的行数，默认为batch_size的20倍
+        """
+        self.table = table
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered or batch_size * DEFAULT_MAX_BUFFERED_BATCHES
+        self.rows_written = 0
+        self.rows_failed = 0  # 因数据本身的错误被丢弃的行数
+        self._conn = connect(db_path)
+        self._rows = []
+        self._first_buffered = None  # 缓冲区中最早一行的加入时间
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        verb = f"INSERT OR {on_conflict.upper()}" if on_conflict else "INSERT"
+        column_list = ', '.join(f'"{column}"' for column in self.columns)
+        placeholders = ', '.join('?' * len(self.columns))
+        self._sql = f'{verb} INTO "{table}" ({column_list}) VALUES ({placeholders})'
+
+        # 爬虫长时间没有新数据时，由后台线程按时写入缓冲的数据
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def add(self, row):
+        """加入一行，row为与columns对应的元组或以列名为键的字典
+
+        只有这一行没有加入缓冲区时才抛出异常：已关闭，或缓冲区已满且写入仍然暂时失败。
+        """
+        if isinstance(row, dict):
+            row = tuple(row.get(column) for column in self.columns)
+        with self._lock:
+            if self._closed.is_set():
+                raise ValueError('BatchWriter已关闭')
+            if len(self._rows) >= self.max_buffered:
+                # 缓冲区已满，写入成功后才接受新的行
+                self._flush_locked()
+            self._rows.append(row)
+            if self._first_buffered is None:
+                self._first_buffered = time.monotonic()
+            if len(self._rows) >= self.batch_size:
+                self._try_flush_locked()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """立即写入缓冲的数据，暂时失败时抛出异常，数据仍留在缓冲区"""
+        with self._lock:
+            self._flush_locked()
+
+    def _try_flush_locked(self):
+        """写入缓冲的数据，暂时失败时只打印错误，数据留在缓冲区等下次写入"""
+        try:
+            self._flush_locked()
+        except sqlite3.Error as e:
+            print(f"写入数据失败，{len(self._rows)}行稍后重试: {self.table}, 错误: {str(e)}", file=sys.stderr, flush=True)
+
+    def _flush_locked(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        # 一批数据在一个事务中写入，出错时整批回滚
+        try:
+            with self._conn:
+                self._conn.executemany(self._sql, rows)
+        except sqlite3.Error as e:
+            if _is_transient(e):
+                # 整批留在缓冲区，下次写入时重试
+                raise
+            # 数据本身有错误，逐行写入找出出错的行
+            self._write_each_locked(rows)
+            return
+        self._rows = []
+        self._first_buffered = None
+        self._report(len(rows), 0)
+
+    def _write_each_locked(self, rows):
+        """逐行写入，丢弃出错的行；暂时失败时剩余的行留在缓冲区并抛出异常"""
+        written = failed = 0
+        try:
+            for index, row in enumerate(rows):
+                try:
+                    with self._conn:
+                        self._conn.execute(self._sql, row)
+                except sqlite3.Error as e:
+                    if _is_transient(e):
+                        self._rows = rows[index:]
+                        raise
+                    failed += 1
+                    print(f"写入数据失败，已丢弃: {self.table}, 行: {row!r}, 错误: {str(e)}", file=sys.stderr, flush=True)
+                else:
+                    written += 1
+            self._rows = []
+            self._first_buffered = None
+        finally:
+            self._report(written, failed)
+
+    def _report(self, written, failed):
+        """累计写入和丢弃的行数并上报进度"""
+        self.rows_written += written
+        self.rows_failed += failed
+        counters = {}
+        if written:
+            counters['rows_written'] = written
+        if failed:
+            counters['rows_failed'] = failed
+        if counters:
+            report_progress(**counters)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self.flush_interval, 1.0)):
+            with self._lock:
+                if self._first_buffered is not None and time.monotonic() - self._first_buffered >= self.flush_interval:
+                    self._try_flush_locked()
+
+    def close(self):
+        """写入剩余的数据并关闭数据库连接，可以重复调用
+
+        剩余的数据仍然暂时无法写入时打印丢失的行数并抛出异常。
+        """
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            try:
+                self._flush_locked()
+            except sqlite3.Error:
+                print(f"关闭时仍无法写入，丢失{len(self._rows)}行: {self.table}", file=sys.stderr, flush=True)
+                raise
+            finally:
+                self._conn.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,295 @@
+"""预热的爬虫启动进程（zygote）
+
+zygote进程启动时预先导入配置的模块（如lxml、requests、pandas），之后每次运行爬虫时
+由zygote fork出子进程，通过runpy执行main.py。子进程继承已导入的模块，省去解释器启动和
+重复导入的时间。
+
+管理进程与zygote之间通过UNIX套接字通信，标准输出和标准错误管道的文件描述符随请求一起传给zygote，
+子进程的输出和subprocess方式一样由管理进程读取。子进程由zygote回收，退出码通过套接字返回。
+
+本文件也是zygote进程的入口：python zygote.py <套接字fd> [预导入模块...]
+"""
+import importlib
+import itertools
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+from process_control import set_limits
+
+# 单个消息的最大长度（请求中包含完整的环境变量）
+MAX_MESSAGE = 1024 * 1024
+# zygote有子进程运行时检查子进程退出的间隔(秒)
+REAP_INTERVAL = 0.1
+
+# 需要fork和通过套接字传递文件描述符（Python 3.9+）
+SUPPORTED = hasattr(os, 'fork') and hasattr(socket, 'send_fds')
+
+
+def _send(sock, message):
+    sock.send(json.dumps(message).encode('utf-8'))
+
+
+def _run_child(request, fds):
+    """在fork出的子进程中执行爬虫脚本，不会返回"""
+    code = 1
+    try:
+        # 与subprocess方式一样在独立的会话中运行，结束运行时可以向整个进程组发送信号
+        os.setsid()
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        for fd in fds:
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        script = request['script']
+        sys.argv = [script]
+        sys.path[0] = os.path.dirname(script)
+        # fork出的解释器不会重新读取PYTHONPATH，按子进程的环境变量补充模块搜索路径
+        extra_paths = [path for path in request['env'].get('PYTHONPATH', '').split(os.pathsep)
+                       if path and path not in sys.path]
+        sys.path[1:1] = extra_paths
+        # 与subprocess方式的preexec_fn一样，在执行爬虫代码之前设置资源限制
+        set_limits(request.get('rlimits') or ())
+
+        import runpy
+        try:
+            runpy.run_path(script, run_name='__main__')
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            # os._exit不会执行atexit注册的函数（如爬虫SDK写入剩余数据），这里按正常退出的顺序执行
+            import atexit
+            atexit._run_exitfuncs()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(sock_fd, modules):
+    """zygote进程主循环"""
+    sock = socket.socket(fileno=sock_fd)
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"zygote预导入模块失败: {module}, 错误: {str(e)}", file=sys.stderr)
+
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    children = set()
+    while True:
+        if selector.select(REAP_INTERVAL if children else None):
+            data, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE, 2)
+            if not data:
+                # 管理进程已退出，已启动的子进程继续运行
+                break
+            request = json.loads(data)
+            try:
+                pid = os.fork()
+            except OSError as e:
+                for fd in fds:
+                    os.close(fd)
+                _send(sock, {'id': request['id'], 'error': str(e)})
+                continue
+            if pid == 0:
+                sock.close()
+                _run_child(request, fds)
+            for fd in fds:
+                os.close(fd)
+            children.add(pid)
+            _send(sock, {'id': request['id'], 'pid': pid})
+
+        # 回收已退出的子进程
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            children.discard(pid)
+            _send(sock, {'exit': pid, 'returncode': os.waitstatus_to_exitcode(status)})
+
+
+class ZygoteProcess:
+    """由zygote启动的爬虫进程，提供与subprocess.Popen相同的常用接口"""
+
+    def __init__(self, zygote, pid, stdout, stderr):
+        self.zygote = zygote
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            self.returncode = self.zygote._poll(self.pid)
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            self.returncode = self.zygote._wait(self.pid, timeout)
+            if self.returncode is None:
+                raise subprocess.TimeoutExpired([self.pid], timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote:
+    """管理一个zygote进程，并通过它启动爬虫"""
+
+    def __init__(self, preload_modules=()):
+        """
+        Args:
+            preload_modules: zygote启动时预导入的模块名
+        """
+        self.preload_modules = tuple(preload_modules)
+        self._sock, child_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), str(child_sock.fileno()), *self.preload_modules],
+                pass_fds=[child_sock.fileno()],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                env=os.environ.copy()
+            )
+        finally:
+            child_sock.close()
+        self.alive = True
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._replies = {}
+        self._returncodes = {}  # pid -> 退出码，运行中为None
+        self._reader = threading.Thread(target=self._read_replies, name='zygote-reader', daemon=True)
+        self._reader.start()
+
+    def launch(self, script, cwd, env, timeout=10, rlimits=()):
+        """启动爬虫脚本
+
+        Args:
+            script: 脚本路径
+            cwd: 工作目录
+            env: 环境变量
+            timeout: 等待zygote回复的最长时间(秒)
+            rlimits: 子进程执行脚本之前设置的资源限制（process_control.prepare_limits的返回值）
+
+        Returns:
+            ZygoteProcess: 标准输出和标准错误为管道的进程对象
+        """
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        try:
+            with self._condition:
+                request_id = next(self._request_ids)
+            request = {'id': request_id, 'script': script, 'cwd': cwd, 'env': dict(env), 'rlimits': list(rlimits)}
+            with self._send_lock:
+                socket.send_fds(self._sock, [json.dumps(request).encode('utf-8')], [stdout_write, stderr_write])
+        except BaseException:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+
+        with self._condition:
+            self._condition.wait_for(lambda: request_id in self._replies or not self.alive, timeout)
+            reply = self._replies.pop(request_id, None)
+        if reply is None or 'pid' not in reply:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            error = reply.get('error') if reply else 'zygote未响应'
+            raise RuntimeError(f"zygote启动爬虫失败: {error}")
+        return ZygoteProcess(self, reply['pid'], open(stdout_read, 'rb'), open(stderr_read, 'rb'))
+
+    def close(self):
+        """关闭与zygote的连接，zygote随之退出（已启动的爬虫继续运行）"""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _read_replies(self):
+        while True:
+            try:
+                data = self._sock.recv(MAX_MESSAGE)
+            except OSError:
+                data = b''
+            if not data:
+                break
+            message = json.loads(data)
+            with self._condition:
+                if 'exit' in message:
+                    self._returncodes[message['exit']] = message['returncode']
+                else:
+                    if 'pid' in message:
+                        self._returncodes[message['pid']] = None
+                    self._replies[message['id']] = message
+                self._condition.notify_all()
+
+        with self._condition:
+            self.alive = False
+            self._condition.notify_all()
+        self._sock.close()
+        try:
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        logging.warning(f"zygote进程已退出: {self.preload_modules}")
+
+    def _poll(self, pid):
+        with self._condition:
+            returncode = self._returncodes.get(pid)
+            if returncode is not None:
+                del self._returncodes[pid]
+                return returncode
+            if self.alive:
+                return None
+        # zygote已退出，无法再得到退出码，只能判断进程是否还存在
+        try:
+            os.kill(pid, 0)
+            return None
+        except ProcessLookupError:
+            return -1
+        except PermissionError:
+            return None
+
+    def _wait(self, pid, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._returncodes.get(pid) is not None or not self.alive, timeout)
+        return self._poll(pid)
+
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]), sys.argv[2:])